@@ -0,0 +1,332 @@
+"""
+End-to-end collector and ingest throughput against the local fake CLOB/Gamma
+server (benchmarks/fakeserver.py), with no live APIs involved.
+
+    python benchmarks/e2e.py --markets 200 --sweeps 20 --out bench.json
+    python benchmarks/e2e.py --baseline bench.json        # exit 1 on regressions
+
+Always runs the embedded SQLite backend. Adds Postgres when DATABASE_DSN_PG is
+set; it then works in a scratch schema (pm_bench_e2e, dropped afterwards), so
+the real tables are untouched.
+
+For each configuration this reports:
+- collector: sweeps/sec, snapshots/sec, p50/p99 sweep time, DB rows/sec
+  (rows / time inside write_snapshots);
+- ingest: markets/sec and DB rows/sec.
+The output is one JSON document.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from fakeserver import BASE_MARKET_ID, FakeServer
+
+from pm.clob.client import ClobClient
+from pm.gamma.client import GammaClient
+from pm.jobs.collect_orderbooks import SweepStats, collect_orderbooks_loop
+from pm.jobs.ingest_markets import ingest_markets, ingest_markets_concurrent
+from pm.storage.base import StorageBackend
+from pm.storage.sqlite import SQLiteBackend
+
+SCHEMA = "pm_bench_e2e"
+MIGRATIONS = Path(__file__).resolve().parents[1] / "src" / "pm" / "db" / "migrations"
+
+COLLECT_CONFIGS: List[Dict[str, Any]] = [
+    {"name": "batch50", "batch": 50},
+    {"name": "batch200", "batch": 200},
+    {"name": "batch50_latency5ms", "batch": 50, "latency_ms": 5.0, "jitter_ms": 2.0},
+    {"name": "batch50_errors1pct", "batch": 50, "error_rate": 0.01},
+    {"name": "batch50_depth50", "batch": 50, "depth": 50},
+]
+
+INGEST_CONFIGS: List[Dict[str, Any]] = [
+    {"name": "paged", "limit": 500},
+    {"name": "concurrent4", "limit": 500, "workers": 4},
+    {"name": "concurrent4_bulk", "limit": 500, "workers": 4, "bulk": True, "postgres_only": True},
+]
+
+# Higher is better for all of these; --baseline compares them.
+TRACKED = ("sweeps_per_sec", "snapshots_per_sec", "db_rows_per_sec", "markets_per_sec")
+
+
+class _TimedBackend(StorageBackend):
+    """Delegates to a backend and accumulates the time spent in write_snapshots."""
+
+    def __init__(self, inner: StorageBackend):
+        self.inner = inner
+        self.name = inner.name
+        self.write_seconds = 0.0
+        self.rows = 0
+
+    def __getattr__(self, attr):
+        return getattr(self.inner, attr)
+
+    @property
+    def export_dsn(self):
+        return self.inner.export_dsn
+
+    def migrate(self):
+        return self.inner.migrate()
+
+    def upsert_markets(self, markets):
+        return self.inner.upsert_markets(markets)
+
+    def track_markets(self, market_ids, session):
+        return self.inner.track_markets(market_ids, session)
+
+    def load_universe(self, since):
+        return self.inner.load_universe(since)
+
+    def flag_ended(self, market_ids, ts):
+        return self.inner.flag_ended(market_ids, ts)
+
+    def upsert_latest(self, items):
+        return self.inner.upsert_latest(items)
+
+    def notify_sweep(self, sweep, ts, token_ids):
+        return self.inner.notify_sweep(sweep, ts, token_ids)
+
+    def write_snapshots(self, items):
+        t0 = time.perf_counter()
+        n = self.inner.write_snapshots(items)
+        self.write_seconds += time.perf_counter() - t0
+        self.rows += n
+        return n
+
+
+def _pct(xs: List[float], q: float) -> float:
+    s = sorted(xs)
+    return s[min(len(s) - 1, int(round(q * (len(s) - 1))))] if s else 0.0
+
+
+# -----------------------
+# Stores
+# -----------------------
+@contextlib.contextmanager
+def _store(kind: str, dsn: Optional[str]) -> Iterator[Dict[str, Any]]:
+    """Fresh, migrated store: {"backend": StorageBackend, "db": DB or None}."""
+    if kind == "sqlite":
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = SQLiteBackend(os.path.join(tmp, "bench.sqlite"))
+            backend.migrate()
+            try:
+                yield {"backend": backend, "db": None}
+            finally:
+                backend.close()
+        return
+
+    from psycopg.conninfo import make_conninfo
+
+    from pm.db import DB, run_migrations
+    from pm.storage.postgres import PostgresBackend
+
+    admin = DB(dsn, statement_timeout_ms=0).open()
+    with admin.connection() as conn:
+        conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.execute(f"CREATE SCHEMA {SCHEMA}")
+        conn.commit()
+    db = DB(make_conninfo(dsn, options=f"-c search_path={SCHEMA}"), statement_timeout_ms=0).open()
+    try:
+        run_migrations(db, MIGRATIONS)
+        yield {"backend": PostgresBackend(db), "db": db}
+    finally:
+        db.close()
+        with admin.connection() as conn:
+            conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            conn.commit()
+        admin.close()
+
+
+def _seed(store: Dict[str, Any], srv: FakeServer, markets: int) -> None:
+    backend: StorageBackend = store["backend"]
+    backend.upsert_markets([srv.market(i) for i in range(markets)])
+    backend.track_markets([BASE_MARKET_ID + i for i in range(markets)], "bench")
+
+
+# -----------------------
+# Runs
+# -----------------------
+def run_collect(kind: str, dsn: Optional[str], cfg: Dict[str, Any], markets: int, sweeps: int) -> Dict[str, Any]:
+    srv = FakeServer(
+        markets=markets,
+        depth=cfg.get("depth", 10),
+        latency_ms=cfg.get("latency_ms", 0.0),
+        jitter_ms=cfg.get("jitter_ms", 0.0),
+        error_rate=cfg.get("error_rate", 0.0),
+    ).start()
+    try:
+        with _store(kind, dsn) as store:
+            _seed(store, srv, markets)
+            backend = _TimedBackend(store["backend"])
+            # Short backoff: measure the retry path, not the production sleep.
+            clob = ClobClient(srv.url, retries=3, backoff_s=0.005)
+            stats: List[SweepStats] = []
+            t0 = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                collect_orderbooks_loop(
+                    backend=backend,
+                    clob=clob,
+                    batch_size=cfg["batch"],
+                    top_n=10,
+                    loop_seconds=0,
+                    per_batch_sleep=0,
+                    iterations=sweeps,
+                    notify=False,
+                    on_sweep=stats.append,
+                )
+            wall = time.perf_counter() - t0
+    finally:
+        srv.stop()
+
+    secs = [s.seconds for s in stats]
+    inserted = sum(s.inserted for s in stats)
+    return {
+        "kind": "collect",
+        "name": cfg["name"],
+        "backend": kind,
+        "config": {k: v for k, v in cfg.items() if k != "name"},
+        "tokens": 2 * markets,
+        "sweeps": len(stats),
+        "seconds": round(wall, 3),
+        "sweeps_per_sec": round(len(stats) / sum(secs), 3) if secs else 0.0,
+        "snapshots_per_sec": round(inserted / sum(secs)) if secs else 0,
+        "sweep_p50_ms": round(_pct(secs, 0.50) * 1000, 2),
+        "sweep_p99_ms": round(_pct(secs, 0.99) * 1000, 2),
+        "db_rows_per_sec": round(backend.rows / backend.write_seconds) if backend.write_seconds else 0,
+        "errors": sum(s.errored for s in stats),
+        "retries": clob.retried,
+    }
+
+
+def run_ingest(kind: str, dsn: Optional[str], cfg: Dict[str, Any], markets: int) -> Dict[str, Any]:
+    srv = FakeServer(markets=markets).start()
+    try:
+        with _store(kind, dsn) as store:
+            gamma = GammaClient(srv.url, backoff_s=0.005)
+            limit = cfg["limit"]
+            t0 = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                if cfg.get("workers"):
+                    st = ingest_markets_concurrent(
+                        db=store["db"], gamma=gamma, limit=limit, workers=cfg["workers"], bulk=bool(cfg.get("bulk"))
+                    )
+                    upserted = st.upserted
+                elif store["db"] is not None:
+                    upserted = ingest_markets(db=store["db"], gamma=gamma, limit=limit, pages=markets // limit + 1)
+                else:
+                    upserted = ingest_markets(backend=store["backend"], gamma=gamma, limit=limit, pages=markets // limit + 1)
+            wall = time.perf_counter() - t0
+    finally:
+        srv.stop()
+    return {
+        "kind": "ingest",
+        "name": cfg["name"],
+        "backend": kind,
+        "config": {k: v for k, v in cfg.items() if k not in ("name", "postgres_only")},
+        "markets": markets,
+        "seconds": round(wall, 3),
+        "markets_per_sec": round(markets / wall) if wall else 0,
+        "db_rows_per_sec": round(upserted / wall) if wall else 0,
+    }
+
+
+# -----------------------
+# Report
+# -----------------------
+def _git_rev() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent, capture_output=True, text=True, check=True
+        )
+        return out.stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Human-readable lines for every tracked metric that fell more than `tolerance` below baseline."""
+    key: Callable[[Dict[str, Any]], tuple] = lambda r: (r["kind"], r["name"], r["backend"])
+    old = {key(r): r for r in baseline.get("results", [])}
+    out = []
+    for r in current["results"]:
+        b = old.get(key(r))
+        if b is None:
+            continue
+        for m in TRACKED:
+            if m in r and b.get(m):
+                ratio = r[m] / b[m]
+                if ratio < 1 - tolerance:
+                    out.append(f"{'/'.join(key(r))} {m}: {b[m]} -> {r[m]} ({ratio:.2f}x)")
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--markets", type=int, default=200, help="Tracked markets (2 tokens each)")
+    ap.add_argument("--sweeps", type=int, default=20)
+    ap.add_argument("--ingest-markets", type=int, default=5000)
+    ap.add_argument("--backend", choices=["all", "sqlite", "postgres"], default="all")
+    ap.add_argument("--only", choices=["all", "collect", "ingest"], default="all")
+    ap.add_argument("--out", type=str, default=None, help="Write the JSON report here (default stdout)")
+    ap.add_argument("--baseline", type=str, default=None, help="Previous report; exit 1 if a metric regressed")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="Allowed drop vs baseline (fraction)")
+    args = ap.parse_args()
+
+    dsn = os.getenv("DATABASE_DSN_PG", "").strip() or None
+    kinds = [k for k in ("sqlite", "postgres") if args.backend in ("all", k)]
+    if "postgres" in kinds and not dsn:
+        if args.backend == "postgres":
+            raise SystemExit("DATABASE_DSN_PG is required for --backend postgres")
+        kinds.remove("postgres")
+
+    results: List[Dict[str, Any]] = []
+    for kind in kinds:
+        if args.only in ("all", "collect"):
+            for cfg in COLLECT_CONFIGS:
+                results.append(run_collect(kind, dsn, cfg, args.markets, args.sweeps))
+                print(f"[bench] collect {kind}/{cfg['name']} done", file=sys.stderr)
+        if args.only in ("all", "ingest"):
+            for cfg in INGEST_CONFIGS:
+                if kind != "postgres" and (cfg.get("postgres_only") or cfg.get("workers")):
+                    continue
+                results.append(run_ingest(kind, dsn, cfg, args.ingest_markets))
+                print(f"[bench] ingest {kind}/{cfg['name']} done", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+    if args.baseline:
+        regressions = compare(report, json.loads(Path(args.baseline).read_text(encoding="utf-8")), args.tolerance)
+        for line in regressions:
+            print(f"[bench] REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Local stand-in for the CLOB and Gamma APIs, for benchmarks.
+
+    GET  /book?token_id=T             one synthetic book
+    GET  /books?token_ids=T1,T2       list of books
+    POST /books  [{"token_id": T}]    list of books (CLOB batch shape)
+    GET  /markets?limit=&offset=      Gamma listing of `markets` synthetic markets
+    GET  /markets/{id}                one market
+
+Market i has id BASE_MARKET_ID + i and tokens "<id>1" / "<id>2". Books are a
+random walk per token with `depth` levels a side. `latency_ms` (+/- `jitter_ms`)
+is slept per request and `error_rate` of requests get a 500, so client retries
+and error paths are exercised.
+
+    python benchmarks/fakeserver.py --port 8900 --latency-ms 20
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+BASE_MARKET_ID = 8_000_000
+
+
+class FakeServer:
+    def __init__(
+        self,
+        *,
+        markets: int = 1000,
+        depth: int = 10,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 7,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.markets = markets
+        self.depth = depth
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._mids: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._end = (datetime.now(timezone.utc) + timedelta(days=30)).isoformat()
+        self._srv = ThreadingHTTPServer((host, port), self._handler())
+        self._srv.daemon_threads = True
+        self._t: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._srv.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeServer":
+        self._t = threading.Thread(target=self._srv.serve_forever, name="pm-fakeserver", daemon=True)
+        self._t.start()
+        return self
+
+    def stop(self) -> None:
+        self._srv.shutdown()
+        self._srv.server_close()
+
+    # -----------------------
+    # Payloads
+    # -----------------------
+    def token_ids(self, n_markets: int) -> List[str]:
+        return [f"{BASE_MARKET_ID + i}{k}" for i in range(n_markets) for k in (1, 2)]
+
+    def market(self, i: int) -> Dict[str, Any]:
+        mid = BASE_MARKET_ID + i
+        return {
+            "id": str(mid),
+            "slug": f"bench-market-{i}",
+            "question": f"Benchmark market {i}?",
+            "conditionId": f"0x{mid:064x}",
+            "endDate": self._end,
+            "active": True,
+            "closed": False,
+            "category": "bench",
+            "liquidityNum": 1000.0 + (i % 97) * 50,
+            "volumeNum": 5000.0 + (i % 89) * 100,
+            "clobTokenIds": json.dumps([f"{mid}1", f"{mid}2"]),
+            "outcomes": json.dumps(["Yes", "No"]),
+        }
+
+    def book(self, token_id: str) -> Dict[str, Any]:
+        with self._lock:
+            mid = self._mids.get(token_id, 0.5)
+            mid = min(0.95, max(0.05, mid + self._rng.gauss(0, 0.005)))
+            self._mids[token_id] = mid
+        tick = 0.01
+        bids = [{"price": f"{mid - tick * (k + 1):.2f}", "size": f"{50 + 10 * k:.1f}"} for k in range(self.depth)]
+        asks = [{"price": f"{mid + tick * (k + 1):.2f}", "size": f"{45 + 10 * k:.1f}"} for k in range(self.depth)]
+        return {
+            "market": "0x",
+            "asset_id": token_id,
+            "timestamp": str(int(time.time() * 1000)),
+            "bids": bids,
+            "asks": asks,
+            "tick_size": "0.01",
+        }
+
+    # -----------------------
+    # HTTP
+    # -----------------------
+    def _handler(self):
+        server = self
+
+        class _H(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as separate writes; with Nagle on, keep-alive
+            # clients stall ~40 ms per request on delayed ACKs.
+            disable_nagle_algorithm = True
+
+            def _send(self, code: int, payload: Any) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _delay_or_fail(self) -> bool:
+                with server._lock:
+                    server.requests += 1
+                    fail = server.error_rate > 0 and server._rng.random() < server.error_rate
+                    delay = server.latency_ms + (server._rng.uniform(-1, 1) * server.jitter_ms if server.jitter_ms else 0.0)
+                    if fail:
+                        server.errors += 1
+                if delay > 0:
+                    time.sleep(delay / 1000.0)
+                if fail:
+                    self._send(500, {"error": "injected"})
+                return fail
+
+            def do_GET(self):
+                u = urlparse(self.path)
+                q = parse_qs(u.query)
+                if self._delay_or_fail():
+                    return
+                if u.path == "/book":
+                    self._send(200, server.book(q.get("token_id", [""])[0]))
+                elif u.path == "/books":
+                    ids = [x for x in q.get("token_ids", [""])[0].split(",") if x]
+                    self._send(200, [server.book(t) for t in ids])
+                elif u.path == "/markets":
+                    limit = int(q.get("limit", ["100"])[0])
+                    offset = int(q.get("offset", ["0"])[0])
+                    hi = min(server.markets, offset + limit)
+                    self._send(200, [server.market(i) for i in range(offset, hi)])
+                elif u.path.startswith("/markets/"):
+                    i = int(u.path.rsplit("/", 1)[1]) - BASE_MARKET_ID
+                    if 0 <= i < server.markets:
+                        self._send(200, server.market(i))
+                    else:
+                        self._send(404, {"error": "not found"})
+                else:
+                    self._send(404, {"error": "not found"})
+
+            def do_POST(self):
+                u = urlparse(self.path)
+                n = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(n) or b"[]")
+                if self._delay_or_fail():
+                    return
+                if u.path == "/books":
+                    self._send(200, [server.book(str(x.get("token_id"))) for x in body if isinstance(x, dict)])
+                else:
+                    self._send(404, {"error": "not found"})
+
+            def log_message(self, *args):
+                pass
+
+        return _H
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8900)
+    ap.add_argument("--markets", type=int, default=1000)
+    ap.add_argument("--depth", type=int, default=10)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    args = ap.parse_args()
+
+    srv = FakeServer(
+        markets=args.markets,
+        depth=args.depth,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        port=args.port,
+    ).start()
+    print(f"fake CLOB/Gamma at {srv.url} (CLOB_BASE / GAMMA_BASE); Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Insert throughput and read latency for the index profiles on
+orderbook_snapshots / features_orderbook: the original 002 set (PK + three
+btrees each + GIN on extra_features_json) vs the write-optimized 009 set (PK +
+market btree + one time btree each: ts_utc on snapshots, (ts_utc, token_id) on
+features). brin_alternative swaps those time btrees for BRIN on ts_utc; it is
+not shipped, and is here to show what the btrees buy on the reads below.
+
+Reads cover a one-token export, a recent time window, an open-ended export
+partitioned by time (its bounds are MIN/MAX over both tables) and one page of
+feed catch-up.
+
+    python benchmarks/index_profile.py --tokens 500 --sweeps 200
+
+Uses DATABASE_DSN_PG. Each profile gets fresh copies of both tables in a
+scratch schema (pm_bench_idx, dropped afterwards) and is fed through the
+collector's own write path and read through the exporter's own queries.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from psycopg.conninfo import make_conninfo
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+
+from pm.clob.collect_books import Snapshot
+from pm.config import load_settings
+from pm.db import DB
+from pm.export.clean_export import ExportParams, export_frames
+from pm.export.partitioned import export_dataset_partitioned
+from pm.features.feed import CATCH_UP_SQL
+from pm.features.jobs import insert_snapshots_and_features
+
+SCHEMA = "pm_bench_idx"
+
+_TABLES = [
+    f"CREATE TABLE {SCHEMA}.orderbook_snapshots (LIKE public.orderbook_snapshots INCLUDING DEFAULTS)",
+    f"CREATE TABLE {SCHEMA}.features_orderbook (LIKE public.features_orderbook INCLUDING DEFAULTS)",
+    f"ALTER TABLE {SCHEMA}.orderbook_snapshots ADD PRIMARY KEY (token_id, ts_utc)",
+    f"ALTER TABLE {SCHEMA}.features_orderbook ADD PRIMARY KEY (token_id, ts_utc)",
+    f"ALTER TABLE {SCHEMA}.features_orderbook ADD FOREIGN KEY (token_id, ts_utc) "
+    f"REFERENCES {SCHEMA}.orderbook_snapshots (token_id, ts_utc) ON DELETE CASCADE",
+]
+
+PROFILES: Dict[str, List[str]] = {
+    "legacy_002": [
+        "CREATE INDEX ON {s}.orderbook_snapshots (market_id, ts_utc DESC)",
+        "CREATE INDEX ON {s}.orderbook_snapshots (token_id, ts_utc DESC)",
+        "CREATE INDEX ON {s}.orderbook_snapshots (ts_utc DESC)",
+        "CREATE INDEX ON {s}.features_orderbook (market_id, ts_utc DESC)",
+        "CREATE INDEX ON {s}.features_orderbook (token_id, ts_utc DESC)",
+        "CREATE INDEX ON {s}.features_orderbook (ts_utc DESC)",
+        "CREATE INDEX ON {s}.features_orderbook USING GIN (extra_features_json)",
+    ],
+    "write_optimized_009": [
+        "CREATE INDEX ON {s}.orderbook_snapshots (market_id, ts_utc DESC)",
+        "CREATE INDEX ON {s}.orderbook_snapshots (ts_utc DESC)",
+        "CREATE INDEX ON {s}.features_orderbook (market_id, ts_utc DESC)",
+        "CREATE INDEX ON {s}.features_orderbook (ts_utc, token_id)",
+    ],
+    "brin_alternative": [
+        "CREATE INDEX ON {s}.orderbook_snapshots (market_id, ts_utc DESC)",
+        "CREATE INDEX ON {s}.orderbook_snapshots USING BRIN (ts_utc) WITH (pages_per_range = 32)",
+        "CREATE INDEX ON {s}.features_orderbook (market_id, ts_utc DESC)",
+        "CREATE INDEX ON {s}.features_orderbook USING BRIN (ts_utc) WITH (pages_per_range = 32)",
+    ],
+}
+
+
+def _items(tokens: int, sweep: int, t0: datetime) -> List[Dict[str, Any]]:
+    ts = t0 + timedelta(seconds=2 * sweep)
+    out = []
+    for i in range(tokens):
+        bid = round(0.30 + ((i + sweep) % 40) / 100, 2)
+        bids = [[round(bid - k / 100, 2), 10.0 + k] for k in range(10)]
+        asks = [[round(bid + 0.02 + k / 100, 2), 8.0 + k] for k in range(10)]
+        snap = Snapshot(
+            token_id=f"bench-{i:05d}",
+            bids_top=bids,
+            asks_top=asks,
+            best_bid_price=bids[0][0],
+            best_bid_size=bids[0][1],
+            best_ask_price=asks[0][0],
+            best_ask_size=asks[0][1],
+            raw_book={"bids": bids, "asks": asks},
+        )
+        out.append({"market_id": None, "ts": ts, "snapshot": snap, "end_time": t0 + timedelta(days=1)})
+    return out
+
+
+def _setup(db: DB, profile: str) -> None:
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            cur.execute(f"CREATE SCHEMA {SCHEMA}")
+            for stmt in _TABLES + [x.format(s=SCHEMA) for x in PROFILES[profile]]:
+                cur.execute(stmt)
+        conn.commit()
+
+
+def _index_bytes(db: DB) -> Dict[str, int]:
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT c.relname, pg_indexes_size(c.oid) AS b FROM pg_class c "
+                "JOIN pg_namespace n ON n.oid = c.relnamespace WHERE n.nspname = %s AND c.relkind = 'r'",
+                (SCHEMA,),
+            )
+            return {r["relname"]: int(r["b"]) for r in cur.fetchall()}
+
+
+def _catch_up(db: DB, since: datetime, limit: int) -> None:
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(CATCH_UP_SQL, {"since": since, "limit": limit})
+            cur.fetchall()
+        conn.commit()
+
+
+def _partitioned(url: str, out_dir: str, workers: int) -> None:
+    params = ExportParams(
+        dsn=url,
+        out_clean=os.path.join(out_dir, "clean.csv"),
+        out_corrupted=os.path.join(out_dir, "corrupted.csv"),
+    )
+    export_dataset_partitioned(params, workers=workers, partition_by="time")
+
+
+def _timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return round(best, 4)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tokens", type=int, default=500)
+    ap.add_argument("--sweeps", type=int, default=200)
+    ap.add_argument("--batch", type=int, default=50)
+    ap.add_argument("--repeat", type=int, default=3, help="Export timings report the best of N runs")
+    ap.add_argument("--workers", type=int, default=2, help="Processes for the partitioned export")
+    args = ap.parse_args()
+
+    settings = load_settings()
+    dsn = make_conninfo(settings.database_dsn, options=f"-c search_path={SCHEMA},public")
+    admin = DB(settings.database_dsn, statement_timeout_ms=0).open()
+    db = DB(dsn, statement_timeout_ms=0).open()
+    engine = create_engine(
+        settings.database_dsn.replace("postgresql://", "postgresql+psycopg://", 1),
+        connect_args={"options": f"-c search_path={SCHEMA},public"},
+    )
+    # Partition workers open their own engines from the URL.
+    url = make_url(settings.database_dsn).update_query_dict({"options": f"-c search_path={SCHEMA},public"})
+    url_s = url.render_as_string(hide_password=False)
+    out_dir = tempfile.mkdtemp(prefix="pm-bench-idx-")
+
+    t0 = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    t_end = t0 + timedelta(seconds=2 * args.sweeps)
+    window = (t_end - timedelta(seconds=2 * max(1, args.sweeps // 10)), t_end)
+    results: Dict[str, Any] = {"tokens": args.tokens, "sweeps": args.sweeps, "batch": args.batch}
+    try:
+        for profile in PROFILES:
+            _setup(admin, profile)
+
+            elapsed = 0.0
+            rows = 0
+            for sweep in range(args.sweeps):
+                items = _items(args.tokens, sweep, t0)
+                start = time.perf_counter()
+                for i in range(0, len(items), args.batch):
+                    rows += insert_snapshots_and_features(db, items[i : i + args.batch])
+                elapsed += time.perf_counter() - start
+
+            with admin.connection() as conn:
+                conn.execute(f"ANALYZE {SCHEMA}.orderbook_snapshots")
+                conn.execute(f"ANALYZE {SCHEMA}.features_orderbook")
+                conn.commit()
+
+            exports = {
+                "one_token_all_time": ExportParams(dsn="", token_id="bench-00007"),
+                "all_tokens_last_10pct": ExportParams(dsn="", start_ts=window[0], end_ts=window[1]),
+            }
+            results[profile] = {
+                "rows": rows,
+                "insert_seconds": round(elapsed, 3),
+                "rows_per_sec": round(rows / elapsed) if elapsed > 0 else None,
+                "index_bytes": _index_bytes(admin),
+                "export_seconds": {
+                    **{name: _timed(lambda p=p: export_frames(engine, p), args.repeat) for name, p in exports.items()},
+                    "open_ended_time_partitioned": _timed(
+                        lambda: _partitioned(url_s, out_dir, args.workers), args.repeat
+                    ),
+                },
+                "catch_up_page_seconds": _timed(lambda: _catch_up(db, window[0], args.tokens * 10), args.repeat),
+            }
+
+        a = results["legacy_002"]
+        for profile in ("write_optimized_009", "brin_alternative"):
+            b = results[profile]
+            b["insert_speedup"] = round(b["rows_per_sec"] / max(1, a["rows_per_sec"]), 2)
+        print(json.dumps(results, indent=2))
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        with admin.connection() as conn:
+            conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            conn.commit()
+        engine.dispose()
+        db.close()
+        admin.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Snapshot write throughput per storage backend: the collector's write path
+(write_snapshots, one transaction per batch) fed synthetic books.
+
+    python benchmarks/storage_backends.py --tokens 200 --sweeps 20 --batch 50
+
+Always runs the embedded SQLite backend against a temporary file. Runs the
+Postgres backend too when DATABASE_DSN_PG is set; its rows use a "bench-" token
+prefix and are deleted afterwards.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from pm.clob.collect_books import Snapshot
+from pm.storage.base import StorageBackend
+from pm.storage.sqlite import SQLiteBackend
+
+TOKEN_PREFIX = "bench-"
+
+
+def _items(tokens: int, sweep: int, t0: datetime) -> List[Dict[str, Any]]:
+    ts = t0 + timedelta(seconds=sweep)
+    out = []
+    for i in range(tokens):
+        bid = round(0.30 + (i % 40) / 100, 2)
+        bids = [[round(bid - k / 100, 2), 10.0 + k] for k in range(5)]
+        asks = [[round(bid + 0.02 + k / 100, 2), 8.0 + k] for k in range(5)]
+        snap = Snapshot(
+            token_id=f"{TOKEN_PREFIX}{i}",
+            bids_top=bids,
+            asks_top=asks,
+            best_bid_price=bids[0][0],
+            best_bid_size=bids[0][1],
+            best_ask_price=asks[0][0],
+            best_ask_size=asks[0][1],
+            raw_book={"bids": bids, "asks": asks},
+        )
+        out.append({"market_id": None, "ts": ts, "snapshot": snap, "end_time": t0 + timedelta(days=1)})
+    return out
+
+
+def _run(backend: StorageBackend, tokens: int, sweeps: int, batch: int) -> Dict[str, Any]:
+    t0 = datetime.now(timezone.utc).replace(microsecond=0)
+    written = 0
+    elapsed = 0.0
+    for sweep in range(sweeps):
+        items = _items(tokens, sweep, t0)
+        start = time.perf_counter()
+        for i in range(0, len(items), batch):
+            written += backend.write_snapshots(items[i : i + batch])
+        elapsed += time.perf_counter() - start
+    return {
+        "rows": written,
+        "seconds": round(elapsed, 4),
+        "rows_per_sec": round(written / elapsed) if elapsed > 0 else None,
+    }
+
+
+def _pg_cleanup(db) -> None:
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM features_orderbook WHERE token_id LIKE %s", (TOKEN_PREFIX + "%",))
+            cur.execute("DELETE FROM orderbook_snapshots WHERE token_id LIKE %s", (TOKEN_PREFIX + "%",))
+        conn.commit()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tokens", type=int, default=200)
+    ap.add_argument("--sweeps", type=int, default=20)
+    ap.add_argument("--batch", type=int, default=50)
+    args = ap.parse_args()
+
+    results: Dict[str, Any] = {"tokens": args.tokens, "sweeps": args.sweeps, "batch": args.batch}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = SQLiteBackend(os.path.join(tmp, "bench.sqlite"))
+        try:
+            backend.migrate()
+            results["sqlite"] = _run(backend, args.tokens, args.sweeps, args.batch)
+        finally:
+            backend.close()
+
+    if os.getenv("DATABASE_DSN_PG"):
+        from pm.config import load_settings
+        from pm.db import DB
+        from pm.storage.postgres import PostgresBackend
+
+        settings = load_settings()
+        db = DB(settings.database_dsn, statement_timeout_ms=0).open()
+        backend = PostgresBackend(db)
+        try:
+            backend.migrate()
+            _pg_cleanup(db)
+            results["postgres"] = _run(backend, args.tokens, args.sweeps, args.batch)
+        finally:
+            _pg_cleanup(db)
+            backend.close()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
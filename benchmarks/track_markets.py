@@ -0,0 +1,152 @@
+"""
+Statements sent (counted at the cursor) and wall time for tracking N markets:
+the old per-id upsert loop vs the single set-based statement in
+pm.jobs.track_markets.
+
+    python benchmarks/track_markets.py --n 10000
+
+Uses DATABASE_DSN_PG. Seeds N throwaway markets in a high id range and deletes
+them (and their tracked_markets rows) afterwards.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import psycopg
+
+from pm.config import load_settings
+from pm.db import DB, run_migrations
+from pm.jobs.track_markets import _now_utc, track_markets
+
+BASE_ID = 9_000_000_000
+
+_LEGACY_SQL = """
+INSERT INTO tracked_markets (market_id, sessions, ended, first_seen_at, last_seen_at)
+VALUES (%s, ARRAY[%s], FALSE, %s, %s)
+ON CONFLICT (market_id) DO UPDATE SET
+  sessions = (
+    SELECT ARRAY(SELECT DISTINCT unnest(tracked_markets.sessions || EXCLUDED.sessions))
+  ),
+  ended = FALSE,
+  last_seen_at = EXCLUDED.last_seen_at
+"""
+
+
+class _CountingCursor(psycopg.Cursor):
+    """Counts statements sent through cursors on a borrowed connection."""
+    statements = 0
+
+    def execute(self, query, params=None, **kwargs):
+        _CountingCursor.statements += 1
+        return super().execute(query, params, **kwargs)
+
+    def executemany(self, query, params_seq, **kwargs):
+        params_seq = list(params_seq)
+        _CountingCursor.statements += len(params_seq)
+        return super().executemany(query, params_seq, **kwargs)
+
+
+@contextmanager
+def _counted(db: DB):
+    """Route db.connection() through _CountingCursor for the duration of the block."""
+    borrow = db.connection
+
+    @contextmanager
+    def _connection():
+        with borrow() as conn:
+            conn.cursor_factory = _CountingCursor
+            try:
+                yield conn
+            finally:
+                conn.cursor_factory = psycopg.Cursor
+
+    db.connection = _connection
+    try:
+        yield
+    finally:
+        del db.connection
+
+
+def _legacy(db: DB, ids, session: str) -> int:
+    ts = _now_utc()
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            for mid in ids:
+                cur.execute(_LEGACY_SQL, (mid, session, ts, ts))
+        conn.commit()
+    return len(ids)
+
+
+def _cleanup(db: DB, ids) -> None:
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM markets WHERE market_id = ANY(%s)", (ids,))
+        conn.commit()
+
+
+def _seed(db: DB, ids) -> None:
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO markets (market_id, raw_json) SELECT unnest(%s::bigint[]), '{}'::jsonb "
+                "ON CONFLICT (market_id) DO NOTHING",
+                (ids,),
+            )
+        conn.commit()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=10000)
+    args = ap.parse_args()
+
+    settings = load_settings()
+    db = DB(settings.database_dsn, statement_timeout_ms=0).open()
+    ids = list(range(BASE_ID, BASE_ID + args.n))
+    try:
+        run_migrations(db, Path(__file__).resolve().parents[1] / "src" / "pm" / "db" / "migrations")
+        _cleanup(db, ids)
+        _seed(db, ids)
+
+        results = {"n": args.n}
+        for name, fn in (
+            ("per_row", lambda s: _legacy(db, ids, s)),
+            ("set_based", lambda s: track_markets(db=db, market_ids=ids, session=s)),
+        ):
+            # First pass inserts, second pass exercises the session merge on conflict.
+            _CountingCursor.statements = 0
+            with _counted(db):
+                t0 = time.perf_counter()
+                fn(f"bench-{name}")
+                insert_s = time.perf_counter() - t0
+                statements = _CountingCursor.statements
+                t0 = time.perf_counter()
+                fn(f"bench-{name}-2")
+                merge_s = time.perf_counter() - t0
+            results[name] = {
+                "statements_per_pass": statements,
+                "insert_seconds": round(insert_s, 4),
+                "merge_seconds": round(merge_s, 4),
+            }
+            with db.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("DELETE FROM tracked_markets WHERE market_id = ANY(%s)", (ids,))
+                conn.commit()
+
+        results["speedup"] = round(
+            (results["per_row"]["insert_seconds"] + results["per_row"]["merge_seconds"])
+            / max(1e-9, results["set_based"]["insert_seconds"] + results["set_based"]["merge_seconds"]),
+            1,
+        )
+        print(json.dumps(results, indent=2))
+    finally:
+        _cleanup(db, ids)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
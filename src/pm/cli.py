@@ -3,17 +3,18 @@ from __future__ import annotations
 import argparse
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
-from pm.config import load_settings
-from pm.db import DB, run_migrations
-from pm.gamma.client import GammaClient
-from pm.clob.client import ClobClient
+from pm.config import Settings, load_settings
+from pm import profiling
 
-from pm.jobs.ingest_markets import ingest_markets
-from pm.jobs.track_markets import track_markets, refresh_ended_flags, auto_track_markets, AutoTrackPolicy
-from pm.jobs.collect_orderbooks import collect_orderbooks_loop
-from pm.jobs.export_dataset import export as export_job
+if TYPE_CHECKING:
+    from pm.gamma.client import GammaClient
+    from pm.storage.base import StorageBackend
+
+# Job, client and storage modules are imported inside the branch that needs them:
+# pandas/SQLAlchemy (export), numpy (ring buffer, synth, replay) and requests
+# would otherwise cost every invocation several hundred ms before it does anything.
 
 
 def _parse_ts(s: Optional[str]) -> Optional[datetime]:
@@ -30,6 +31,15 @@ def _parse_ts(s: Optional[str]) -> Optional[datetime]:
 
 def build_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(prog="pm", description="Polymarket Postgres-first pipeline")
+    p.add_argument("--profile", action="store_true", help="Time the hot stages and print a breakdown at exit")
+    p.add_argument("--profile-out", type=str, default=None, help="Also write a cProfile dump here (implies --profile)")
+    p.add_argument(
+        "--profile-flame",
+        type=str,
+        default=None,
+        help="Also sample stacks and write them here in folded format for a flamegraph (implies --profile)",
+    )
+    p.add_argument("--profile-interval-ms", type=float, default=5.0, help="Stack sampling interval for --profile-flame")
     sub = p.add_subparsers(dest="cmd", required=True)
 
     m = sub.add_parser("migrate", help="Apply SQL migrations")
@@ -39,6 +49,19 @@ def build_parser() -> argparse.ArgumentParser:
     ing.add_argument("--event-id", type=int, default=None)
     ing.add_argument("--limit", type=int, default=1000)
     ing.add_argument("--pages", type=int, default=1)
+    ing.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Fetch pages concurrently with N workers until a short/empty page (0 = sequential --pages mode)",
+    )
+    ing.add_argument("--max-pages", type=int, default=0, help="Page cap for --workers mode (0 = no cap)")
+    ing.add_argument("--bulk", action="store_true", help="COPY + single merge; skip rows whose content hash is unchanged")
+    ing.add_argument(
+        "--sync",
+        action="store_true",
+        help="Incremental sync: write only changed markets, delist and end tracking for vanished ones",
+    )
 
     tr = sub.add_parser("track-markets", help="Add markets to tracked_markets (by id list)")
     tr.add_argument("--session", required=True)
@@ -53,6 +76,18 @@ def build_parser() -> argparse.ArgumentParser:
     col.add_argument("--loop-seconds", type=float, default=None)
     col.add_argument("--per-batch-sleep", type=float, default=0.1)
     col.add_argument("--iterations", type=int, default=0)
+    col.add_argument("--spool-dir", type=str, default=None, help="Spool snapshots here when the DB is slow or down")
+    col.add_argument("--spool-slow-seconds", type=float, default=2.0, help="Batch write time that triggers spooling")
+    col.add_argument("--ring-path", type=str, default=None, help="Publish books to this shared-memory ring file (e.g. /dev/shm/pm-books.ring)")
+    col.add_argument("--ring-depth", type=int, default=64, help="Snapshots kept per token in the ring")
+    col.add_argument("--ring-max-tokens", type=int, default=4096, help="Token capacity of the ring")
+    col.add_argument("--no-notify", action="store_true", help="Don't NOTIFY feature subscribers after each sweep")
+    col.add_argument("--metrics-port", type=int, default=0, help="Serve Prometheus metrics on this port (0 = off)")
+    col.add_argument("--metrics-addr", type=str, default="127.0.0.1", help="Bind address for --metrics-port")
+
+    sl = sub.add_parser("spool-load", help="Load a collector spool directory into the DB and exit")
+    sl.add_argument("--spool-dir", required=True)
+    sl.add_argument("--block", type=int, default=500)
 
     ex = sub.add_parser("export", help="Export clean dataset + corrupted rows")
     ex.add_argument("--market-id", type=int, default=None)
@@ -64,6 +99,60 @@ def build_parser() -> argparse.ArgumentParser:
     ex.add_argument("--top-n-flatten", type=int, default=10)
     ex.add_argument("--out-clean", type=str, default="clean_orderbook_dataset.csv")
     ex.add_argument("--out-corrupted", type=str, default="flagged_corrupted_rows.csv")
+    ex.add_argument(
+        "--disable-check",
+        action="append",
+        choices=["cadence", "crossed", "monotonic", "price-range"],
+        default=[],
+        help="Turn off a corruption check (repeatable)",
+    )
+    ex.add_argument("--frozen-polls", type=int, default=0, help="Flag runs of K identical top-N books (0 = off)")
+    ex.add_argument("--workers", type=int, default=1, help="Export partitions in N processes (1 = single process)")
+    ex.add_argument("--partition-by", choices=["token", "time"], default="token")
+    ex.add_argument("--grid", type=str, default=None, help="Resample to a fixed grid, e.g. 1s (as-of, forward-filled)")
+    ex.add_argument("--grid-max-age", type=str, default=None, help="Max forward-fill age, e.g. 30s (default: 10 grid steps)")
+    ex.add_argument("--grid-chunk", type=str, default="1h", help="Time window streamed per read (grid / npy-tensor)")
+    ex.add_argument("--format", choices=["csv", "npy-tensor"], default="csv")
+    ex.add_argument("--out-dir", type=str, default="orderbook_tensor", help="Output directory for --format npy-tensor")
+
+    rp = sub.add_parser("replay", help="Replay stored snapshots through the feature path")
+    rp.add_argument("--source", choices=["db", "csv"], default="db")
+    rp.add_argument("--path", type=str, default=None, help="Exported CSV to replay (with --source csv)")
+    rp.add_argument("--market-id", type=int, default=None)
+    rp.add_argument("--token-ids", type=str, default=None, help="Comma-separated token ids (default: all in range)")
+    rp.add_argument("--start", type=str, default=None)
+    rp.add_argument("--end", type=str, default=None)
+    rp.add_argument("--speed", type=float, default=0.0, help="Simulated clock rate (0 = full speed, 1 = real time)")
+    rp.add_argument("--from-raw", action="store_true", help="Rebuild snapshots from raw_book_json (db source)")
+    rp.add_argument("--top-n", type=int, default=None)
+    rp.add_argument("--out", type=str, default=None, help="Write recomputed features to this CSV")
+    rp.add_argument("--progress-every", type=int, default=0)
+
+    sy = sub.add_parser("synth", help="Bulk-load synthetic orderbook history (COPY) for load tests")
+    sy.add_argument("--markets", type=int, default=100)
+    sy.add_argument("--tokens-per-market", type=int, default=2)
+    sy.add_argument("--hours", type=float, default=24.0, help="Length of the generated history")
+    sy.add_argument("--start", type=str, default=None, help="First poll, ISO-8601 (default: now - hours)")
+    sy.add_argument("--cadence-seconds", type=float, default=2.0, help="Seconds between polls")
+    sy.add_argument("--jitter", type=float, default=0.1, help="Per-poll timestamp jitter as a fraction of cadence")
+    sy.add_argument("--levels", type=int, default=10, help="Ladder levels per side")
+    sy.add_argument("--volatility", type=float, default=0.25, help="Mid random walk: logit-space std per hour")
+    sy.add_argument("--gap-rate", type=float, default=0.0, help="Per-poll probability that a token's gap starts")
+    sy.add_argument("--gap-seconds", type=float, default=60.0, help="Mean gap length")
+    sy.add_argument(
+        "--corrupt-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of snapshots corrupted (crossed, non-monotonic, out-of-range, orphan, frozen run)",
+    )
+    sy.add_argument("--frozen-polls", type=int, default=5, help="Length of an injected frozen-book run")
+    sy.add_argument("--no-raw-book", action="store_true", help="Leave raw_book_json NULL (smaller rows)")
+    sy.add_argument("--seed", type=int, default=7)
+    sy.add_argument("--session", type=str, default="synth", help="Session tag on the tracked_markets rows")
+    sy.add_argument("--market-id-base", type=int, default=None, help="First synthetic market id (default 9000000000)")
+    sy.add_argument("--chunk-rows", type=int, default=50_000, help="Snapshots per COPY transaction")
+    sy.add_argument("--workers", type=int, default=1, help="Generate market slices in N processes")
+    sy.add_argument("--replace", action="store_true", help="Delete existing synthetic data in the id range first")
 
     at = sub.add_parser("auto-track", help="Auto-select markets from markets table and add to tracked_markets")
     at.add_argument("--session", required=True, help="Tag to store in tracked_markets.sessions[]")
@@ -76,23 +165,179 @@ def build_parser() -> argparse.ArgumentParser:
     at.add_argument("--include-already-tracked", action="store_true")
     at.add_argument("--allow-missing-token-keys", action="store_true")
     at.add_argument("--dry-run", action="store_true")
+    at.add_argument("--daemon", action="store_true", help="Keep re-ranking: add hot markets, demote cooled ones")
+    at.add_argument("--interval", type=float, default=300.0, help="Seconds between re-ranks (with --daemon)")
+    at.add_argument("--iterations", type=int, default=0, help="0=forever (with --daemon)")
+    at.add_argument("--exit-rank", type=int, default=None, help="Demote when rank falls past this (default 2*top)")
+    at.add_argument("--exit-liquidity", type=float, default=None, help="Demote below this (default min-liquidity/2)")
+    at.add_argument("--swap-margin", type=float, default=0.2, help="Newcomer must beat weakest incumbent by this fraction")
 
     return p
 
 
+def _gamma_client(settings: Settings) -> GammaClient:
+    from pm.gamma.cache import ResponseCache
+    from pm.gamma.client import GammaClient
+
+    cache = (
+        ResponseCache(settings.gamma_cache_path, max_entries=settings.gamma_cache_max_entries)
+        if settings.gamma_cache_path
+        else None
+    )
+    return GammaClient(settings.gamma_base, user_agent=settings.user_agent, cache=cache)
+
+
+def _collect(args: argparse.Namespace, settings: Settings, backend: StorageBackend) -> None:
+    batch = args.batch if args.batch is not None else settings.default_batch_size
+    top_n = args.top_n if args.top_n is not None else settings.default_top_n
+    loop_seconds = args.loop_seconds if args.loop_seconds is not None else settings.default_loop_seconds
+
+    from pm.clob.client import ClobClient
+    from pm.jobs.collect_orderbooks import collect_orderbooks_loop
+
+    collect_orderbooks_loop(
+        backend=backend,
+        clob=ClobClient(settings.clob_base, user_agent=settings.user_agent),
+        batch_size=batch,
+        top_n=top_n,
+        loop_seconds=loop_seconds,
+        per_batch_sleep=args.per_batch_sleep,
+        iterations=args.iterations,
+        spool_dir=args.spool_dir,
+        spool_slow_seconds=args.spool_slow_seconds,
+        ring_path=args.ring_path,
+        ring_depth=args.ring_depth,
+        ring_max_tokens=args.ring_max_tokens,
+        notify=not args.no_notify,
+        metrics_port=args.metrics_port,
+        metrics_addr=args.metrics_addr,
+    )
+
+
+def _export(args: argparse.Namespace, dsn: str) -> None:
+    from pm.jobs.export_dataset import export as export_job
+
+    start_ts = _parse_ts(args.start)
+    end_ts = _parse_ts(args.end)
+
+    clean_n, bad_n = export_job(
+        dsn=dsn,
+        market_id=args.market_id,
+        token_id=args.token_id,
+        start_ts=start_ts,
+        end_ts=end_ts,
+        expected_seconds=args.expected_seconds,
+        tolerance_seconds=args.tolerance_seconds,
+        top_n_flatten=args.top_n_flatten,
+        out_clean=args.out_clean,
+        out_corrupted=args.out_corrupted,
+        workers=args.workers,
+        partition_by=args.partition_by,
+        disabled_checks=args.disable_check,
+        frozen_polls=args.frozen_polls,
+        grid=args.grid,
+        grid_max_age=args.grid_max_age,
+        grid_chunk=args.grid_chunk,
+        fmt=args.format,
+        out_dir=args.out_dir,
+    )
+    if args.format == "npy-tensor":
+        print(f"[export] tensor_dir={args.out_dir} filled_cells={clean_n} corrupted_rows={bad_n}")
+    else:
+        print(f"[export] clean_rows={clean_n} corrupted_rows={bad_n}")
+
+
+def _main_sqlite(settings: Settings, args: argparse.Namespace) -> None:
+    """PM_STORAGE=sqlite: the embedded store covers the ingest -> track -> collect -> export path."""
+    from pm.storage.sqlite import SQLiteBackend
+
+    backend = SQLiteBackend(settings.sqlite_path)
+    try:
+        if args.cmd == "migrate":
+            backend.migrate()
+            print(f"[migrate] done ({settings.sqlite_path})")
+            return
+
+        backend.migrate()
+
+        if args.cmd == "ingest-markets":
+            if args.sync or args.bulk or args.workers > 0:
+                raise SystemExit("--sync, --bulk and --workers need the postgres backend")
+            from pm.jobs.ingest_markets import ingest_markets
+
+            n = ingest_markets(
+                backend=backend, gamma=_gamma_client(settings), event_id=args.event_id, limit=args.limit, pages=args.pages
+            )
+            print(f"[ingest-markets] upserted={n}")
+            return
+
+        if args.cmd == "track-markets":
+            market_ids = [int(x.strip()) for x in args.market_ids.split(",") if x.strip()]
+            n = backend.track_markets(market_ids, args.session)
+            print(f"[track-markets] tracked={n}")
+            return
+
+        if args.cmd == "collect-orderbooks":
+            _collect(args, settings, backend)
+            return
+
+        if args.cmd == "spool-load":
+            from pm.storage.spool import Spool, drain_spool
+
+            n = drain_spool(backend, Spool(args.spool_dir), block=max(1, args.block))
+            print(f"[spool-load] loaded={n}")
+            return
+
+        if args.cmd == "export":
+            _export(args, backend.export_dsn)
+            return
+
+        raise SystemExit(f"{args.cmd} requires the postgres backend (PM_STORAGE=postgres)")
+    finally:
+        backend.close()
+
+
 def main() -> None:
     settings = load_settings()
     args = build_parser().parse_args()
 
-    db = DB(settings.database_dsn, statement_timeout_ms=settings.statement_timeout_ms).open()
+    if not (args.profile or args.profile_out or args.profile_flame):
+        _run(settings, args)
+        return
+    with profiling.session(
+        cprofile_out=args.profile_out, flame_out=args.profile_flame, interval_ms=args.profile_interval_ms
+    ):
+        _run(settings, args)
+
+
+def _run(settings: Settings, args: argparse.Namespace) -> None:
+    if settings.storage_backend == "sqlite":
+        _main_sqlite(settings, args)
+        return
+
+    from pm.db import DB, run_migrations
+
+    db = DB(
+        settings.database_dsn,
+        statement_timeout_ms=settings.statement_timeout_ms,
+        min_size=settings.db_pool_min_size,
+        max_size=settings.db_pool_max_size,
+    )
+    # export reads through its own engine and a CSV replay never touches the
+    # database: neither opens the pool nor checks migrations.
+    uses_pool = not (args.cmd == "export" or (args.cmd == "replay" and args.source == "csv"))
+    if uses_pool:
+        db.open()
 
     try:
         if args.cmd == "migrate":
-            run_migrations(db, args.dir)
-            print("[migrate] done")
+            n = run_migrations(db, args.dir, strict=True)
+            print(f"[migrate] done applied={n}")
             return
         
         if args.cmd == "auto-track":
+            from pm.jobs.track_markets import AutoTrackPolicy, Hysteresis, auto_track_loop, auto_track_markets
+
             policy = AutoTrackPolicy(
                 session=args.session,
                 top_n=args.top,
@@ -105,6 +350,21 @@ def main() -> None:
                 require_token_keys=not bool(args.allow_missing_token_keys),
             )
 
+            if args.daemon:
+                auto_track_loop(
+                    db=db,
+                    policy=policy,
+                    hysteresis=Hysteresis(
+                        exit_rank=args.exit_rank,
+                        exit_liquidity=args.exit_liquidity,
+                        swap_margin=args.swap_margin,
+                    ),
+                    interval_seconds=args.interval,
+                    iterations=args.iterations,
+                    dry_run=bool(args.dry_run),
+                )
+                return
+
             n, mids = auto_track_markets(db=db, policy=policy, dry_run=bool(args.dry_run))
 
             if args.dry_run:
@@ -116,61 +376,146 @@ def main() -> None:
             return
 
         # Ensure migrations applied for normal operation
-        migrations_dir = Path(__file__).parent / "db" / "migrations"
-        run_migrations(db, migrations_dir)
-
-        gamma = GammaClient(settings.gamma_base, user_agent=settings.user_agent)
-        clob = ClobClient(settings.clob_base, user_agent=settings.user_agent)
+        if uses_pool:
+            migrations_dir = Path(__file__).parent / "db" / "migrations"
+            run_migrations(db, migrations_dir)
 
         if args.cmd == "ingest-markets":
-            n = ingest_markets(db=db, gamma=gamma, event_id=args.event_id, limit=args.limit, pages=args.pages)
-            print(f"[ingest-markets] upserted={n}")
+            from pm.jobs.ingest_markets import IngestStats, ingest_markets, ingest_markets_concurrent, sync_markets
+
+            gamma = _gamma_client(settings)
+            if args.sync:
+                if args.event_id is not None:
+                    raise SystemExit("--sync works on the full active listing; drop --event-id")
+                st = sync_markets(db=db, gamma=gamma, limit=args.limit, workers=max(1, args.workers or 4))
+                print(
+                    f"[ingest-markets:sync] pages={st.pages} fetched={st.fetched} inserted={st.inserted} "
+                    f"updated={st.updated} unchanged={st.unchanged} delisted={st.delisted} "
+                    f"tracked_ended={st.tracked_ended} recovered={st.recovered} complete={st.complete} "
+                    f"seconds={st.seconds:.2f}"
+                )
+                return
+            if args.workers > 0:
+                st = ingest_markets_concurrent(
+                    db=db,
+                    gamma=gamma,
+                    event_id=args.event_id,
+                    limit=args.limit,
+                    workers=args.workers,
+                    max_pages=args.max_pages,
+                    bulk=bool(args.bulk),
+                )
+                print(
+                    f"[ingest-markets] pages={st.pages} fetched={st.fetched} upserted={st.upserted} "
+                    f"seconds={st.seconds:.2f} markets_per_sec={st.markets_per_sec:.0f}"
+                )
+            else:
+                st = IngestStats()
+                n = ingest_markets(
+                    db=db,
+                    gamma=gamma,
+                    event_id=args.event_id,
+                    limit=args.limit,
+                    pages=args.pages,
+                    bulk=bool(args.bulk),
+                    stats=st,
+                )
+                print(f"[ingest-markets] upserted={n}")
+            if args.bulk:
+                print(f"[ingest-markets] inserted={st.inserted} updated={st.updated} unchanged={st.unchanged}")
             return
 
         if args.cmd == "track-markets":
+            from pm.jobs.track_markets import track_markets
+
             market_ids = [int(x.strip()) for x in args.market_ids.split(",") if x.strip()]
             n = track_markets(db=db, market_ids=market_ids, session=args.session)
             print(f"[track-markets] tracked={n}")
             return
 
         if args.cmd == "refresh-ended":
+            from pm.jobs.track_markets import refresh_ended_flags
+
             n = refresh_ended_flags(db)
             print(f"[refresh-ended] updated={n}")
             return
 
         if args.cmd == "collect-orderbooks":
-            batch = args.batch if args.batch is not None else settings.default_batch_size
-            top_n = args.top_n if args.top_n is not None else settings.default_top_n
-            loop_seconds = args.loop_seconds if args.loop_seconds is not None else settings.default_loop_seconds
+            from pm.storage.postgres import PostgresBackend
 
-            collect_orderbooks_loop(
-                db=db,
-                clob=clob,
-                batch_size=batch,
-                top_n=top_n,
-                loop_seconds=loop_seconds,
-                per_batch_sleep=args.per_batch_sleep,
-                iterations=args.iterations,
-            )
+            _collect(args, settings, PostgresBackend(db))
+            return
+
+        if args.cmd == "spool-load":
+            from pm.storage.postgres import PostgresBackend
+            from pm.storage.spool import Spool, drain_spool
+
+            n = drain_spool(PostgresBackend(db), Spool(args.spool_dir), block=max(1, args.block))
+            print(f"[spool-load] loaded={n}")
             return
 
         if args.cmd == "export":
-            start_ts = _parse_ts(args.start)
-            end_ts = _parse_ts(args.end)
+            _export(args, settings.database_dsn)
+            return
 
-            clean_n, bad_n = export_job(
+        if args.cmd == "synth":
+            from pm.jobs.synth import SYNTH_MARKET_ID_BASE, SynthParams, synth_history
+
+            st = synth_history(
+                db,
+                SynthParams(
+                    markets=args.markets,
+                    tokens_per_market=args.tokens_per_market,
+                    start=_parse_ts(args.start),
+                    hours=args.hours,
+                    cadence_seconds=args.cadence_seconds,
+                    jitter=args.jitter,
+                    levels=args.levels,
+                    volatility=args.volatility,
+                    gap_rate=args.gap_rate,
+                    gap_seconds=args.gap_seconds,
+                    corrupt_rate=args.corrupt_rate,
+                    frozen_polls=args.frozen_polls,
+                    raw_book=not args.no_raw_book,
+                    seed=args.seed,
+                    session=args.session,
+                    market_id_base=args.market_id_base if args.market_id_base is not None else SYNTH_MARKET_ID_BASE,
+                    chunk_rows=max(1, args.chunk_rows),
+                    replace=bool(args.replace),
+                ),
                 dsn=settings.database_dsn,
+                workers=args.workers,
+            )
+            print(
+                f"[synth] markets={st.markets} tokens={st.tokens} polls={st.polls} snapshots={st.snapshots} "
+                f"feature_rows={st.feature_rows} gap_polls={st.gap_polls} "
+                f"corrupted={','.join(f'{k}:{v}' for k, v in st.corrupted.items())} "
+                f"seconds={st.seconds:.1f} rows_per_min={st.rows_per_min:.0f}"
+            )
+            return
+
+        if args.cmd == "replay":
+            from pm.jobs.replay import replay as replay_job
+
+            token_ids = [x.strip() for x in args.token_ids.split(",") if x.strip()] if args.token_ids else None
+            stats = replay_job(
+                db=db,
+                source=args.source,
+                path=args.path,
+                token_ids=token_ids,
                 market_id=args.market_id,
-                token_id=args.token_id,
-                start_ts=start_ts,
-                end_ts=end_ts,
-                expected_seconds=args.expected_seconds,
-                tolerance_seconds=args.tolerance_seconds,
-                top_n_flatten=args.top_n_flatten,
-                out_clean=args.out_clean,
-                out_corrupted=args.out_corrupted,
+                start_ts=_parse_ts(args.start),
+                end_ts=_parse_ts(args.end),
+                speed=args.speed,
+                from_raw=bool(args.from_raw),
+                top_n=args.top_n if args.top_n is not None else settings.default_top_n,
+                out=args.out,
+                progress_every=args.progress_every,
+            )
+            print(
+                f"[replay] events={stats.events} tokens={stats.tokens} "
+                f"seconds={stats.seconds:.2f} events_per_sec={stats.events_per_sec:.0f}"
             )
-            print(f"[export] clean_rows={clean_n} corrupted_rows={bad_n}")
             return
 
         raise SystemExit(f"Unknown command: {args.cmd}")
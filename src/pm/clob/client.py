@@ -6,6 +6,8 @@ from typing import Any, Dict, List, Optional
 
 import requests
 
+from pm.profiling import stage
+
 
 @dataclass
 class ClobClient:
@@ -17,6 +19,7 @@ class ClobClient:
 
     def __post_init__(self):
         self.base = self.base.rstrip("/")
+        self.retried = 0   # total retries, read by the collector's metrics
         self.sess = requests.Session()
         self.sess.headers.update(
             {
@@ -39,12 +42,16 @@ class ClobClient:
 
         for i in range(self.retries):
             try:
-                r = self.sess.get(url, params={"token_id": str(token_id)}, timeout=self.timeout_s)
+                with stage("clob.http"):
+                    r = self.sess.get(url, params={"token_id": str(token_id)}, timeout=self.timeout_s)
                 r.raise_for_status()
-                data = r.json()
+                with stage("clob.json"):
+                    data = r.json()
                 return data if isinstance(data, dict) else {}
             except Exception as e:
                 last = e
+                if i + 1 < self.retries:
+                    self.retried += 1
                 time.sleep(self.backoff_s * (2**i))
 
         raise last  # type: ignore[misc]
@@ -2,12 +2,16 @@ from __future__ import annotations
 
 import os
 from dataclasses import dataclass
+from typing import Optional
+
 from dotenv import load_dotenv
 
 
 @dataclass(frozen=True)
 class Settings:
     database_dsn: str
+    storage_backend: str          # "postgres" | "sqlite"
+    sqlite_path: str
     gamma_base: str
     clob_base: str
 
@@ -15,16 +19,25 @@ class Settings:
     default_top_n: int
     default_loop_seconds: float
     statement_timeout_ms: int
+    db_pool_min_size: int
+    db_pool_max_size: int
 
     user_agent: str
 
+    gamma_cache_path: Optional[str]
+    gamma_cache_max_entries: int
+
 
 def load_settings() -> Settings:
     # Load .env if present (safe even if missing)
     load_dotenv()
 
+    backend = os.getenv("PM_STORAGE", "postgres").strip().lower() or "postgres"
+    if backend not in ("postgres", "sqlite"):
+        raise RuntimeError(f"PM_STORAGE must be 'postgres' or 'sqlite', got {backend!r}")
+
     dsn = os.getenv("DATABASE_DSN_PG", "").strip()
-    if not dsn:
+    if not dsn and backend == "postgres":
         raise RuntimeError("DATABASE_DSN_PG is required (set in .env or environment).")
 
     gamma_base = os.getenv("GAMMA_BASE", "https://gamma-api.polymarket.com").strip()
@@ -46,11 +59,17 @@ def load_settings() -> Settings:
 
     return Settings(
         database_dsn=dsn,
+        storage_backend=backend,
+        sqlite_path=os.getenv("PM_SQLITE_PATH", "pm.sqlite").strip(),
         gamma_base=gamma_base,
         clob_base=clob_base,
         default_batch_size=max(1, _int("DEFAULT_BATCH_SIZE", 50)),
         default_top_n=max(0, _int("DEFAULT_TOP_N", 10)),
         default_loop_seconds=max(0.0, _float("DEFAULT_LOOP_SECONDS", 2.0)),
         statement_timeout_ms=max(0, _int("DEFAULT_STATEMENT_TIMEOUT_MS", 60000)),
+        db_pool_min_size=max(0, _int("DB_POOL_MIN_SIZE", 1)),
+        db_pool_max_size=max(1, _int("DB_POOL_MAX_SIZE", 5)),
         user_agent=os.getenv("PM_USER_AGENT", "polymarket-pipeline/0.1.0").strip(),
+        gamma_cache_path=os.getenv("GAMMA_CACHE_PATH", "").strip() or None,
+        gamma_cache_max_entries=max(1, _int("GAMMA_CACHE_MAX_ENTRIES", 10000)),
     )
\ No newline at end of file
@@ -1,15 +1,18 @@
 from __future__ import annotations
 
 import glob
+import hashlib
 import os
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
 
 import psycopg
 from psycopg.rows import dict_row
 from psycopg_pool import ConnectionPool
 
+from pm.profiling import stage
+
 
 @dataclass
 class DB:
@@ -19,29 +22,32 @@ class DB:
     dsn: str
     statement_timeout_ms: int = 60000
     pool: Optional[ConnectionPool] = None
+    # Note: keep pool size modest; Neon can throttle
+    min_size: int = 1
+    max_size: int = 5
+
+    def _configure(self, conn: psycopg.Connection) -> None:
+        # Runs on every new pooled connection, not just the first one borrowed.
+        with conn.cursor() as cur:
+            cur.execute("SET TIME ZONE 'UTC'")
+            if self.statement_timeout_ms > 0:
+                # SET doesn't reliably accept bind params; embed validated int
+                timeout = int(self.statement_timeout_ms)
+                cur.execute(f"SET statement_timeout = {timeout}")
+        conn.commit()
 
     def open(self) -> "DB":
         if self.pool is not None:
             return self
 
-        # Note: keep pool size modest; Neon can throttle
         self.pool = ConnectionPool(
             conninfo=self.dsn,
-            min_size=1,
-            max_size=5,
+            min_size=max(0, self.min_size),
+            max_size=max(1, self.min_size, self.max_size),
             kwargs={"row_factory": dict_row},
+            configure=self._configure,
+            open=True,
         )
-
-        # Session defaults
-        with self.pool.connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SET TIME ZONE 'UTC'")
-                if self.statement_timeout_ms > 0:
-                    # SET doesn't reliably accept bind params; embed validated int
-                    timeout = int(self.statement_timeout_ms)
-                    cur.execute(f"SET statement_timeout = {timeout}")
-            conn.commit()
-
         return self
 
     def close(self) -> None:
@@ -54,6 +60,41 @@ class DB:
             raise RuntimeError("DB pool not opened. Call db.open() first.")
         return self.pool.connection()
 
+    def execute_batch(
+        self,
+        statements: Iterable[Tuple[str, Sequence[Any]]],
+        *,
+        prepare: bool = True,
+        conn: Optional[psycopg.Connection] = None,
+    ) -> int:
+        """
+        Run (sql, params) pairs in one transaction using pipeline mode: statements
+        are sent without waiting for each result, so a batch of hundreds costs
+        about one round trip. With `prepare`, each distinct SQL string becomes a
+        server-side prepared statement on the connection and is only parsed once.
+
+        Pass `conn` to run inside a caller's transaction (no commit here).
+        Returns the number of statements executed.
+        """
+        if conn is not None:
+            return _run_pipeline(conn, statements, prepare)
+
+        with self.connection() as c:
+            n = _run_pipeline(c, statements, prepare)
+            with stage("db.commit"):
+                c.commit()
+        return n
+
+
+def _run_pipeline(conn: psycopg.Connection, statements: Iterable[Tuple[str, Sequence[Any]]], prepare: bool) -> int:
+    n = 0
+    with conn.pipeline():
+        with conn.cursor() as cur:
+            for sql, params in statements:
+                cur.execute(sql, params, prepare=prepare)
+                n += 1
+    return n
+
 
 def _split_sql_statements(sql: str) -> list[str]:
     # Sufficient for typical migration DDL (no complex function bodies).
@@ -153,39 +194,96 @@ def _split_sql_statements(sql: str) -> list[str]:
     return parts
 
 
-def run_migrations(db: DB, migrations_dir: str | Path) -> None:
+_MIGRATIONS_TABLE_DDL = (
     """
-    Apply *.sql migrations in lexical order.
-    Uses a migrations table to ensure each file runs once.
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+      filename TEXT PRIMARY KEY,
+      applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    )
+    """,
+    "ALTER TABLE schema_migrations ADD COLUMN IF NOT EXISTS checksum TEXT",
+)
+
+
+def _migration_files(migrations_dir: Path) -> list[tuple[str, str, Path]]:
+    out = []
+    for fp in sorted(glob.glob(str(migrations_dir / "*.sql"))):
+        # Hash with LF line endings so a CRLF checkout matches what was recorded.
+        data = Path(fp).read_bytes().replace(b"\r\n", b"\n")
+        out.append((os.path.basename(fp), hashlib.sha256(data).hexdigest(), Path(fp)))
+    return out
+
+
+def _applied_migrations(conn: psycopg.Connection) -> Optional[Dict[str, Optional[str]]]:
+    """filename -> checksum for every applied migration; None before the first migrate."""
+    with conn.cursor() as cur:
+        try:
+            cur.execute("SELECT * FROM schema_migrations")
+        except psycopg.errors.UndefinedTable:
+            conn.rollback()
+            return None
+        rows = cur.fetchall()
+    conn.commit()
+    return {r["filename"]: r.get("checksum") for r in rows}
+
+
+def run_migrations(db: DB, migrations_dir: str | Path, *, strict: bool = False) -> int:
+    """
+    Apply *.sql migrations in lexical order; returns how many were applied.
+
+    Postgres commands call this on startup, so the common case (nothing to do)
+    is a single SELECT of schema_migrations compared against the files' sha256
+    (line endings normalised to LF). Only when a file is new, or a row predates
+    the checksum column, does it take the slow path: apply pending files one by
+    one and backfill checksums. A file whose contents changed after it was
+    applied is never re-run. With `strict` (`pm migrate`) it is an error --
+    add a new migration instead; other commands ignore it and keep working.
     """
     db.open()
-    migrations_dir = Path(migrations_dir)
+    files = _migration_files(Path(migrations_dir))
 
     with db.connection() as conn:
+        applied = _applied_migrations(conn)
+        if applied is not None:
+            if strict:
+                changed = [
+                    f"{name} (recorded sha256 {applied[name][:12]}, file {digest[:12]})"
+                    for name, digest, _ in files
+                    if applied.get(name) not in (None, digest)
+                ]
+                if changed:
+                    raise RuntimeError(
+                        "migrations changed after they were applied: "
+                        + ", ".join(changed) + "; add a new migration instead"
+                    )
+            if all(applied.get(name) is not None for name, _, _ in files):
+                return 0
+
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS schema_migrations (
-                  filename TEXT PRIMARY KEY,
-                  applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                )
-                """
-            )
+            for ddl in _MIGRATIONS_TABLE_DDL:
+                cur.execute(ddl)
         conn.commit()
 
-    files = sorted(glob.glob(str(migrations_dir / "*.sql")))
-    for fp in files:
-        name = os.path.basename(fp)
-        sql = Path(fp).read_text(encoding="utf-8")
+        n = 0
+        for name, digest, fp in files:
+            if applied is not None and name in applied:
+                if applied[name] is None:
+                    with conn.cursor() as cur:
+                        cur.execute("UPDATE schema_migrations SET checksum=%s WHERE filename=%s", (digest, name))
+                    conn.commit()
+                continue
 
-        with db.connection() as conn:
             with conn.cursor() as cur:
+                # Another process may have applied it since the snapshot above.
                 cur.execute("SELECT 1 FROM schema_migrations WHERE filename=%s", (name,))
                 if cur.fetchone():
+                    conn.commit()
                     continue
 
-                for stmt in _split_sql_statements(sql):
+                for stmt in _split_sql_statements(fp.read_text(encoding="utf-8")):
                     cur.execute(stmt)
 
-                cur.execute("INSERT INTO schema_migrations (filename) VALUES (%s)", (name,))
-            conn.commit()
\ No newline at end of file
+                cur.execute("INSERT INTO schema_migrations (filename, checksum) VALUES (%s, %s)", (name, digest))
+            conn.commit()
+            n += 1
+    return n
@@ -0,0 +1,8 @@
+BEGIN;
+
+-- Fingerprint of the normalized market row + raw payload, written by the bulk
+-- upsert so unchanged markets can be skipped without rewriting raw_json.
+ALTER TABLE markets
+  ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+COMMIT;
@@ -0,0 +1,8 @@
+BEGIN;
+
+-- Set by the incremental sync when a market drops out of the active Gamma
+-- listing (closed/resolved upstream).
+ALTER TABLE markets
+  ADD COLUMN IF NOT EXISTS delisted_at TIMESTAMPTZ;
+
+COMMIT;
@@ -0,0 +1,23 @@
+BEGIN;
+
+-- Bumped on every insert/update of a tracked_markets row, whoever writes it
+-- (track, auto-track, sync delisting, refresh-ended, collector expiry), so the
+-- collector can refresh its token universe by delta.
+ALTER TABLE tracked_markets
+  ADD COLUMN IF NOT EXISTS changed_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+
+CREATE OR REPLACE FUNCTION pm_touch_changed_at() RETURNS trigger AS '
+BEGIN
+  NEW.changed_at := clock_timestamp();
+  RETURN NEW;
+END
+' LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_tracked_markets_changed_at ON tracked_markets;
+CREATE TRIGGER trg_tracked_markets_changed_at
+  BEFORE INSERT OR UPDATE ON tracked_markets
+  FOR EACH ROW EXECUTE FUNCTION pm_touch_changed_at();
+
+CREATE INDEX IF NOT EXISTS idx_tracked_markets_changed_at ON tracked_markets (changed_at);
+
+COMMIT;
@@ -0,0 +1,77 @@
+BEGIN;
+
+-- One row per token: the newest snapshot and its features. The collector
+-- upserts it once per sweep, so current state is a primary-key read instead of
+-- a DISTINCT ON scan over orderbook_snapshots. No secondary indexes and a
+-- lower fillfactor keep the per-sweep rewrites HOT updates.
+CREATE TABLE IF NOT EXISTS orderbook_latest (
+  token_id             TEXT PRIMARY KEY,
+  market_id            BIGINT REFERENCES markets(market_id) ON DELETE SET NULL,
+  ts_utc               TIMESTAMPTZ NOT NULL,
+  best_bid_price       DOUBLE PRECISION,
+  best_bid_size        DOUBLE PRECISION,
+  best_ask_price       DOUBLE PRECISION,
+  best_ask_size        DOUBLE PRECISION,
+  bids_top_n_json      JSONB,
+  asks_top_n_json      JSONB,
+  spread               DOUBLE PRECISION,
+  mid                  DOUBLE PRECISION,
+  microprice           DOUBLE PRECISION,
+  imbalance_l1         DOUBLE PRECISION,
+  bid_depth_top_n      DOUBLE PRECISION,
+  ask_depth_top_n      DOUBLE PRECISION,
+  depth_bid_top5       DOUBLE PRECISION,
+  depth_ask_top5       DOUBLE PRECISION,
+  imbalance_top5       DOUBLE PRECISION,
+  seconds_to_expiry    DOUBLE PRECISION,
+  hours_to_expiry      DOUBLE PRECISION,
+  extra_features_json  JSONB,
+  updated_at           TIMESTAMPTZ NOT NULL DEFAULT NOW()
+) WITH (fillfactor = 70);
+
+-- Seed from history once; afterwards the collector keeps it current. A skip
+-- scan walks the (token_id, ts_utc) primary key of features_orderbook one
+-- token at a time, and each token's newest row is a backward probe of the
+-- same index, so the seed costs a few index reads per token rather than a
+-- sort of the whole history.
+WITH RECURSIVE tokens AS (
+  (SELECT token_id FROM features_orderbook ORDER BY token_id LIMIT 1)
+  UNION ALL
+  SELECT (
+    SELECT f.token_id FROM features_orderbook f
+    WHERE f.token_id > t.token_id
+    ORDER BY f.token_id
+    LIMIT 1
+  )
+  FROM tokens t
+  WHERE t.token_id IS NOT NULL
+)
+INSERT INTO orderbook_latest (
+  token_id, market_id, ts_utc,
+  best_bid_price, best_bid_size, best_ask_price, best_ask_size,
+  bids_top_n_json, asks_top_n_json,
+  spread, mid, microprice, imbalance_l1,
+  bid_depth_top_n, ask_depth_top_n,
+  depth_bid_top5, depth_ask_top5, imbalance_top5,
+  seconds_to_expiry, hours_to_expiry, extra_features_json
+)
+SELECT
+  s.token_id, s.market_id, s.ts_utc,
+  s.best_bid_price, s.best_bid_size, s.best_ask_price, s.best_ask_size,
+  s.bids_top_n_json, s.asks_top_n_json,
+  f.spread, f.mid, f.microprice, f.imbalance_l1,
+  f.bid_depth_top_n, f.ask_depth_top_n,
+  f.depth_bid_top5, f.depth_ask_top5, f.imbalance_top5,
+  f.seconds_to_expiry, f.hours_to_expiry, f.extra_features_json
+FROM tokens t
+CROSS JOIN LATERAL (
+  SELECT * FROM features_orderbook f
+  WHERE f.token_id = t.token_id
+  ORDER BY f.ts_utc DESC
+  LIMIT 1
+) f
+JOIN orderbook_snapshots s ON s.token_id = f.token_id AND s.ts_utc = f.ts_utc
+WHERE t.token_id IS NOT NULL
+ON CONFLICT (token_id) DO NOTHING;
+
+COMMIT;
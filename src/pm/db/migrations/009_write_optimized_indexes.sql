@@ -0,0 +1,23 @@
+BEGIN;
+
+-- Write-optimized index profile for the append-only time-series tables.
+-- Every collector batch maintains each index below, so keep only what reads use:
+--   (token_id, ts_utc)   the primary key; a btree scans it backwards too, so the
+--                        separate (token_id, ts_utc DESC) indexes were pure overhead
+--   (market_id, ts_utc)  market-scoped export and replay
+--   idx_obs_ts           kept: MIN/MAX(ts_utc) for export bounds and time windows
+--   (ts_utc, token_id)   on features, replacing its ts_utc index: same bounds and
+--                        windows, plus the feed's ordered catch-up paging
+-- No BRIN on ts_utc: next to these btrees it would only add write cost, and on
+-- its own it can't answer MIN/MAX or return rows in order.
+-- extra_features_json is only ever read whole, never searched; its GIN index
+-- was the most expensive one to maintain.
+
+DROP INDEX IF EXISTS idx_obs_token_ts;
+DROP INDEX IF EXISTS idx_feat_token_ts;
+DROP INDEX IF EXISTS idx_feat_extra_gin;
+
+CREATE INDEX IF NOT EXISTS idx_feat_ts_token ON features_orderbook (ts_utc, token_id);
+DROP INDEX IF EXISTS idx_feat_ts;
+
+COMMIT;
@@ -0,0 +1,9 @@
+BEGIN;
+
+-- Set when auto-track demotes a market's last session. Such a row has
+-- ended = TRUE but ended_at NULL: it stopped being polled because it fell out
+-- of the ranking, not because the market ended. Cleared when it is tracked again.
+ALTER TABLE tracked_markets
+  ADD COLUMN IF NOT EXISTS demoted_at TIMESTAMPTZ;
+
+COMMIT;
@@ -1,14 +1,15 @@
 from __future__ import annotations
 
-import json
 from dataclasses import dataclass
-from datetime import datetime
-from typing import Any, Optional
+from datetime import datetime, timedelta
+from typing import Optional
 
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
 
-from pm.export.corruption_checks import CorruptionConfig, cadence_flags
+from pm.export.corruption_checks import CorruptionConfig, corruption_flags
+from pm.export.levels import level_arrays
+from pm.profiling import stage
 
 
 _ALIGNED_SQL_BASE = """
@@ -66,8 +67,27 @@ WHERE s.token_id IS NULL
 ORDER BY token_id, ts_utc
 """
 
+# The `n` aligned rows per token nearest to one edge of a slice ({order} = DESC
+# for the rows before it, ASC for the rows after it).
+_CONTEXT_SQL_BASE = """
+SELECT * FROM (
+  SELECT a.*, ROW_NUMBER() OVER (PARTITION BY a.token_id ORDER BY a.ts_utc {order}) AS ctx_rn
+  FROM ({aligned}) a
+) c
+WHERE ctx_rn <= :ctx_rows
+"""
+
 
-def _build_where(market_id, token_id, start_ts, end_ts) -> tuple[str, dict]:
+def _build_where(
+    market_id,
+    token_id,
+    start_ts,
+    end_ts,
+    *,
+    token_ids: Optional[list[str]] = None,
+    start_exclusive: bool = False,
+    end_exclusive: bool = False,
+) -> tuple[str, dict]:
     """Build a WHERE clause and params dict with only the non-None filters."""
     clauses = []
     params: dict = {}
@@ -77,62 +97,36 @@ def _build_where(market_id, token_id, start_ts, end_ts) -> tuple[str, dict]:
     if token_id is not None:
         clauses.append("token_id = :token_id")
         params["token_id"] = token_id
+    if token_ids is not None:
+        # Expanded IN list rather than = ANY(array) so the same SQL runs on SQLite.
+        names = [f"token_id_{i}" for i in range(len(token_ids))]
+        clauses.append(f"token_id IN ({', '.join(':' + n for n in names)})" if names else "FALSE")
+        params.update(zip(names, token_ids))
     if start_ts is not None:
-        clauses.append("ts_utc >= :start_ts")
+        clauses.append("ts_utc > :start_ts" if start_exclusive else "ts_utc >= :start_ts")
         params["start_ts"] = start_ts
     if end_ts is not None:
-        clauses.append("ts_utc <= :end_ts")
+        clauses.append("ts_utc < :end_ts" if end_exclusive else "ts_utc <= :end_ts")
         params["end_ts"] = end_ts
     where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
     return where, params
 
 
-def _ensure_levels(v: Any) -> list[list[float]]:
-    if v is None:
-        return []
-    if isinstance(v, str):
-        try:
-            v = json.loads(v)
-        except Exception:
-            return []
-    if not isinstance(v, list):
-        return []
-    out = []
-    for item in v:
-        if isinstance(item, (list, tuple)) and len(item) >= 2:
-            try:
-                out.append([float(item[0]), float(item[1])])
-            except Exception:
-                pass
-        elif isinstance(item, dict):
-            try:
-                out.append([float(item.get("price")), float(item.get("size"))])
-            except Exception:
-                pass
-    return out
-
-
 def flatten_top_levels(df: pd.DataFrame, top_n: int) -> pd.DataFrame:
     if top_n <= 0 or df.empty:
         return df
 
-    for i in range(1, top_n + 1):
-        df[f"bid_px_{i}"] = pd.NA
-        df[f"bid_sz_{i}"] = pd.NA
-        df[f"ask_px_{i}"] = pd.NA
-        df[f"ask_sz_{i}"] = pd.NA
-
-    for idx, row in df.iterrows():
-        bids = _ensure_levels(row.get("bids_top_n_json"))
-        asks = _ensure_levels(row.get("asks_top_n_json"))
-        for i in range(top_n):
-            if i < len(bids):
-                df.at[idx, f"bid_px_{i+1}"] = bids[i][0]
-                df.at[idx, f"bid_sz_{i+1}"] = bids[i][1]
-            if i < len(asks):
-                df.at[idx, f"ask_px_{i+1}"] = asks[i][0]
-                df.at[idx, f"ask_sz_{i+1}"] = asks[i][1]
-    return df
+    bid_px, bid_sz = level_arrays(df["bids_top_n_json"], top_n)
+    ask_px, ask_sz = level_arrays(df["asks_top_n_json"], top_n)
+
+    cols = {}
+    for i in range(top_n):
+        cols[f"bid_px_{i+1}"] = bid_px[:, i]
+        cols[f"bid_sz_{i+1}"] = bid_sz[:, i]
+        cols[f"ask_px_{i+1}"] = ask_px[:, i]
+        cols[f"ask_sz_{i+1}"] = ask_sz[:, i]
+    flat = pd.DataFrame(cols, index=df.index)
+    return pd.concat([df.drop(columns=[c for c in cols if c in df.columns]), flat], axis=1)
 
 
 @dataclass(frozen=True)
@@ -148,21 +142,210 @@ class ExportParams:
     out_corrupted: str = "flagged_corrupted_rows.csv"
 
 
-def export_dataset(params: ExportParams) -> tuple[int, int]:
-    dsn = params.dsn.replace("postgresql://", "postgresql+psycopg://", 1)
+def _engine_for(dsn: str):
+    if dsn.startswith("sqlite:"):
+        return _sqlite_engine(dsn)
+    return create_engine(dsn.replace("postgresql://", "postgresql+psycopg://", 1))
+
+
+def _sqlite_engine(dsn: str):
+    """
+    Engine for the embedded store. Its timestamps are fixed-width UTC text, so
+    datetime binds are formatted the same way on this engine only, and the
+    range filters compare like for like.
+    """
+    from pm.storage.sqlite import _ts
+
     engine = create_engine(dsn)
 
-    where, qparams = _build_where(params.market_id, params.token_id, params.start_ts, params.end_ts)
+    def _bind(v):
+        return _ts(_utc(v)) if isinstance(v, datetime) else v
+
+    def _params(p):
+        if isinstance(p, dict):
+            return {k: _bind(v) for k, v in p.items()}
+        return type(p)(_bind(v) for v in p)
+
+    @event.listens_for(engine, "before_cursor_execute", retval=True)
+    def _format_ts(conn, cursor, statement, parameters, context, executemany):
+        if executemany:
+            return statement, [_params(p) for p in parameters]
+        return statement, _params(parameters)
+
+    return engine
+
+
+def probe_seconds(cfg: CorruptionConfig) -> float:
+    """Width of the first read for edge context; it usually holds every neighbour needed."""
+    if cfg.expected_seconds and cfg.expected_seconds > 0:
+        return 10.0 * (cfg.expected_seconds + cfg.tolerance_seconds)
+    return 60.0
+
+
+def _context_sizes(cfg: CorruptionConfig) -> tuple[int, int]:
+    """Rows per token the checks need from before / after a slice to flag its edges like a single-pass export."""
+    before = 1 if cfg.check_cadence else 0
+    after = 0
+    if cfg.frozen_polls > 0:
+        # A run of K straddling an edge is decided by the K-1 rows on the other side.
+        before = max(before, cfg.frozen_polls - 1)
+        after = cfg.frozen_polls - 1
+    return before, after
+
+
+def _utc(ts) -> Optional[datetime]:
+    if ts is None:
+        return None
+    t = pd.Timestamp(ts)
+    t = t.tz_localize("UTC") if t.tzinfo is None else t.tz_convert("UTC")
+    return t.to_pydatetime()
+
+
+def _edge_rows(
+    engine,
+    params: ExportParams,
+    token_ids: Optional[list[str]],
+    lo: Optional[datetime],
+    hi: Optional[datetime],
+    *,
+    lo_exclusive: bool,
+    hi_exclusive: bool,
+    n: int,
+    desc: bool,
+) -> pd.DataFrame:
+    where, qparams = _build_where(
+        params.market_id, params.token_id, lo, hi,
+        token_ids=token_ids, start_exclusive=lo_exclusive, end_exclusive=hi_exclusive,
+    )
+    aligned = _ALIGNED_SQL_BASE.format(s_where=where, f_where=where)
+    sql = _CONTEXT_SQL_BASE.format(aligned=aligned, order="DESC" if desc else "ASC")
+    df = pd.read_sql_query(text(sql), engine, params={**qparams, "ctx_rows": n}, parse_dates=["ts_utc"])
+    df["ts_utc"] = pd.to_datetime(df["ts_utc"], utc=True)
+    return df.drop(columns=["ctx_rn"])
+
+
+def _neighbours(
+    engine,
+    params: ExportParams,
+    tokens: list[str],
+    *,
+    edge: datetime,
+    limit: Optional[datetime],
+    n: int,
+    before: bool,
+    edge_inclusive: bool = False,
+) -> pd.DataFrame:
+    """
+    Up to `n` aligned rows per token in `tokens` on one side of `edge`, going no
+    further than `limit` (inclusive; None = unbounded). A `probe_seconds` window
+    is read first; only tokens it didn't fill are looked up further out.
+    """
+    step = timedelta(seconds=probe_seconds(params.corruption))
+    near = edge - step if before else edge + step
+    if limit is not None and (near <= limit if before else near >= limit):
+        near = limit
+    if before:
+        found = _edge_rows(
+            engine, params, None, near, edge, lo_exclusive=False, hi_exclusive=not edge_inclusive, n=n, desc=True
+        )
+    else:
+        found = _edge_rows(
+            engine, params, None, edge, near, lo_exclusive=not edge_inclusive, hi_exclusive=False, n=n, desc=False
+        )
+    found = found[found["token_id"].astype(str).isin(tokens)]
+
+    if near != limit:
+        have = found["token_id"].astype(str).value_counts()
+        short = [t for t in tokens if have.get(t, 0) < n]
+        more = []
+        # Chunked so the IN list stays under SQLite's bound-parameter limit.
+        for i in range(0, len(short), 500):
+            chunk = short[i:i + 500]
+            if before:
+                more.append(
+                    _edge_rows(engine, params, chunk, limit, near, lo_exclusive=False, hi_exclusive=True, n=n, desc=True)
+                )
+            else:
+                more.append(
+                    _edge_rows(engine, params, chunk, near, limit, lo_exclusive=True, hi_exclusive=False, n=n, desc=False)
+                )
+        parts = [f for f in [found] + more if not f.empty]
+        found = pd.concat(parts, ignore_index=True) if parts else found
+
+    if found.empty:
+        return found
+    found = found.sort_values(["token_id", "ts_utc"], kind="stable")
+    g = found.groupby("token_id", sort=False)
+    return g.tail(n) if before else g.head(n)
+
+
+def export_frames(
+    engine,
+    params: ExportParams,
+    *,
+    token_ids: Optional[list[str]] = None,
+    end_exclusive: bool = False,
+    context: Optional[tuple[Optional[datetime], Optional[datetime]]] = None,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Load, check and flatten one export range. Returns (clean, corrupted).
+
+    `token_ids` / `end_exclusive` narrow the range to a partition. `context` is the
+    (start, end) of the whole export the range is a slice of (None = unbounded):
+    the checks then also see each token's nearest rows from outside the slice but
+    inside the export, so edge rows get exactly the flags a single-pass export
+    gives them. Those extra rows are dropped again before returning.
+    """
+    where, qparams = _build_where(
+        params.market_id, params.token_id, params.start_ts, params.end_ts,
+        token_ids=token_ids, end_exclusive=end_exclusive,
+    )
     aligned_sql = text(_ALIGNED_SQL_BASE.format(s_where=where, f_where=where))
     orphans_sql = text(_ORPHANS_SQL_BASE.format(s_where=where, f_where=where))
 
-    aligned = pd.read_sql_query(aligned_sql, engine, params=qparams, parse_dates=["ts_utc"])
-    orphans = pd.read_sql_query(orphans_sql, engine, params=qparams, parse_dates=["ts_utc"])
+    with stage("export.query"):
+        aligned = pd.read_sql_query(aligned_sql, engine, params=qparams, parse_dates=["ts_utc"])
+        orphans = pd.read_sql_query(orphans_sql, engine, params=qparams, parse_dates=["ts_utc"])
+    # SQLite hands back naive UTC text; make both stores look the same from here on.
+    aligned["ts_utc"] = pd.to_datetime(aligned["ts_utc"], utc=True)
+    orphans["ts_utc"] = pd.to_datetime(orphans["ts_utc"], utc=True)
+
+    checked = aligned
+    if context is not None and not aligned.empty:
+        n_before, n_after = _context_sizes(params.corruption)
+        ctx_lo, ctx_hi = _utc(context[0]), _utc(context[1])
+        lo, hi = _utc(params.start_ts), _utc(params.end_ts)
+        tokens = sorted(aligned["token_id"].astype(str).unique())
+        extra = []
+        with stage("export.query"):
+            if n_before and lo is not None and (ctx_lo is None or ctx_lo < lo):
+                extra.append(_neighbours(engine, params, tokens, edge=lo, limit=ctx_lo, n=n_before, before=True))
+            if n_after and hi is not None and (ctx_hi is None or ctx_hi > hi or (end_exclusive and ctx_hi >= hi)):
+                extra.append(
+                    _neighbours(
+                        engine, params, tokens, edge=hi, limit=ctx_hi, n=n_after, before=False, edge_inclusive=end_exclusive
+                    )
+                )
+        extra = [f for f in extra if not f.empty]
+        if extra:
+            checked = pd.concat([aligned] + extra, ignore_index=True)
 
-    cadence_bad = cadence_flags(aligned, params.corruption)
+    with stage("export.checks"):
+        checks_bad = corruption_flags(checked, params.corruption)
 
-    corrupted = pd.concat([orphans, cadence_bad], ignore_index=True)
+    if checked is not aligned and not checks_bad.empty:
+        ts = pd.to_datetime(checks_bad["ts_utc"], utc=True)
+        keep = pd.Series(True, index=checks_bad.index)
+        if params.start_ts is not None:
+            keep &= ts >= _utc(params.start_ts)
+        if params.end_ts is not None:
+            keep &= (ts < _utc(params.end_ts)) if end_exclusive else (ts <= _utc(params.end_ts))
+        checks_bad = checks_bad[keep]
+
+    bad_parts = [f for f in (orphans, checks_bad) if not f.empty]
+    corrupted = pd.concat(bad_parts, ignore_index=True) if bad_parts else orphans
     if not corrupted.empty:
+        corrupted["ts_utc"] = pd.to_datetime(corrupted["ts_utc"], utc=True)
         corrupted = corrupted.drop_duplicates(subset=["token_id", "ts_utc", "reason"]).sort_values(["token_id", "ts_utc", "reason"])
 
     if not corrupted.empty and not aligned.empty:
@@ -172,9 +355,20 @@ def export_dataset(params: ExportParams) -> tuple[int, int]:
     else:
         clean = aligned
 
-    clean = flatten_top_levels(clean, params.top_n_flatten)
+    with stage("export.flatten"):
+        clean = flatten_top_levels(clean, params.top_n_flatten)
+    return clean, corrupted
+
+
+def export_dataset(params: ExportParams) -> tuple[int, int]:
+    engine = _engine_for(params.dsn)
+    try:
+        clean, corrupted = export_frames(engine, params)
+    finally:
+        engine.dispose()
 
-    clean.to_csv(params.out_clean, index=False)
-    corrupted.to_csv(params.out_corrupted, index=False)
+    with stage("export.write"):
+        clean.to_csv(params.out_clean, index=False)
+        corrupted.to_csv(params.out_corrupted, index=False)
 
-    return len(clean), len(corrupted)
\ No newline at end of file
+    return len(clean), len(corrupted)
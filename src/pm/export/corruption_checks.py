@@ -1,34 +1,168 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Optional
+from typing import Any, List, Optional
 
+import numpy as np
 import pandas as pd
 
+from pm.export.levels import level_arrays
+from pm.profiling import stage
+
+
+_COLUMNS = ["token_id", "ts_utc", "reason"]
+
 
 @dataclass(frozen=True)
 class CorruptionConfig:
     expected_seconds: Optional[float] = None
     tolerance_seconds: float = 0.5
 
+    # check switches
+    check_cadence: bool = True
+    check_crossed: bool = True            # best bid >= best ask
+    check_monotonic: bool = True          # level prices not sorted on a side
+    check_price_range: bool = True        # any price outside [0, 1]
+    frozen_polls: int = 0                 # >0: flag runs of K identical top-N books
+    frozen_top_n: int = 5
 
-def cadence_flags(aligned: pd.DataFrame, cfg: CorruptionConfig) -> pd.DataFrame:
-    if aligned.empty:
-        return pd.DataFrame(columns=["token_id", "ts_utc", "reason"])
+    # how many stored levels the level-based checks look at
+    check_levels: int = 10
+
+
+def _empty() -> pd.DataFrame:
+    return pd.DataFrame(columns=_COLUMNS)
+
+
+def _select(df: pd.DataFrame, mask: np.ndarray, reason: Any) -> pd.DataFrame:
+    return df.loc[mask, ["token_id", "ts_utc"]].assign(reason=reason)
 
-    df = aligned[["token_id", "ts_utc"]].copy()
-    df = df.sort_values(["token_id", "ts_utc"])
-    df["prev_ts"] = df.groupby("token_id")["ts_utc"].shift(1)
-    df["delta_s"] = (df["ts_utc"] - df["prev_ts"]).dt.total_seconds()
 
-    bad = []
-    m0 = df["delta_s"].notna() & (df["delta_s"] <= 0)
-    for _, r in df[m0].iterrows():
-        bad.append({"token_id": r["token_id"], "ts_utc": r["ts_utc"], "reason": "non_positive_delta"})
+def _cadence(df: pd.DataFrame, cfg: CorruptionConfig) -> List[pd.DataFrame]:
+    same_token = df["token_id"].eq(df["token_id"].shift(1)).to_numpy()
+    delta_s = df["ts_utc"].diff().dt.total_seconds().to_numpy()
+    delta_s = np.where(same_token, delta_s, np.nan)
+    has_prev = ~np.isnan(delta_s)
+
+    out = [_select(df, has_prev & (delta_s <= 0), "non_positive_delta")]
 
     if cfg.expected_seconds and cfg.expected_seconds > 0:
-        m1 = df["delta_s"].notna() & (df["delta_s"] > 0) & ((df["delta_s"] - cfg.expected_seconds).abs() > cfg.tolerance_seconds)
-        for _, r in df[m1].iterrows():
-            bad.append({"token_id": r["token_id"], "ts_utc": r["ts_utc"], "reason": f"off_grid_delta:{r['delta_s']:.3f}s"})
+        m1 = has_prev & (delta_s > 0) & (np.abs(delta_s - cfg.expected_seconds) > cfg.tolerance_seconds)
+        if m1.any():
+            reasons = "off_grid_delta:" + pd.Series(delta_s[m1]).map("{:.3f}s".format).to_numpy()
+            out.append(_select(df, m1, reasons))
+    return out
+
+
+def _as_float(df: pd.DataFrame, col: str) -> np.ndarray:
+    if col not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)
+
+
+def _crossed(df: pd.DataFrame, bid_px: np.ndarray, ask_px: np.ndarray) -> List[pd.DataFrame]:
+    # Take the best price from both the stored best columns and the ladders so the
+    # check doesn't depend on which end of the ladder the API called "best".
+    top_bid = np.fmax(_as_float(df, "best_bid_price"), np.nanmax(bid_px, axis=1, initial=-np.inf))
+    top_ask = np.fmin(_as_float(df, "best_ask_price"), np.nanmin(ask_px, axis=1, initial=np.inf))
+    m = np.isfinite(top_bid) & np.isfinite(top_ask) & (top_bid >= top_ask)
+    return [_select(df, m, "crossed_book")]
+
+
+def _non_monotonic(df: pd.DataFrame, bid_px: np.ndarray, ask_px: np.ndarray) -> List[pd.DataFrame]:
+    out = []
+    for side, px in (("bid", bid_px), ("ask", ask_px)):
+        if px.shape[1] < 2:
+            continue
+        d = np.diff(px, axis=1)
+        valid = ~np.isnan(d)
+        # A ladder may be sorted either way; it is corrupt if it goes both ways.
+        up = (valid & (d > 0)).any(axis=1)
+        down = (valid & (d < 0)).any(axis=1)
+        out.append(_select(df, up & down, f"non_monotonic_{side}_levels"))
+    return out
+
+
+def _price_range(df: pd.DataFrame, bid_px: np.ndarray, ask_px: np.ndarray) -> List[pd.DataFrame]:
+    cols = [
+        _as_float(df, "best_bid_price")[:, None],
+        _as_float(df, "best_ask_price")[:, None],
+        bid_px,
+        ask_px,
+    ]
+    allpx = np.concatenate(cols, axis=1)
+    m = ((allpx < 0.0) | (allpx > 1.0)).any(axis=1)
+    return [_select(df, m, "price_out_of_range")]
 
-    return pd.DataFrame(bad, columns=["token_id", "ts_utc", "reason"])
\ No newline at end of file
+
+def _frozen(df: pd.DataFrame, cfg: CorruptionConfig, bid_px, bid_sz, ask_px, ask_sz) -> List[pd.DataFrame]:
+    n = max(1, min(cfg.frozen_top_n, bid_px.shape[1]))
+    book = np.concatenate([bid_px[:, :n], bid_sz[:, :n], ask_px[:, :n], ask_sz[:, :n]], axis=1)
+    h = pd.util.hash_pandas_object(pd.DataFrame(book), index=False).to_numpy()
+
+    token = df["token_id"].to_numpy()
+    new_run = np.ones(len(df), dtype=bool)
+    new_run[1:] = (h[1:] != h[:-1]) | (token[1:] != token[:-1])
+    run_id = np.cumsum(new_run)
+    run_len = np.bincount(run_id)[run_id]
+
+    # An empty book repeating is a quiet market, not a stuck feed.
+    has_levels = ~np.isnan(book).all(axis=1)
+    m = has_levels & (run_len >= cfg.frozen_polls)
+    return [_select(df, m, f"frozen_book:{cfg.frozen_polls}")]
+
+
+def corruption_flags(aligned: pd.DataFrame, cfg: CorruptionConfig) -> pd.DataFrame:
+    """
+    Run every enabled check as a vectorized mask over `aligned` and return one
+    (token_id, ts_utc, reason) row per failed check. Under `pm --profile` each
+    check (and level parsing) is timed as an `export.check.<name>` stage.
+    """
+    if aligned.empty:
+        return _empty()
+
+    def _timed(name: str, fn, *a) -> Any:
+        with stage("export.check." + name):
+            return fn(*a)
+
+    df = aligned.sort_values(["token_id", "ts_utc"], kind="stable").reset_index(drop=True)
+    parts: List[pd.DataFrame] = []
+
+    if cfg.check_cadence:
+        parts += _timed("cadence", _cadence, df, cfg)
+
+    need_levels = cfg.check_crossed or cfg.check_monotonic or cfg.check_price_range or cfg.frozen_polls > 0
+    if need_levels:
+        depth = max(cfg.check_levels, cfg.frozen_top_n if cfg.frozen_polls > 0 else 0)
+
+        def _parse():
+            bids = df["bids_top_n_json"] if "bids_top_n_json" in df.columns else [None] * len(df)
+            asks = df["asks_top_n_json"] if "asks_top_n_json" in df.columns else [None] * len(df)
+            return level_arrays(bids, depth) + level_arrays(asks, depth)
+
+        bid_px, bid_sz, ask_px, ask_sz = _timed("parse_levels", _parse)
+
+        if cfg.check_crossed:
+            parts += _timed("crossed", _crossed, df, bid_px, ask_px)
+        if cfg.check_monotonic:
+            parts += _timed("monotonic", _non_monotonic, df, bid_px, ask_px)
+        if cfg.check_price_range:
+            parts += _timed("price_range", _price_range, df, bid_px, ask_px)
+        if cfg.frozen_polls > 0:
+            parts += _timed("frozen", _frozen, df, cfg, bid_px, bid_sz, ask_px, ask_sz)
+
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return _empty()
+    return pd.concat(parts, ignore_index=True)[_COLUMNS]
+
+
+def cadence_flags(aligned: pd.DataFrame, cfg: CorruptionConfig) -> pd.DataFrame:
+    """Cadence-only view of `corruption_flags` (non-positive and off-grid deltas)."""
+    if aligned.empty:
+        return _empty()
+    df = aligned[["token_id", "ts_utc"]].sort_values(["token_id", "ts_utc"], kind="stable").reset_index(drop=True)
+    parts = [p for p in _cadence(df, cfg) if not p.empty]
+    if not parts:
+        return _empty()
+    return pd.concat(parts, ignore_index=True)[_COLUMNS]
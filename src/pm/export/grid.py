@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+from dataclasses import replace
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from pm.export.clean_export import ExportParams, _engine_for, export_frames
+from pm.export.partitioned import export_bounds, list_tokens
+
+
+_VALUE_COLUMNS = [
+    "market_id",
+    "best_bid_price", "best_bid_size", "best_ask_price", "best_ask_size",
+    "spread", "mid", "microprice", "imbalance_l1",
+    "bid_depth_top_n", "ask_depth_top_n",
+    "seconds_to_expiry", "hours_to_expiry",
+]
+
+
+def _grid_columns(top_n_flatten: int) -> List[str]:
+    cols = ["ts_utc", "token_id"] + _VALUE_COLUMNS
+    for i in range(1, max(0, top_n_flatten) + 1):
+        cols += [f"bid_px_{i}", f"bid_sz_{i}", f"ask_px_{i}", f"ask_sz_{i}"]
+    return cols + ["source_ts_utc", "staleness_s"]
+
+
+def _ns(s: pd.Series) -> pd.Series:
+    # merge_asof needs identical key dtypes; DB reads may come back in us resolution.
+    return pd.to_datetime(s, utc=True).dt.as_unit("ns")
+
+
+def resample_asof(
+    clean: pd.DataFrame,
+    tokens: List[str],
+    times: pd.DatetimeIndex,
+    max_age: pd.Timedelta,
+    columns: List[str],
+) -> pd.DataFrame:
+    """
+    As-of join every (token, grid time) to the latest clean row at or before it,
+    at most `max_age` old. One sorted merge covers all tokens (`by="token_id"`).
+    """
+    grid = pd.DataFrame(
+        {
+            "ts_utc": np.tile(times.as_unit("ns").to_numpy(), len(tokens)),
+            "token_id": np.repeat(np.asarray(tokens, dtype=object), len(times)),
+        }
+    )
+    grid["ts_utc"] = _ns(grid["ts_utc"])
+    grid = grid.sort_values(["ts_utc", "token_id"], kind="stable").reset_index(drop=True)
+
+    if clean.empty:
+        return grid.reindex(columns=columns)
+
+    src = clean.drop(columns=[c for c in ("bids_top_n_json", "asks_top_n_json", "extra_features_json") if c in clean.columns])
+    src = src.assign(token_id=src["token_id"].astype(str), ts_utc=_ns(src["ts_utc"]))
+    src["source_ts_utc"] = src["ts_utc"]
+    src = src.sort_values("ts_utc", kind="stable")
+
+    out = pd.merge_asof(
+        grid,
+        src,
+        on="ts_utc",
+        by="token_id",
+        direction="backward",
+        tolerance=max_age,
+        allow_exact_matches=True,
+    )
+    out["staleness_s"] = (out["ts_utc"] - out["source_ts_utc"]).dt.total_seconds()
+    # Unfilled ticks are NaN; keep ids integral instead of letting them go float.
+    out["market_id"] = out["market_id"].astype("Int64")
+    return out.reindex(columns=columns)
+
+
+def export_grid(
+    params: ExportParams,
+    *,
+    freq: str,
+    max_age: Optional[str] = None,
+    chunk: str = "1h",
+) -> tuple[int, int]:
+    """
+    Export a fixed-frequency, forward-filled panel (one row per token per grid tick).
+
+    The range is processed in `chunk`-sized windows so long exports stream to disk.
+    Each window reads `max_age` of history before its first tick so forward-fill is
+    continuous across window edges. Corrupted rows are excluded before filling and
+    written to `out_corrupted` once each.
+
+    Returns (grid_rows, corrupted_rows).
+    """
+    step = pd.Timedelta(freq)
+    if step <= pd.Timedelta(0):
+        raise ValueError(f"grid frequency must be positive, got {freq!r}")
+    age = pd.Timedelta(max_age) if max_age else step * 10
+    window = max(pd.Timedelta(chunk), step)
+
+    columns = _grid_columns(params.top_n_flatten)
+    tokens = list_tokens(params)
+    lo, hi = export_bounds(params)
+
+    if not tokens or lo is None or hi is None:
+        pd.DataFrame(columns=columns).to_csv(params.out_clean, index=False)
+        pd.DataFrame(columns=["token_id", "ts_utc", "reason"]).to_csv(params.out_corrupted, index=False)
+        return 0, 0
+
+    first_tick = pd.Timestamp(lo).ceil(step)
+    last_tick = pd.Timestamp(hi).floor(step)
+
+    grid_n = 0
+    bad_n = 0
+    wrote_header = False
+    engine = _engine_for(params.dsn)
+    try:
+        t0 = first_tick
+        while t0 <= last_tick:
+            times = pd.date_range(t0, min(t0 + window - step, last_tick), freq=step)
+            t1 = times[-1]
+
+            # The last window reads on to the range end so rows after the final
+            # tick are still checked and reported.
+            end = hi if t1 >= last_tick else t1.to_pydatetime()
+            p = replace(params, start_ts=(t0 - age).to_pydatetime(), end_ts=end)
+            clean, corrupted = export_frames(engine, p, context=(params.start_ts, params.end_ts))
+
+            panel = resample_asof(clean, tokens, times, age, columns)
+
+            # Each raw row belongs to exactly one window: (previous tick, last tick].
+            if not corrupted.empty:
+                corrupted = corrupted[_ns(corrupted["ts_utc"]) > t0 - step]
+
+            mode = "a" if wrote_header else "w"
+            panel.to_csv(params.out_clean, mode=mode, header=not wrote_header, index=False)
+            corrupted.to_csv(params.out_corrupted, mode=mode, header=not wrote_header, index=False)
+            wrote_header = True
+
+            grid_n += len(panel)
+            bad_n += len(corrupted)
+            t0 = t1 + step
+    finally:
+        engine.dispose()
+
+    if not wrote_header:
+        pd.DataFrame(columns=columns).to_csv(params.out_clean, index=False)
+        pd.DataFrame(columns=["token_id", "ts_utc", "reason"]).to_csv(params.out_corrupted, index=False)
+
+    return grid_n, bad_n
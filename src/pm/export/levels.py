@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Iterable
+
+import numpy as np
+
+
+def _ensure_levels(v: Any) -> list[list[float]]:
+    if v is None:
+        return []
+    if isinstance(v, str):
+        try:
+            v = json.loads(v)
+        except Exception:
+            return []
+    if not isinstance(v, list):
+        return []
+    out = []
+    for item in v:
+        if isinstance(item, (list, tuple)) and len(item) >= 2:
+            try:
+                out.append([float(item[0]), float(item[1])])
+            except Exception:
+                pass
+        elif isinstance(item, dict):
+            try:
+                out.append([float(item.get("price")), float(item.get("size"))])
+            except Exception:
+                pass
+    return out
+
+
+def level_arrays(values: Iterable[Any], depth: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Parse a column of level lists (JSONB / JSON text) into two (rows, depth)
+    float arrays of prices and sizes, NaN-padded. This is the only per-row Python
+    step; everything downstream works on the arrays.
+    """
+    values = list(values)
+    px = np.full((len(values), max(0, depth)), np.nan)
+    sz = np.full((len(values), max(0, depth)), np.nan)
+    if depth <= 0:
+        return px, sz
+
+    for i, v in enumerate(values):
+        lv = _ensure_levels(v)[:depth]
+        if lv:
+            a = np.asarray(lv, dtype=float)
+            px[i, : len(lv)] = a[:, 0]
+            sz[i, : len(lv)] = a[:, 1]
+    return px, sz
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from sqlalchemy import text
+
+from pm.export.clean_export import ExportParams, _build_where, _engine_for, _utc, export_frames
+
+
+_TOKENS_SQL_BASE = """
+SELECT token_id FROM orderbook_snapshots {where}
+UNION
+SELECT token_id FROM features_orderbook {where}
+"""
+
+# Both tables: feature rows without a snapshot are still exported (as orphans).
+_BOUNDS_SQL_BASE = """
+SELECT MIN(lo) AS lo, MAX(hi) AS hi
+FROM (
+  SELECT MIN(ts_utc) AS lo, MAX(ts_utc) AS hi FROM orderbook_snapshots {where}
+  UNION ALL
+  SELECT MIN(ts_utc) AS lo, MAX(ts_utc) AS hi FROM features_orderbook {where}
+) b
+"""
+
+
+@dataclass(frozen=True)
+class Partition:
+    """
+    One independent slice of an export.
+
+    Token partitions hold a contiguous run of the sorted token ids, so concatenating
+    their outputs in index order keeps rows grouped by token. Time partitions cover
+    [start_ts, end_ts) (the last one is closed); their checks also see each token's
+    neighbouring rows across the edges, so flags match a single-process export.
+    """
+    index: int
+    token_ids: Optional[List[str]] = None
+    start_ts: Optional[datetime] = None
+    end_ts: Optional[datetime] = None
+    end_exclusive: bool = False
+
+
+def list_tokens(params: ExportParams) -> List[str]:
+    """Sorted token ids that have snapshots or features in the export range."""
+    engine = _engine_for(params.dsn)
+    try:
+        where, qparams = _build_where(params.market_id, params.token_id, params.start_ts, params.end_ts)
+        with engine.connect() as conn:
+            rows = conn.execute(text(_TOKENS_SQL_BASE.format(where=where)), qparams).fetchall()
+    finally:
+        engine.dispose()
+    return sorted(str(r[0]) for r in rows)
+
+
+def export_bounds(params: ExportParams) -> tuple[Optional[datetime], Optional[datetime]]:
+    """
+    Requested [start, end], with open ends filled from the stored rows, as
+    tz-aware UTC datetimes whichever store they came from.
+    """
+    lo, hi = params.start_ts, params.end_ts
+    if lo is None or hi is None:
+        engine = _engine_for(params.dsn)
+        try:
+            where, qparams = _build_where(params.market_id, params.token_id, params.start_ts, params.end_ts)
+            with engine.connect() as conn:
+                row = conn.execute(text(_BOUNDS_SQL_BASE.format(where=where)), qparams).fetchone()
+        finally:
+            engine.dispose()
+        if row is None or row[0] is None:
+            return None, None
+        lo = lo if lo is not None else row[0]
+        hi = hi if hi is not None else row[1]
+    return _utc(lo), _utc(hi)
+
+
+def plan_token_partitions(params: ExportParams, workers: int) -> List[Partition]:
+    tokens = list_tokens(params)
+    if not tokens:
+        return []
+
+    n = max(1, min(workers, len(tokens)))
+    size, extra = divmod(len(tokens), n)
+    parts: List[Partition] = []
+    i = 0
+    for k in range(n):
+        j = i + size + (1 if k < extra else 0)
+        parts.append(Partition(index=k, token_ids=tokens[i:j]))
+        i = j
+    return parts
+
+
+def plan_time_partitions(params: ExportParams, workers: int) -> List[Partition]:
+    lo, hi = export_bounds(params)
+    if lo is None or hi is None:
+        return []
+
+    if hi <= lo:
+        return [Partition(index=0, start_ts=lo, end_ts=hi)]
+
+    n = max(1, workers)
+    step = (hi - lo) / n
+    parts: List[Partition] = []
+    for k in range(n):
+        a = lo + step * k
+        b = hi if k == n - 1 else lo + step * (k + 1)
+        parts.append(Partition(index=k, start_ts=a, end_ts=b, end_exclusive=k < n - 1))
+    return parts
+
+
+def _export_partition(params: ExportParams, part: Partition, out_dir: str) -> tuple[int, int]:
+    """Worker entrypoint: runs in its own process with its own engine/connection."""
+    p = params
+    context = None
+    if part.start_ts is not None or part.end_ts is not None:
+        p = replace(p, start_ts=part.start_ts, end_ts=part.end_ts)
+        context = (params.start_ts, params.end_ts)
+
+    engine = _engine_for(p.dsn)
+    try:
+        clean, corrupted = export_frames(
+            engine,
+            p,
+            token_ids=part.token_ids,
+            end_exclusive=part.end_exclusive,
+            context=context,
+        )
+    finally:
+        engine.dispose()
+
+    clean.to_csv(os.path.join(out_dir, f"clean-{part.index:05d}.csv"), index=False)
+    corrupted.to_csv(os.path.join(out_dir, f"corrupted-{part.index:05d}.csv"), index=False)
+    return len(clean), len(corrupted)
+
+
+def _concat_csv(parts: List[tuple[str, int]], out_path: str) -> None:
+    """
+    Concatenate part files in order, keeping a single header.
+
+    Empty parts are skipped because their header may lack the flattened level
+    columns; if every part is empty the first one is copied as-is.
+    """
+    non_empty = [fp for fp, n in parts if n > 0]
+    if not non_empty:
+        shutil.copyfile(parts[0][0], out_path)
+        return
+
+    with open(out_path, "wb") as out:
+        for k, fp in enumerate(non_empty):
+            with open(fp, "rb") as f:
+                if k > 0:
+                    f.readline()
+                shutil.copyfileobj(f, out, length=1 << 20)
+
+
+def export_dataset_partitioned(
+    params: ExportParams,
+    *,
+    workers: int,
+    partition_by: str = "token",
+) -> tuple[int, int]:
+    """
+    Export with a process pool, one partition per task.
+
+    Output is deterministic: part files are merged in partition order regardless
+    of which worker finished first.
+    """
+    if partition_by == "token":
+        parts = plan_token_partitions(params, workers)
+    elif partition_by == "time":
+        parts = plan_time_partitions(params, workers)
+    else:
+        raise ValueError(f"Unknown partition_by: {partition_by!r} (expected 'token' or 'time')")
+
+    if not parts:
+        parts = [Partition(index=0)]
+
+    out_dir = tempfile.mkdtemp(prefix="pm-export-", dir=str(Path(params.out_clean).resolve().parent))
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(parts)))) as pool:
+            futures = [pool.submit(_export_partition, params, part, out_dir) for part in parts]
+            counts = [f.result() for f in futures]
+
+        clean_parts = [(os.path.join(out_dir, f"clean-{p.index:05d}.csv"), c[0]) for p, c in zip(parts, counts)]
+        bad_parts = [(os.path.join(out_dir, f"corrupted-{p.index:05d}.csv"), c[1]) for p, c in zip(parts, counts)]
+        _concat_csv(clean_parts, params.out_clean)
+        _concat_csv(bad_parts, params.out_corrupted)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    return sum(c for c, _ in counts), sum(b for _, b in counts)
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import replace
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+from sqlalchemy import text
+
+from pm.export.clean_export import ExportParams, _build_where, _engine_for, export_frames
+from pm.export.grid import _grid_columns, _ns, resample_asof
+from pm.export.partitioned import export_bounds, list_tokens
+
+
+TENSOR_FORMAT = "pm-npy-tensor/1"
+
+FEATURE_COLUMNS = [
+    "spread", "mid", "microprice", "imbalance_l1",
+    "bid_depth_top_n", "ask_depth_top_n",
+    "seconds_to_expiry", "hours_to_expiry",
+]
+
+_TIMES_SQL_BASE = """
+SELECT DISTINCT ts_utc
+FROM orderbook_snapshots
+{where}
+ORDER BY ts_utc
+"""
+
+
+def _epoch_ns(s: pd.Series) -> np.ndarray:
+    return pd.DatetimeIndex(_ns(s)).asi8
+
+
+def _raw_times(params: ExportParams) -> np.ndarray:
+    """Distinct snapshot times in range as int64 ns. The collector stamps a whole sweep with one ts."""
+    engine = _engine_for(params.dsn)
+    try:
+        where, qparams = _build_where(params.market_id, params.token_id, params.start_ts, params.end_ts)
+        ts = pd.read_sql_query(text(_TIMES_SQL_BASE.format(where=where)), engine, params=qparams, parse_dates=["ts_utc"])
+    finally:
+        engine.dispose()
+    if ts.empty:
+        return np.empty(0, dtype=np.int64)
+    return _epoch_ns(ts["ts_utc"])
+
+
+def _levels(df: pd.DataFrame, side: str, kind: str, n: int) -> np.ndarray:
+    cols = [f"{side}_{kind}_{i}" for i in range(1, n + 1)]
+    return df.reindex(columns=cols).to_numpy(dtype=np.float32, na_value=np.nan)
+
+
+def export_tensor(
+    params: ExportParams,
+    *,
+    out_dir: str,
+    grid: Optional[str] = None,
+    grid_max_age: Optional[str] = None,
+    chunk: str = "1h",
+) -> tuple[int, int]:
+    """
+    Write the export as memory-mappable .npy arrays:
+
+      prices.npy    float32 (tokens, times, 2, levels)   side 0 = bid, 1 = ask
+      sizes.npy     float32 (tokens, times, 2, levels)
+      features.npy  float32 (tokens, times, len(features))
+      times.npy     int64   (times,)  ns since epoch, UTC, sorted
+      index.json    token_id/market_id -> row, feature names, shapes
+
+    The time axis is the distinct snapshot times in range, or the grid ticks when
+    `grid` is set (values are then as-of forward-filled, see pm.export.grid).
+    Missing cells are NaN. Arrays are filled window by window straight into the
+    memmaps, so the full tensor is never held in memory.
+
+    Returns (filled_cells, corrupted_rows); corrupted rows go to `out_corrupted`.
+    """
+    levels = max(0, params.top_n_flatten)
+    tokens = list_tokens(params)
+    lo, hi = export_bounds(params)
+
+    step: Optional[pd.Timedelta] = None
+    age: Optional[pd.Timedelta] = None
+    if grid:
+        step = pd.Timedelta(grid)
+        if step <= pd.Timedelta(0):
+            raise ValueError(f"grid frequency must be positive, got {grid!r}")
+        age = pd.Timedelta(grid_max_age) if grid_max_age else step * 10
+        if lo is None or hi is None:
+            times = np.empty(0, dtype=np.int64)
+        else:
+            ticks = pd.date_range(pd.Timestamp(lo).ceil(step), pd.Timestamp(hi).floor(step), freq=step)
+            times = ticks.as_unit("ns").asi8
+    else:
+        times = _raw_times(params)
+
+    features = FEATURE_COLUMNS + (["staleness_s"] if grid else [])
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, "times.npy"), times)
+
+    K, T = len(tokens), len(times)
+    prices = open_memmap(os.path.join(out_dir, "prices.npy"), mode="w+", dtype=np.float32, shape=(K, T, 2, levels))
+    sizes = open_memmap(os.path.join(out_dir, "sizes.npy"), mode="w+", dtype=np.float32, shape=(K, T, 2, levels))
+    feats = open_memmap(os.path.join(out_dir, "features.npy"), mode="w+", dtype=np.float32, shape=(K, T, len(features)))
+    prices[:] = np.nan
+    sizes[:] = np.nan
+    feats[:] = np.nan
+
+    token_index = pd.Index(tokens)
+    market_of: Dict[str, Any] = {}
+    cells = 0
+    bad_n = 0
+    wrote_header = False
+    window = pd.Timedelta(chunk)
+    if step is not None:
+        window = max(window, step)
+
+    engine = _engine_for(params.dsn)
+    try:
+        i = 0
+        while i < T:
+            t0 = pd.Timestamp(times[i], tz="UTC")
+            j = int(np.searchsorted(times, (t0 + window).value, side="left"))
+            j = max(j, i + 1)
+            t_last = pd.Timestamp(times[j - 1], tz="UTC")
+            # The last window reads on to the range end so rows after the final
+            # snapshot time / tick are still checked and reported.
+            w_hi = hi if j == T else t_last.to_pydatetime()
+
+            if step is not None:
+                p = replace(params, start_ts=(t0 - age).to_pydatetime(), end_ts=w_hi)
+                clean, corrupted = export_frames(engine, p, context=(params.start_ts, params.end_ts))
+                df = resample_asof(
+                    clean, tokens, pd.DatetimeIndex(times[i:j]).tz_localize("UTC"), age, _grid_columns(levels)
+                )
+                if not corrupted.empty:
+                    corrupted = corrupted[_ns(corrupted["ts_utc"]) > t0 - step]
+            else:
+                # Same assignment as grid mode: each raw row belongs to exactly one
+                # window, (previous window's last time, this window's last time], so
+                # orphans that fall between snapshot times aren't skipped.
+                p = replace(params, start_ts=lo if i == 0 else prev_last.to_pydatetime(), end_ts=w_hi)
+                clean, corrupted = export_frames(engine, p, context=(params.start_ts, params.end_ts))
+                if i > 0:
+                    clean = clean[clean["ts_utc"] > prev_last]
+                    if not corrupted.empty:
+                        corrupted = corrupted[_ns(corrupted["ts_utc"]) > prev_last]
+                df = clean
+            prev_last = t_last
+
+            if not df.empty:
+                rows = token_index.get_indexer(df["token_id"].astype(str))
+                cols = np.searchsorted(times, _epoch_ns(df["ts_utc"]))
+                ok = rows >= 0
+                if step is not None:
+                    # Grid rows always exist; only write ticks that found a source row.
+                    ok &= df["source_ts_utc"].notna().to_numpy()
+                rows, cols, df = rows[ok], cols[ok], df[ok]
+
+                if len(df):
+                    prices[rows, cols, 0, :] = _levels(df, "bid", "px", levels)
+                    prices[rows, cols, 1, :] = _levels(df, "ask", "px", levels)
+                    sizes[rows, cols, 0, :] = _levels(df, "bid", "sz", levels)
+                    sizes[rows, cols, 1, :] = _levels(df, "ask", "sz", levels)
+                    feats[rows, cols, :] = df.reindex(columns=features).to_numpy(dtype=np.float32, na_value=np.nan)
+                    cells += len(df)
+
+                    mk = df[["token_id", "market_id"]].dropna().drop_duplicates("token_id", keep="last")
+                    market_of.update(zip(mk["token_id"].astype(str), mk["market_id"]))
+
+            mode = "a" if wrote_header else "w"
+            corrupted.to_csv(params.out_corrupted, mode=mode, header=not wrote_header, index=False)
+            wrote_header = True
+            bad_n += len(corrupted)
+            i = j
+
+        if T == 0 and lo is not None:
+            # No snapshot times / ticks, but the range can still hold orphan rows.
+            _, corrupted = export_frames(engine, params)
+            corrupted.to_csv(params.out_corrupted, index=False)
+            wrote_header = True
+            bad_n += len(corrupted)
+    finally:
+        engine.dispose()
+        for a in (prices, sizes, feats):
+            a.flush()
+        del prices, sizes, feats
+
+    if not wrote_header:
+        pd.DataFrame(columns=["token_id", "ts_utc", "reason"]).to_csv(params.out_corrupted, index=False)
+
+    index = {
+        "format": TENSOR_FORMAT,
+        "dtype": "float32",
+        "shape": {"tokens": K, "times": T, "sides": 2, "levels": levels, "features": len(features)},
+        "arrays": {"prices": "prices.npy", "sizes": "sizes.npy", "features": "features.npy", "times": "times.npy"},
+        "time_unit": "ns since epoch, UTC",
+        "grid": grid,
+        "grid_max_age_s": age.total_seconds() if age is not None else None,
+        "sides": ["bid", "ask"],
+        "features": features,
+        "tokens": [
+            {
+                "row": k,
+                "token_id": tid,
+                "market_id": int(market_of[tid]) if tid in market_of else None,
+            }
+            for k, tid in enumerate(tokens)
+        ],
+    }
+    with open(os.path.join(out_dir, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+
+    return cells, bad_n
+
+
+def open_tensor(out_dir: str) -> Dict[str, Any]:
+    """
+    Open an npy-tensor export read-only. Arrays are np.memmap-backed, so slicing
+    only touches the pages it needs. Use np.searchsorted(out["times"], ts_ns) for
+    time offsets and out["rows"][token_id] for token rows.
+    """
+    with open(os.path.join(out_dir, "index.json"), encoding="utf-8") as f:
+        index = json.load(f)
+    if index.get("format") != TENSOR_FORMAT:
+        raise RuntimeError(f"Unsupported tensor format in {out_dir}: {index.get('format')!r}")
+
+    out: Dict[str, Any] = {"index": index}
+    for name, fn in index["arrays"].items():
+        out[name] = np.load(os.path.join(out_dir, fn), mmap_mode="r")
+    out["rows"] = {t["token_id"]: t["row"] for t in index["tokens"]}
+    return out
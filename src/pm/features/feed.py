@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+import psycopg
+from psycopg import sql
+from psycopg.rows import dict_row
+
+from pm.db import DB
+
+
+FEED_CHANNEL = "pm_features"
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more; stay clear of it.
+MAX_PAYLOAD_BYTES = 7900
+
+FETCH_SQL = """
+SELECT *
+FROM features_orderbook
+WHERE ts_utc = %(ts)s
+  AND token_id = ANY(%(token_ids)s)
+"""
+
+CATCH_UP_SQL = """
+SELECT *
+FROM features_orderbook
+WHERE ts_utc > %(since)s
+ORDER BY ts_utc, token_id
+LIMIT %(limit)s
+"""
+
+# Keyset on the (ts_utc, token_id) order, so a page that ends partway through a
+# sweep resumes at the next token instead of skipping the rest of that sweep.
+CATCH_UP_AFTER_SQL = """
+SELECT *
+FROM features_orderbook
+WHERE (ts_utc, token_id) > (%(since)s, %(token_id)s)
+ORDER BY ts_utc, token_id
+LIMIT %(limit)s
+"""
+
+
+# -----------------------
+# Payloads
+# -----------------------
+def encode_payloads(sweep: int, ts: datetime, token_ids: List[str]) -> List[str]:
+    """
+    Compact JSON notifications for one sweep:
+    {"sweep", "ts", "part", "parts", "tokens"}. Token ids are split across as
+    many parts as needed to keep each payload under MAX_PAYLOAD_BYTES.
+    """
+    head = {"sweep": sweep, "ts": ts.isoformat()}
+    budget = MAX_PAYLOAD_BYTES - len(json.dumps(head, separators=(",", ":"))) - 64
+    chunks: List[List[str]] = [[]]
+    used = 0
+    for tid in token_ids:
+        n = len(tid) + 3   # quotes + comma
+        if chunks[-1] and used + n > budget:
+            chunks.append([])
+            used = 0
+        chunks[-1].append(tid)
+        used += n
+    return [
+        json.dumps({**head, "part": i, "parts": len(chunks), "tokens": c}, separators=(",", ":"))
+        for i, c in enumerate(chunks)
+    ]
+
+
+@dataclass
+class FeedEvent:
+    sweep: int
+    ts: datetime
+    part: int
+    parts: int
+    token_ids: List[str]
+    rows: List[Dict[str, Any]] = field(default_factory=list)
+
+
+def decode_payload(payload: str) -> FeedEvent:
+    p = json.loads(payload)
+    return FeedEvent(
+        sweep=int(p["sweep"]),
+        ts=datetime.fromisoformat(p["ts"]),
+        part=int(p.get("part", 0)),
+        parts=int(p.get("parts", 1)),
+        token_ids=list(p.get("tokens") or []),
+    )
+
+
+# -----------------------
+# Publisher (collector side)
+# -----------------------
+def notify_sweep(db: DB, *, sweep: int, ts: datetime, token_ids: List[str], channel: str = FEED_CHANNEL) -> int:
+    """
+    Announce a committed sweep. All parts go out in one transaction, so listeners
+    receive them together. Returns the number of notifications sent.
+    """
+    if not token_ids:
+        return 0
+    payloads = encode_payloads(sweep, ts, token_ids)
+    db.execute_batch((("SELECT pg_notify(%s, %s)", (channel, p)) for p in payloads), prepare=False)
+    return len(payloads)
+
+
+# -----------------------
+# Subscriber
+# -----------------------
+class FeatureSubscriber:
+    """
+    LISTENs on the feed channel and fetches each announced sweep's feature rows
+    by primary key (token_id, ts_utc), instead of polling with ts_utc > last_seen.
+
+        sub = FeatureSubscriber(dsn)
+        for ev in sub.events():
+            handle(ev.rows)
+
+    Notifications are not queued while disconnected: after (re)connecting, read
+    anything committed in between page by page:
+
+        rows = sub.catch_up(sub.last_ts)
+        while rows:
+            handle(rows)
+            rows = sub.catch_up(sub.last_ts, after_token=sub.last_token)
+    """
+
+    def __init__(self, dsn: str, *, channel: str = FEED_CHANNEL):
+        self.dsn = dsn
+        self.channel = channel
+        self.conn = psycopg.connect(dsn, autocommit=True, row_factory=dict_row)
+        self.conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel)))
+        self.last_ts: Optional[datetime] = None
+        # Token of the last row read at last_ts; None once all of last_ts is read.
+        self.last_token: Optional[str] = None
+
+    def fetch(self, ts: datetime, token_ids: List[str]) -> List[Dict[str, Any]]:
+        with self.conn.cursor() as cur:
+            cur.execute(FETCH_SQL, {"ts": ts, "token_ids": token_ids})
+            return cur.fetchall()
+
+    def catch_up(
+        self, since: datetime, *, after_token: Optional[str] = None, limit: int = 100_000
+    ) -> List[Dict[str, Any]]:
+        """
+        Up to `limit` rows in (ts_utc, token_id) order: those after `since`, or,
+        with `after_token`, those after (since, after_token). Pass back last_ts and
+        last_token for the next page; an empty page means caught up.
+        """
+        with self.conn.cursor() as cur:
+            if after_token is None:
+                cur.execute(CATCH_UP_SQL, {"since": since, "limit": limit})
+            else:
+                cur.execute(CATCH_UP_AFTER_SQL, {"since": since, "token_id": after_token, "limit": limit})
+            rows = cur.fetchall()
+        if rows:
+            self.last_ts = rows[-1]["ts_utc"]
+            self.last_token = rows[-1]["token_id"]
+        return rows
+
+    def poll(self, timeout: Optional[float] = None, *, fetch: bool = True) -> List[FeedEvent]:
+        """Wait up to `timeout` seconds (None = forever) for notifications; return them all."""
+        # The connection can't run queries while notifies() is iterating, so
+        # collect first, then fetch.
+        got = list(self.conn.notifies(timeout=timeout, stop_after=1))
+        if got:
+            got += list(self.conn.notifies(timeout=0))
+        events = [decode_payload(n.payload) for n in got]
+        for ev in events:
+            if fetch:
+                ev.rows = self.fetch(ev.ts, ev.token_ids)
+            if self.last_ts is None or ev.ts > self.last_ts:
+                self.last_ts = ev.ts
+                self.last_token = None
+        return events
+
+    def events(self, *, fetch: bool = True) -> Iterator[FeedEvent]:
+        while True:
+            yield from self.poll(None, fetch=fetch)
+
+    def close(self) -> None:
+        self.conn.close()
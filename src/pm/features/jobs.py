@@ -1,8 +1,10 @@
 from __future__ import annotations
 
+import json
 from datetime import datetime
-from typing import Optional, Any, Dict, List
+from typing import Optional, Any, Dict, List, Tuple
 
+import psycopg
 from psycopg.types.json import Json
 
 from pm.clob.collect_books import Snapshot
@@ -47,6 +49,77 @@ ON CONFLICT (token_id, ts_utc) DO UPDATE SET
   inserted_at         = EXCLUDED.inserted_at
 """
 
+# One statement per sweep: parallel arrays unnested into rows. The WHERE keeps a
+# late (replayed or out-of-order) write from overwriting a newer book.
+LATEST_UPSERT_SQL = """
+INSERT INTO orderbook_latest (
+  token_id, market_id, ts_utc,
+  best_bid_price, best_bid_size, best_ask_price, best_ask_size,
+  bids_top_n_json, asks_top_n_json,
+  spread, mid, microprice, imbalance_l1,
+  bid_depth_top_n, ask_depth_top_n,
+  depth_bid_top5, depth_ask_top5, imbalance_top5,
+  seconds_to_expiry, hours_to_expiry, extra_features_json, updated_at
+)
+SELECT
+  u.token_id, u.market_id, u.ts_utc,
+  u.best_bid_price, u.best_bid_size, u.best_ask_price, u.best_ask_size,
+  u.bids_top_n_json::jsonb, u.asks_top_n_json::jsonb,
+  u.spread, u.mid, u.microprice, u.imbalance_l1,
+  u.bid_depth_top_n, u.ask_depth_top_n,
+  u.depth_bid_top5, u.depth_ask_top5, u.imbalance_top5,
+  u.seconds_to_expiry, u.hours_to_expiry, u.extra_features_json::jsonb, now()
+FROM unnest(
+  %(token_id)s::text[], %(market_id)s::bigint[], %(ts_utc)s::timestamptz[],
+  %(best_bid_price)s::float8[], %(best_bid_size)s::float8[],
+  %(best_ask_price)s::float8[], %(best_ask_size)s::float8[],
+  %(bids_top_n_json)s::text[], %(asks_top_n_json)s::text[],
+  %(spread)s::float8[], %(mid)s::float8[], %(microprice)s::float8[], %(imbalance_l1)s::float8[],
+  %(bid_depth_top_n)s::float8[], %(ask_depth_top_n)s::float8[],
+  %(depth_bid_top5)s::float8[], %(depth_ask_top5)s::float8[], %(imbalance_top5)s::float8[],
+  %(seconds_to_expiry)s::float8[], %(hours_to_expiry)s::float8[], %(extra_features_json)s::text[]
+) AS u(
+  token_id, market_id, ts_utc,
+  best_bid_price, best_bid_size, best_ask_price, best_ask_size,
+  bids_top_n_json, asks_top_n_json,
+  spread, mid, microprice, imbalance_l1,
+  bid_depth_top_n, ask_depth_top_n,
+  depth_bid_top5, depth_ask_top5, imbalance_top5,
+  seconds_to_expiry, hours_to_expiry, extra_features_json
+)
+ON CONFLICT (token_id) DO UPDATE SET
+  market_id           = EXCLUDED.market_id,
+  ts_utc              = EXCLUDED.ts_utc,
+  best_bid_price      = EXCLUDED.best_bid_price,
+  best_bid_size       = EXCLUDED.best_bid_size,
+  best_ask_price      = EXCLUDED.best_ask_price,
+  best_ask_size       = EXCLUDED.best_ask_size,
+  bids_top_n_json     = EXCLUDED.bids_top_n_json,
+  asks_top_n_json     = EXCLUDED.asks_top_n_json,
+  spread              = EXCLUDED.spread,
+  mid                 = EXCLUDED.mid,
+  microprice          = EXCLUDED.microprice,
+  imbalance_l1        = EXCLUDED.imbalance_l1,
+  bid_depth_top_n     = EXCLUDED.bid_depth_top_n,
+  ask_depth_top_n     = EXCLUDED.ask_depth_top_n,
+  depth_bid_top5      = EXCLUDED.depth_bid_top5,
+  depth_ask_top5      = EXCLUDED.depth_ask_top5,
+  imbalance_top5      = EXCLUDED.imbalance_top5,
+  seconds_to_expiry   = EXCLUDED.seconds_to_expiry,
+  hours_to_expiry     = EXCLUDED.hours_to_expiry,
+  extra_features_json = EXCLUDED.extra_features_json,
+  updated_at          = EXCLUDED.updated_at
+WHERE orderbook_latest.ts_utc <= EXCLUDED.ts_utc
+"""
+
+# Feature columns carried into orderbook_latest, in table order.
+LATEST_FEATURE_COLUMNS = (
+    "spread", "mid", "microprice", "imbalance_l1",
+    "bid_depth_top_n", "ask_depth_top_n",
+    "depth_bid_top5", "depth_ask_top5", "imbalance_top5",
+    "seconds_to_expiry", "hours_to_expiry",
+)
+
 
 def _sum_top_levels(levels: Any, n: int) -> float:
     """
@@ -74,14 +147,16 @@ def _safe_float(x: Any) -> Optional[float]:
         return None
 
 
-def insert_snapshot_and_features(
-    db: DB,
+def feature_row(
     *,
-    market_id: Optional[int],
     ts: datetime,
     snapshot: Snapshot,
     end_time: Optional[datetime],
-) -> None:
+) -> Dict[str, Any]:
+    """
+    Feature values for one snapshot, keyed by features_orderbook column.
+    This is the single feature path: the collector writes it, replay re-runs it.
+    """
     # Keep using your existing feature computation (spread, imbalance_l1, expiry, etc.)
     feats = compute_features(
         ts=ts,
@@ -132,46 +207,170 @@ def insert_snapshot_and_features(
         }
     )
 
+    return {
+        "spread": feats.spread,
+        "mid": mid,
+        "microprice": microprice,
+        "imbalance_l1": feats.imbalance_l1,
+        "bid_depth_top_n": feats.bid_depth_top_n,
+        "ask_depth_top_n": feats.ask_depth_top_n,
+        "depth_bid_top5": depth_bid_top5,
+        "depth_ask_top5": depth_ask_top5,
+        "imbalance_top5": imbalance_top5,
+        "seconds_to_expiry": feats.seconds_to_expiry,
+        "hours_to_expiry": feats.hours_to_expiry,
+        "extra_features_json": extra,
+    }
+
+
+def snapshot_statements(
+    *,
+    market_id: Optional[int],
+    ts: datetime,
+    snapshot: Snapshot,
+    end_time: Optional[datetime],
+    features: Optional[Dict[str, Any]] = None,
+) -> List[Tuple[str, tuple]]:
+    """
+    (sql, params) for one snapshot and its feature row, ready for DB.execute_batch.
+    `features` is a precomputed feature_row; computed here when omitted.
+    """
+    f = features if features is not None else feature_row(ts=ts, snapshot=snapshot, end_time=end_time)
+
+    return [
+        # snapshots table (top-N levels are already stored)
+        (
+            SNAPSHOT_INSERT_SQL,
+            (
+                snapshot.token_id,
+                market_id,
+                ts,
+                snapshot.best_bid_price,
+                snapshot.best_bid_size,
+                snapshot.best_ask_price,
+                snapshot.best_ask_size,
+                Json(snapshot.bids_top),
+                Json(snapshot.asks_top),
+                Json(snapshot.raw_book),
+                ts,
+            ),
+        ),
+        # features table (use computed mid/microprice to match your formulas)
+        (
+            FEATURE_UPSERT_SQL,
+            (
+                snapshot.token_id,
+                market_id,
+                ts,
+                f["spread"],
+                f["mid"],
+                f["microprice"],
+                f["imbalance_l1"],
+                f["bid_depth_top_n"],
+                f["ask_depth_top_n"],
+                f["depth_bid_top5"],
+                f["depth_ask_top5"],
+                f["imbalance_top5"],
+                f["seconds_to_expiry"],
+                f["hours_to_expiry"],
+                Json(f["extra_features_json"]),
+                ts,
+            ),
+        ),
+    ]
+
+
+def insert_snapshots_and_features(db: DB, items: List[Dict[str, Any]]) -> int:
+    """
+    Write many snapshots (dicts of snapshot_statements kwargs) in one pipelined
+    transaction. Returns the number of snapshots written.
+
+    If the batch fails on a row's data (bad value, constraint violation), it is
+    retried one snapshot per transaction so the good rows still land; the bad
+    ones are reported and skipped. Connection errors are raised as before.
+    """
+    if not items:
+        return 0
+    try:
+        db.execute_batch(st for it in items for st in snapshot_statements(**it))
+        return len(items)
+    except (psycopg.DataError, psycopg.IntegrityError) as e:
+        if len(items) == 1:
+            print(f"[features] skipped token={items[0]['snapshot'].token_id} ts={items[0]['ts']} ({type(e).__name__}: {e})")
+            return 0
+        print(f"[features] batch of {len(items)} failed ({type(e).__name__}: {e}); retrying row by row")
+
+    written = 0
+    for it in items:
+        try:
+            db.execute_batch(snapshot_statements(**it))
+            written += 1
+        except (psycopg.DataError, psycopg.IntegrityError) as e:
+            print(f"[features] skipped token={it['snapshot'].token_id} ts={it['ts']} ({type(e).__name__}: {e})")
+    return written
+
+
+def latest_items(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Newest item per token with its feature_row filled in (item["features"]),
+    the input to orderbook_latest upserts. One ON CONFLICT statement cannot touch
+    the same row twice, so duplicates must go first.
+    """
+    newest: Dict[str, Dict[str, Any]] = {}
+    for it in items:
+        tid = it["snapshot"].token_id
+        cur = newest.get(tid)
+        if cur is None or it["ts"] >= cur["ts"]:
+            newest[tid] = it
+    out = []
+    for it in newest.values():
+        if it.get("features") is None:
+            it = dict(it, features=feature_row(ts=it["ts"], snapshot=it["snapshot"], end_time=it.get("end_time")))
+        out.append(it)
+    return out
+
+
+def upsert_latest(db: DB, items: List[Dict[str, Any]]) -> int:
+    """Upsert orderbook_latest from a sweep's items in one statement. Returns rows sent."""
+    rows = latest_items(items)
+    if not rows:
+        return 0
+    cols: Dict[str, List[Any]] = {
+        "token_id": [], "market_id": [], "ts_utc": [],
+        "best_bid_price": [], "best_bid_size": [], "best_ask_price": [], "best_ask_size": [],
+        "bids_top_n_json": [], "asks_top_n_json": [], "extra_features_json": [],
+    }
+    cols.update({c: [] for c in LATEST_FEATURE_COLUMNS})
+    for it in rows:
+        snap: Snapshot = it["snapshot"]
+        f = it["features"]
+        cols["token_id"].append(snap.token_id)
+        cols["market_id"].append(it.get("market_id"))
+        cols["ts_utc"].append(it["ts"])
+        cols["best_bid_price"].append(snap.best_bid_price)
+        cols["best_bid_size"].append(snap.best_bid_size)
+        cols["best_ask_price"].append(snap.best_ask_price)
+        cols["best_ask_size"].append(snap.best_ask_size)
+        cols["bids_top_n_json"].append(json.dumps(snap.bids_top))
+        cols["asks_top_n_json"].append(json.dumps(snap.asks_top))
+        cols["extra_features_json"].append(json.dumps(f["extra_features_json"]))
+        for c in LATEST_FEATURE_COLUMNS:
+            cols[c].append(f[c])
+
     with db.connection() as conn:
         with conn.cursor() as cur:
-            # snapshots table (top-N levels are already stored)
-            cur.execute(
-                SNAPSHOT_INSERT_SQL,
-                (
-                    snapshot.token_id,
-                    market_id,
-                    ts,
-                    snapshot.best_bid_price,
-                    snapshot.best_bid_size,
-                    snapshot.best_ask_price,
-                    snapshot.best_ask_size,
-                    Json(snapshot.bids_top),
-                    Json(snapshot.asks_top),
-                    Json(snapshot.raw_book),
-                    ts,
-                ),
-            )
-
-            # features table (use computed mid/microprice to match your formulas)
-            cur.execute(
-                FEATURE_UPSERT_SQL,
-                (
-                    snapshot.token_id,
-                    market_id,
-                    ts,
-                    feats.spread,
-                    mid,
-                    microprice,
-                    feats.imbalance_l1,
-                    feats.bid_depth_top_n,
-                    feats.ask_depth_top_n,
-                    depth_bid_top5,
-                    depth_ask_top5,
-                    imbalance_top5,
-                    feats.seconds_to_expiry,
-                    feats.hours_to_expiry,
-                    Json(extra),
-                    ts,
-                ),
-            )
-        conn.commit()
\ No newline at end of file
+            cur.execute(LATEST_UPSERT_SQL, cols)
+        conn.commit()
+    return len(rows)
+
+
+def insert_snapshot_and_features(
+    db: DB,
+    *,
+    market_id: Optional[int],
+    ts: datetime,
+    snapshot: Snapshot,
+    end_time: Optional[datetime],
+) -> None:
+    """Write one snapshot and its feature row in one transaction. Errors are raised."""
+    db.execute_batch(snapshot_statements(market_id=market_id, ts=ts, snapshot=snapshot, end_time=end_time))
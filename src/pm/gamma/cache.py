@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+from urllib.parse import urlencode
+
+
+# Longest matching path prefix wins. 0 disables caching for that endpoint.
+DEFAULT_TTLS: Dict[str, float] = {
+    "/events/slug/": 3600.0,
+    "/markets/": 300.0,
+    "/markets": 0.0,   # listings change constantly; ingest always wants them live
+}
+
+
+@dataclass
+class CacheEntry:
+    body: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+    fresh: bool
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    revalidated: int = 0   # 304 Not Modified
+    stores: int = 0
+    evictions: int = 0
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS http_cache (
+  key            TEXT PRIMARY KEY,
+  body           TEXT NOT NULL,
+  etag           TEXT,
+  last_modified  TEXT,
+  fetched_at     REAL NOT NULL,
+  accessed_at    REAL NOT NULL,
+  size           INTEGER NOT NULL
+)
+"""
+
+
+@dataclass
+class ResponseCache:
+    """
+    Persistent SQLite-backed response cache for GET requests.
+
+    Entries are fresh for the TTL of their endpoint (see DEFAULT_TTLS). Stale
+    entries are kept so the client can revalidate them with If-None-Match /
+    If-Modified-Since. Size is bounded by entry count and total body bytes;
+    least-recently-used entries are evicted first.
+    """
+    path: str
+    ttls: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_TTLS))
+    default_ttl: float = 0.0
+    max_entries: int = 10000
+    max_bytes: int = 256 * 1024 * 1024
+
+    def __post_init__(self):
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        parent = os.path.dirname(self.path)
+        if parent and self.path != ":memory:":
+            os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_http_cache_accessed ON http_cache (accessed_at)")
+        # Running totals, so puts don't rescan the table to decide on eviction.
+        self._entries, self._bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM http_cache"
+        ).fetchone()
+
+    def ttl_for(self, path: str) -> float:
+        best = None
+        for prefix in self.ttls:
+            if path.startswith(prefix) and (best is None or len(prefix) > len(best)):
+                best = prefix
+        return self.ttls[best] if best is not None else self.default_ttl
+
+    @staticmethod
+    def key(url: str, params: Optional[dict] = None) -> str:
+        if not params:
+            return url
+        return url + "?" + urlencode(sorted((str(k), str(v)) for k, v in params.items()))
+
+    def get(self, key: str, ttl: float) -> Optional[CacheEntry]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM http_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return None
+            self._conn.execute("UPDATE http_cache SET accessed_at = ? WHERE key = ?", (now, key))
+
+        body, etag, last_modified, fetched_at = row
+        fresh = (now - fetched_at) < ttl
+        if fresh:
+            self.stats.hits += 1
+        else:
+            self.stats.misses += 1
+        return CacheEntry(body=body, etag=etag, last_modified=last_modified, fetched_at=fetched_at, fresh=fresh)
+
+    def put(self, key: str, body: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM http_cache WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                """
+                INSERT INTO http_cache (key, body, etag, last_modified, fetched_at, accessed_at, size)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                  body = excluded.body,
+                  etag = excluded.etag,
+                  last_modified = excluded.last_modified,
+                  fetched_at = excluded.fetched_at,
+                  accessed_at = excluded.accessed_at,
+                  size = excluded.size
+                """,
+                (key, body, etag, last_modified, now, now, len(body)),
+            )
+            if old is None:
+                self._entries += 1
+            else:
+                self._bytes -= old[0]
+            self._bytes += len(body)
+            self.stats.stores += 1
+            self._evict()
+
+    def touch(self, key: str) -> None:
+        """Mark an entry as freshly validated (after a 304)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("UPDATE http_cache SET fetched_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+        self.stats.revalidated += 1
+
+    def _evict(self) -> None:
+        if self._entries <= self.max_entries and self._bytes <= self.max_bytes:
+            return
+        over_n = max(0, self._entries - self.max_entries)
+        over_bytes = max(0, self._bytes - self.max_bytes)
+        drop = []
+        freed = 0
+        for key, size in self._conn.execute("SELECT key, size FROM http_cache ORDER BY accessed_at ASC"):
+            if len(drop) >= over_n and freed >= over_bytes:
+                break
+            drop.append((key,))
+            freed += size
+        self._conn.executemany("DELETE FROM http_cache WHERE key = ?", drop)
+        self._entries -= len(drop)
+        self._bytes -= freed
+        self.stats.evictions += len(drop)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM http_cache")
+            self._entries = self._bytes = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def summary(self) -> Dict[str, Any]:
+        s = self.stats
+        total = s.hits + s.misses
+        return {
+            "hits": s.hits,
+            "misses": s.misses,
+            "revalidated": s.revalidated,
+            "stores": s.stores,
+            "evictions": s.evictions,
+            "hit_rate": (s.hits / total) if total else 0.0,
+        }
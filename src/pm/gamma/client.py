@@ -1,11 +1,15 @@
 from __future__ import annotations
 
+import json
 import time
 from dataclasses import dataclass
 from typing import Any, Dict, Optional
 
 import requests
 
+from pm.gamma.cache import ResponseCache
+from pm.profiling import stage
+
 
 @dataclass
 class GammaClient:
@@ -14,6 +18,7 @@ class GammaClient:
     timeout_s: int = 30
     retries: int = 3
     backoff_s: float = 0.7
+    cache: Optional[ResponseCache] = None
 
     def __post_init__(self):
         self.base = self.base.rstrip("/")
@@ -22,15 +27,51 @@ class GammaClient:
 
     def _get(self, path: str, params: Optional[dict] = None) -> Any:
         url = f"{self.base}{path}"
+        ttl = self.cache.ttl_for(path) if self.cache is not None else 0.0
+        if ttl <= 0:
+            return self._fetch(url, params)
+
+        key = self.cache.key(url, params)
+        entry = self.cache.get(key, ttl)
+        if entry is not None and entry.fresh:
+            return json.loads(entry.body)
+
+        headers: Dict[str, str] = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        r = self._fetch(url, params, headers=headers, raw=True)
+        if r.status_code == 304 and entry is not None:
+            self.cache.touch(key)
+            return json.loads(entry.body)
+
+        with stage("gamma.json"):
+            data = r.json()  # raises before a malformed body can reach the cache
+        self.cache.put(key, r.text, etag=r.headers.get("ETag"), last_modified=r.headers.get("Last-Modified"))
+        return data
+
+    def _fetch(self, url: str, params: Optional[dict] = None, *, headers: Optional[dict] = None, raw: bool = False) -> Any:
         last = None
         for i in range(self.retries):
             try:
-                r = self.sess.get(url, params=params, timeout=self.timeout_s)
+                with stage("gamma.http"):
+                    r = self.sess.get(url, params=params, headers=headers, timeout=self.timeout_s)
                 r.raise_for_status()
-                return r.json()
+                if raw:
+                    return r
+                with stage("gamma.json"):
+                    return r.json()
+            except requests.HTTPError as e:
+                code = e.response.status_code if e.response is not None else None
+                if code is not None and 400 <= code < 500 and code != 429:
+                    raise  # a 404 or bad request won't change on retry
+                last = e
             except Exception as e:
                 last = e
-                time.sleep(self.backoff_s * (2**i))
+            time.sleep(self.backoff_s * (2**i))
         raise last  # type: ignore
 
     def event_by_slug(self, slug: str) -> Dict[str, Any]:
@@ -1,4 +1,7 @@
 from __future__ import annotations
+import hashlib
+import json
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from typing import Any, Dict, List, Optional, Tuple
 from psycopg.types.json import Json
@@ -91,46 +94,221 @@ ON CONFLICT (market_id) DO UPDATE SET
 """
 
 
+def _should_store(nm: Dict[str, Any], now: datetime) -> bool:
+    end_time = nm["end_time"]
+
+    # Skip clearly stale markets (tune window as desired)
+    if end_time is not None and end_time < (now - timedelta(days=30)):
+        return False
+
+    # Skip closed/resolved if those flags exist
+    if nm["is_closed"] is True or nm["is_resolved"] is True:
+        return False
+    return True
+
+
 def upsert_markets(db: DB, markets: List[Dict[str, Any]]) -> int:
     ts = _now_utc()
-    n = 0
+    statements = []
+    for m in markets:
+        nm = normalize_market(m)
+        if not _should_store(nm, ts):
+            continue
+        statements.append(
+            (
+                UPSERT_SQL,
+                (
+                    nm["market_id"],
+                    nm["event_id"],
+                    nm["slug"],
+                    nm["question"],
+                    nm["condition_id"],
+                    nm["end_time"],
+                    nm["is_closed"],
+                    nm["is_resolved"],
+                    nm["is_active"],
+                    nm["category"],
+                    nm["volume_num"],
+                    nm["liquidity_num"],
+                    ts,
+                    Json(m),
+                ),
+            )
+        )
+    # One pipelined round trip per page instead of one per market.
+    return db.execute_batch(statements)
+
+
+_MARKET_COLUMNS = [
+    "market_id", "event_id", "slug", "question", "condition_id", "end_time",
+    "is_closed", "is_resolved", "is_active", "category", "volume_num", "liquidity_num",
+]
+
+STAGE_MARKETS_SQL = """
+CREATE TEMP TABLE _stg_markets (
+  market_id      BIGINT,
+  event_id       BIGINT,
+  slug           TEXT,
+  question       TEXT,
+  condition_id   TEXT,
+  end_time       TIMESTAMPTZ,
+  is_closed      BOOLEAN,
+  is_resolved    BOOLEAN,
+  is_active      BOOLEAN,
+  category       TEXT,
+  volume_num     DOUBLE PRECISION,
+  liquidity_num  DOUBLE PRECISION,
+  content_hash   TEXT,
+  raw_json       TEXT
+) ON COMMIT DROP
+"""
+
+# Rows whose hash matches are filtered by the DO UPDATE ... WHERE and return
+# nothing; xmax = 0 tells a fresh insert apart from an update.
+MERGE_MARKETS_SQL = """
+INSERT INTO markets (
+  market_id, event_id, slug, question, condition_id, end_time,
+  is_closed, is_resolved, is_active, category, volume_num, liquidity_num,
+  updated_at, raw_json, content_hash
+)
+SELECT
+  market_id, event_id, slug, question, condition_id, end_time,
+  is_closed, is_resolved, is_active, category, volume_num, liquidity_num,
+  %(ts)s, raw_json::jsonb, content_hash
+FROM _stg_markets
+ON CONFLICT (market_id) DO UPDATE SET
+  event_id      = EXCLUDED.event_id,
+  slug          = EXCLUDED.slug,
+  question      = EXCLUDED.question,
+  condition_id  = EXCLUDED.condition_id,
+  end_time      = EXCLUDED.end_time,
+  is_closed     = EXCLUDED.is_closed,
+  is_resolved   = EXCLUDED.is_resolved,
+  is_active     = EXCLUDED.is_active,
+  category      = EXCLUDED.category,
+  volume_num    = EXCLUDED.volume_num,
+  liquidity_num = EXCLUDED.liquidity_num,
+  updated_at    = EXCLUDED.updated_at,
+  raw_json      = EXCLUDED.raw_json,
+  content_hash  = EXCLUDED.content_hash
+WHERE markets.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+RETURNING (xmax = 0) AS inserted
+"""
+
+
+@dataclass
+class UpsertStats:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    skipped: int = 0   # filtered out (closed/resolved/stale)
+
+    def add(self, other: "UpsertStats") -> None:
+        self.inserted += other.inserted
+        self.updated += other.updated
+        self.unchanged += other.unchanged
+        self.skipped += other.skipped
+
+
+def _raw_text(m: Dict[str, Any]) -> str:
+    return json.dumps(m, sort_keys=True, separators=(",", ":"), default=str)
+
+
+# Trading activity and prices move on nearly every poll. Left in the hash, they
+# would make almost every market "changed" and the merge's skip would never fire.
+_VOLATILE_PREFIXES = ("volume", "liquidity", "oneHour", "oneDay", "oneWeek", "oneMonth", "oneYear")
+_VOLATILE_KEYS = frozenset({
+    "outcomePrices", "lastTradePrice", "bestBid", "bestAsk", "spread", "competitive", "score", "updatedAt",
+})
+# Hashed at two significant figures, so ranking inputs still refresh on real moves.
+_BUCKETED_COLUMNS = frozenset({"volume_num", "liquidity_num"})
+
+
+def _stable(v: Any) -> Any:
+    if isinstance(v, dict):
+        return {
+            k: _stable(x) for k, x in v.items()
+            if k not in _VOLATILE_KEYS and not k.startswith(_VOLATILE_PREFIXES)
+        }
+    if isinstance(v, list):
+        return [_stable(x) for x in v]
+    return v
+
+
+def market_content_hash(nm: Dict[str, Any], raw: Dict[str, Any]) -> str:
+    """
+    Fingerprint of what defines a market, not of its trading activity: the
+    normalized columns (volume/liquidity bucketed) plus the raw payload with
+    volatile keys removed, at any depth.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for c in _MARKET_COLUMNS:
+        v = nm[c]
+        if c in _BUCKETED_COLUMNS and v is not None:
+            v = float(f"{v:.2g}")
+        h.update((v.isoformat() if isinstance(v, datetime) else repr(v)).encode())
+        h.update(b"\x1f")
+    h.update(_raw_text(_stable(raw)).encode())
+    return h.hexdigest()
+
+
+def prepare_market_rows(markets: List[Dict[str, Any]], now: datetime) -> Tuple[Dict[int, tuple], int]:
+    """
+    Normalize, filter and fingerprint raw Gamma markets for the staging COPY.
+
+    Returns ({market_id: row}, skipped). Rows are in staging column order, with
+    content_hash at ROW_HASH. Duplicate ids keep the last payload, since one
+    statement can't touch a row twice.
+    """
+    rows: Dict[int, tuple] = {}
+    skipped = 0
+    for m in markets:
+        nm = normalize_market(m)
+        if not _should_store(nm, now):
+            skipped += 1
+            continue
+        rows[nm["market_id"]] = tuple(nm[c] for c in _MARKET_COLUMNS) + (market_content_hash(nm, m), _raw_text(m))
+    return rows, skipped
+
+
+ROW_HASH = len(_MARKET_COLUMNS)
+
+
+def merge_market_rows(db: DB, rows: Dict[int, tuple], ts: datetime) -> UpsertStats:
+    """COPY prepared rows into staging and merge them in one statement."""
+    stats = UpsertStats()
+    if not rows:
+        return stats
+
     with db.connection() as conn:
         with conn.cursor() as cur:
-            for m in markets:
-                nm = normalize_market(m)
-                
-                now = _now_utc()
-                end_time = nm["end_time"]
-
-                # Skip clearly stale markets (tune window as desired)
-                if end_time is not None and end_time < (now - timedelta(days=30)):
-                    continue
-
-                # Skip closed/resolved if those flags exist
-                if nm["is_closed"] is True or nm["is_resolved"] is True:
-                    continue
-                cur.execute(
-                    UPSERT_SQL,
-                    (
-                        nm["market_id"],
-                        nm["event_id"],
-                        nm["slug"],
-                        nm["question"],
-                        nm["condition_id"],
-                        nm["end_time"],
-                        nm["is_closed"],
-                        nm["is_resolved"],
-                        nm["is_active"],
-                        nm["category"],
-                        nm["volume_num"],
-                        nm["liquidity_num"],
-                        ts,
-                        Json(m),
-                    ),
-                )
-                n += 1
+            cur.execute(STAGE_MARKETS_SQL)
+            with cur.copy(
+                "COPY _stg_markets (" + ", ".join(_MARKET_COLUMNS) + ", content_hash, raw_json) FROM STDIN"
+            ) as cp:
+                for r in rows.values():
+                    cp.write_row(r)
+
+            cur.execute(MERGE_MARKETS_SQL, {"ts": ts})
+            changed = cur.fetchall()
         conn.commit()
-    return n
+
+    stats.inserted = sum(1 for r in changed if r["inserted"])
+    stats.updated = len(changed) - stats.inserted
+    stats.unchanged = len(rows) - len(changed)
+    return stats
+
+
+def upsert_markets_bulk(db: DB, markets: List[Dict[str, Any]]) -> UpsertStats:
+    """
+    Set-based upsert: COPY normalized rows into a temp staging table, then one
+    INSERT ... ON CONFLICT that only rewrites rows whose content hash changed.
+    """
+    ts = _now_utc()
+    rows, skipped = prepare_market_rows(markets, ts)
+    stats = merge_market_rows(db, rows, ts)
+    stats.skipped = skipped
+    return stats
 
 
 def extract_token_ids(market_raw: Dict[str, Any]) -> List[str]:
@@ -1,13 +1,22 @@
 from __future__ import annotations
 
+import heapq
+import queue
+import threading
 import time
-from datetime import datetime, timezone
-from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
 
 from pm.clob.client import ClobClient
 from pm.clob.collect_books import snapshot_from_book
 from pm.db import DB
-from pm.features.jobs import insert_snapshot_and_features
+from pm.features.jobs import feature_row
+from pm.metrics import CollectorMetrics, serve_metrics
+from pm.profiling import stage
+from pm.storage.base import StorageBackend
+from pm.storage.postgres import PostgresBackend
+from pm.storage.spool import Spool, SpoolingSink
 
 
 def _now() -> datetime:
@@ -19,108 +28,445 @@ def _chunks(xs: List[str], n: int):
         yield xs[i : i + n]
 
 
-def _get_tracked_tokens_and_end_times(db: DB) -> Tuple[Dict[str, int], Dict[int, Optional[datetime]]]:
+# -----------------------
+# Token universe
+# -----------------------
+class TokenUniverse:
     """
-    Returns:
-      token_id -> market_id
-      market_id -> end_time
+    In-memory map of tracked tokens, kept current by delta refresh.
+
+    refresh() only reads tracked markets whose tracking row or market row changed
+    since the last read, minus `lag_seconds` to cover transactions that
+    committed late. Applying a row is idempotent, so
+    the overlap is harmless. A full reload every `full_reload_seconds` is the
+    safety net for anything the delta could miss (e.g. deleted rows).
+
+    Markets whose end_time has already passed but aren't flagged ended yet are
+    never added; their ids collect in `expired` for the caller to flag, so they
+    don't come back with every sync that touches their market row.
     """
-    token_to_market: Dict[str, int] = {}
-    market_end: Dict[int, Optional[datetime]] = {}
-
-    with db.connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT DISTINCT
-                  tok.token_id AS token_id,
-                  m.market_id  AS market_id,
-                  m.end_time   AS end_time
-                FROM tracked_markets t
-                JOIN markets m ON m.market_id = t.market_id
-                CROSS JOIN LATERAL (
-                  SELECT jsonb_array_elements_text(
-                           CASE
-                             WHEN jsonb_typeof(m.raw_json->'clobTokenIds') = 'array'
-                               THEN m.raw_json->'clobTokenIds'
-                             WHEN jsonb_typeof(m.raw_json->'clobTokenIds') = 'string'
-                               THEN (m.raw_json->>'clobTokenIds')::jsonb
-                             ELSE '[]'::jsonb
-                           END
-                         ) AS token_id
-                ) tok
-                WHERE t.ended = false
-                """
-            )
-            rows = cur.fetchall()
 
-    for r in rows:
-        tid = str(r["token_id"])
-        mid = int(r["market_id"])
-        token_to_market[tid] = mid
-        market_end[mid] = r["end_time"]
+    def __init__(self, backend: StorageBackend, *, lag_seconds: float = 60.0, full_reload_seconds: float = 900.0):
+        self.backend = backend
+        self.lag_seconds = lag_seconds
+        self.full_reload_seconds = full_reload_seconds
+        self.token_to_market: Dict[str, int] = {}
+        self.market_end: Dict[int, Optional[datetime]] = {}
+        self.market_tokens: Dict[int, List[str]] = {}
+        self.expired: Set[int] = set()
+        self._since: Optional[datetime] = None
+        self._full_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self.token_to_market)
+
+    def token_ids(self) -> List[str]:
+        return list(self.token_to_market)
+
+    def add_market(self, market_id: int, end_time: Optional[datetime], token_ids: List[str]) -> None:
+        self.remove_market(market_id)
+        self.market_end[market_id] = end_time
+        self.market_tokens[market_id] = token_ids
+        for tid in token_ids:
+            self.token_to_market[tid] = market_id
+
+    def remove_market(self, market_id: int) -> bool:
+        toks = self.market_tokens.pop(market_id, None)
+        self.market_end.pop(market_id, None)
+        for tid in toks or ():
+            if self.token_to_market.get(tid) == market_id:
+                del self.token_to_market[tid]
+        return toks is not None
 
-    return token_to_market, market_end
+    def refresh(self) -> Tuple[int, int]:
+        """Returns (markets added or updated, markets removed)."""
+        return self.apply(*self.load())
+
+    def load(self) -> Tuple[bool, datetime, List[Dict[str, Any]]]:
+        """The DB half of refresh(): (full, read_at, rows). Touches no in-memory state."""
+        full = self._since is None or (time.monotonic() - self._full_at) >= self.full_reload_seconds
+        since = None if full else self._since - timedelta(seconds=self.lag_seconds)
+        read_at, rows = self.backend.load_universe(since)
+        return full, read_at, rows
+
+    def apply(self, full: bool, read_at: datetime, rows: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """The in-memory half of refresh(), for rows from load()."""
+        now = _now()
+        upserted = 0
+        removed = 0
+        if full:
+            live = {int(r["market_id"]) for r in rows}
+            for mid in list(self.market_tokens):
+                if mid not in live:
+                    removed += int(self.remove_market(mid))
+            self._full_at = time.monotonic()
+
+        for r in rows:
+            mid = int(r["market_id"])
+            if r["ended"]:
+                removed += int(self.remove_market(mid))
+                continue
+            if r["end_time"] is not None and r["end_time"] <= now:
+                removed += int(self.remove_market(mid))
+                self.expired.add(mid)
+                continue
+            toks = [str(t) for t in (r["token_ids"] or [])]
+            if self.market_tokens.get(mid) != toks or self.market_end.get(mid) != r["end_time"]:
+                self.add_market(mid, r["end_time"], toks)
+                upserted += 1
+
+        self._since = read_at
+        return upserted, removed
+
+
+# -----------------------
+# Market expiry
+# -----------------------
+class ExpiryTimers:
+    """
+    Min-heap of market end times. Re-setting a market leaves its old heap entry
+    behind; stale entries are skipped when popped.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int]] = []
+        self._end: Dict[int, datetime] = {}
+
+    def __len__(self) -> int:
+        return len(self._end)
+
+    def markets(self) -> Set[int]:
+        return set(self._end)
+
+    def set(self, market_id: int, end_time: Optional[datetime]) -> None:
+        if end_time is None:
+            self._end.pop(market_id, None)
+            return
+        if self._end.get(market_id) == end_time:
+            return
+        self._end[market_id] = end_time
+        heapq.heappush(self._heap, (end_time, market_id))
+
+    def discard(self, market_id: int) -> None:
+        self._end.pop(market_id, None)
+
+    def next_due(self) -> Optional[datetime]:
+        while self._heap and self._end.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_expired(self, now: datetime) -> List[int]:
+        out: List[int] = []
+        while self._heap and self._heap[0][0] <= now:
+            end, mid = heapq.heappop(self._heap)
+            if self._end.get(mid) == end:
+                del self._end[mid]
+                out.append(mid)
+        return out
+
+
+class EndedFlagger:
+    """
+    Background thread that marks expired markets ended in tracked_markets, in
+    batches, so the sweep never waits on the UPDATE. Failed batches are kept and
+    retried with the next one.
+    """
+
+    def __init__(self, backend: StorageBackend, *, linger_s: float = 1.0):
+        self.backend = backend
+        self.linger_s = linger_s
+        self.flagged = 0
+        self._q: "queue.Queue[Optional[List[int]]]" = queue.Queue()
+        self._t = threading.Thread(target=self._run, name="pm-ended-flagger", daemon=True)
+        self._t.start()
+
+    def submit(self, market_ids: Iterable[int]) -> None:
+        ids = [int(m) for m in market_ids]
+        if ids:
+            self._q.put(ids)
+
+    def close(self) -> None:
+        self._q.put(None)
+        self._t.join()
+
+    def _flush(self, pending: Set[int]) -> None:
+        if not pending:
+            return
+        try:
+            n = self.backend.flag_ended(sorted(pending), _now())
+        except Exception as e:
+            print(f"[collect][expiry] flag failed for {len(pending)} markets, will retry: {e}")
+            return
+        self.flagged += int(n)
+        pending.clear()
+
+    def _run(self) -> None:
+        pending: Set[int] = set()
+        while True:
+            try:
+                item = self._q.get(timeout=self.linger_s if pending else None)
+            except queue.Empty:
+                self._flush(pending)
+                continue
+            if item is None:
+                self._flush(pending)
+                return
+            pending.update(item)
+            # Coalesce whatever else expired meanwhile into the same UPDATE.
+            while True:
+                try:
+                    more = self._q.get_nowait()
+                except queue.Empty:
+                    break
+                if more is None:
+                    self._flush(pending)
+                    return
+                pending.update(more)
+            self._flush(pending)
+
+
+@dataclass(frozen=True)
+class SweepStats:
+    iteration: int
+    ts: datetime
+    seconds: float
+    tokens: int
+    fetched: int
+    inserted: int
+    skipped: int
+    errored: int
 
 
 def collect_orderbooks_loop(
     *,
-    db: DB,
+    db: Optional[DB] = None,
+    backend: Optional[StorageBackend] = None,
     clob: ClobClient,
     batch_size: int,
     top_n: int,
     loop_seconds: float,
     per_batch_sleep: float,
     iterations: int,  # 0=forever
+    spool_dir: Optional[str] = None,
+    spool_slow_seconds: float = 2.0,
+    ring_path: Optional[str] = None,
+    ring_depth: int = 64,
+    ring_max_tokens: int = 4096,
+    notify: bool = True,
+    metrics_port: int = 0,
+    metrics_addr: str = "127.0.0.1",
+    on_sweep: Optional[Callable[[SweepStats], None]] = None,
 ) -> None:
+    if backend is None:
+        if db is None:
+            raise ValueError("collect_orderbooks_loop needs db or backend")
+        backend = PostgresBackend(db)
+
     it = 0
     did_debug = False
 
-    while True:
-        it += 1
-        ts = _now()
+    # The universe is refreshed by delta each sweep; markets are dropped from it
+    # the moment their end_time passes and tracked_markets is flagged in the background.
+    universe = TokenUniverse(backend)
+    timers = ExpiryTimers()
+    flagger = EndedFlagger(backend)
+
+    # With a spool, sampling keeps its cadence through DB outages and stalls.
+    sink = SpoolingSink(backend, Spool(spool_dir), slow_seconds=spool_slow_seconds) if spool_dir else None
+
+    # Same-host consumers read fresh books from shared memory, ahead of the DB write.
+    # Imported here so collectors without --ring-path don't pay for numpy.
+    ring = None
+    if ring_path:
+        from pm.storage.ring import RingWriter
+
+        ring = RingWriter(ring_path, max_tokens=ring_max_tokens, depth=ring_depth, levels=top_n)
 
-        token_to_market, market_end = _get_tracked_tokens_and_end_times(db)
-        token_ids = list(token_to_market.keys())
+    # Off by default; when off, `m` is None and nothing below is timed.
+    m: Optional[CollectorMetrics] = None
+    metrics_srv = None
+    if metrics_port:
+        m = CollectorMetrics(retries=lambda: getattr(clob, "retried", 0), universe=lambda: len(universe))
+        metrics_srv = serve_metrics(m.registry, metrics_port, metrics_addr)
+        print(f"[collect][metrics] serving http://{metrics_addr}:{metrics_port}/metrics")
+    clock = time.perf_counter
 
-        if not token_ids:
-            print("[collect] no tracked tokens found; sleeping...")
-            time.sleep(max(loop_seconds, 1.0))
-            continue
+    def _expire() -> None:
+        newly = timers.pop_expired(_now())
+        if newly:
+            for mid in newly:
+                universe.remove_market(mid)
+            flagger.submit(newly)
+            print(f"[collect][expiry] expired={len(newly)} markets")
 
-        inserted = 0
-        fetched = 0
+    try:
+        while True:
+            it += 1
+            ts = _now()
 
-        for chunk in _chunks(token_ids, max(1, batch_size)):
-            # Fetch per token using GET /book (reliable in your environment)
-            for tid in chunk:
-                book = clob.book(tid)
-                fetched += 1
+            try:
+                # While the DB is degraded, keep sampling the universe we have.
+                # With a sink the read runs on its DB worker under the same
+                # deadline as writes; the update is applied here.
+                if sink is None or not len(universe):
+                    added, removed = universe.refresh()
+                elif sink.healthy:
+                    added, removed = universe.apply(*sink.call(universe.load, what="universe refresh"))
+                else:
+                    added, removed = 0, 0
+            except Exception as e:
+                if sink is None or not len(universe):
+                    raise
+                print(f"[collect][universe] refresh failed, keeping {len(universe)} tokens: {e}")
+                added, removed = 0, 0
+            if universe.expired:
+                flagger.submit(universe.expired)
+                print(f"[collect][expiry] expired={len(universe.expired)} markets (past end_time on load)")
+                universe.expired.clear()
+            if added or removed:
+                for mid in timers.markets() - universe.market_end.keys():
+                    timers.discard(mid)
+                for mid, end_time in universe.market_end.items():
+                    timers.set(mid, end_time)
+                if it > 1:
+                    print(f"[collect][universe] markets +{added} -{removed} tokens={len(universe)}")
 
-                if not isinstance(book, dict) or not book:
-                    continue
+            token_ids = universe.token_ids()
 
-                # One-time debug to confirm shape
-                if not did_debug:
-                    print("[collect][debug] first book keys:", list(book.keys())[:25])
-                    did_debug = True
+            if not token_ids:
+                print("[collect] no tracked tokens found; sleeping...")
+                time.sleep(max(loop_seconds, 1.0))
+                continue
 
-                snap = snapshot_from_book(tid, book, top_n=top_n)
-                if snap is None:
-                    continue
+            inserted = 0
+            fetched = 0
+            skipped = 0
+            errored = 0
+            sweep: List[Dict[str, Any]] = []
+            t_sweep = clock()
 
-                mid = token_to_market.get(tid)
-                end_time = market_end.get(mid) if mid is not None else None
+            for chunk in _chunks(token_ids, max(1, batch_size)):
+                _expire()
+                pending: List[Dict[str, Any]] = []
 
-                insert_snapshot_and_features(db, market_id=mid, ts=ts, snapshot=snap, end_time=end_time)
-                inserted += 1
+                # Fetch per token using GET /book (reliable in your environment)
+                for tid in chunk:
+                    mid = universe.token_to_market.get(tid)
+                    if mid is None:
+                        skipped += 1   # expired (or untracked) since the sweep started
+                        continue
 
-            if per_batch_sleep > 0:
-                time.sleep(per_batch_sleep)
+                    t0 = clock() if m else 0.0
+                    try:
+                        book = clob.book(tid)
+                    except Exception as e:
+                        # Retries are exhausted; one bad token shouldn't stop the sweep.
+                        errored += 1
+                        if m:
+                            m.tokens.inc(1, "errored")
+                        if errored == 1:
+                            print(f"[collect] fetch failed for {tid}: {type(e).__name__}: {e}")
+                        continue
+                    fetched += 1
+                    if m:
+                        m.fetch.observe(clock() - t0)
+                        m.tokens.inc(1, "fetched")
 
-        print(f"[collect] iter={it} ts={ts.isoformat()} inserted={inserted}/{len(token_ids)} fetched={fetched}")
+                    if not isinstance(book, dict) or not book:
+                        if m:
+                            m.tokens.inc(1, "empty")
+                        continue
+
+                    # One-time debug to confirm shape
+                    if not did_debug:
+                        print("[collect][debug] first book keys:", list(book.keys())[:25])
+                        did_debug = True
+
+                    t0 = clock() if m else 0.0
+                    with stage("collect.parse"):
+                        snap = snapshot_from_book(tid, book, top_n=top_n)
+                    if m:
+                        m.parse.observe(clock() - t0)
+                    if snap is None:
+                        if m:
+                            m.tokens.inc(1, "empty")
+                        continue
+
+                    if ring is not None:
+                        with stage("collect.ring"):
+                            ring.publish(snap, ts)
+
+                    end_time = universe.market_end.get(mid)
+
+                    t0 = clock() if m else 0.0
+                    with stage("collect.features"):
+                        feats = feature_row(ts=ts, snapshot=snap, end_time=end_time)
+                    if m:
+                        m.features.observe(clock() - t0)
+
+                    pending.append({"market_id": mid, "ts": ts, "snapshot": snap, "end_time": end_time, "features": feats})
+
+                # One pipelined transaction per batch.
+                t0 = clock() if m else 0.0
+                with stage("collect.write"):
+                    if sink is not None:
+                        n = sink.write(pending)
+                    else:
+                        n = backend.write_snapshots(pending)
+                inserted += n
+                if m and pending:
+                    m.write.observe(clock() - t0)
+                    m.sample_age.observe((_now() - ts).total_seconds())
+                    m.tokens.inc(n, "inserted")
+                sweep.extend(pending)
+
+                if per_batch_sleep > 0:
+                    time.sleep(per_batch_sleep)
+
+            # Both are derived from the rows above and only run when the sweep
+            # reached the DB; a failure here leaves them a sweep behind.
+            if sweep and (sink is None or sink.healthy):
+                try:
+                    with stage("collect.latest"):
+                        if sink is not None:
+                            sink.call(backend.upsert_latest, sweep, what="latest upsert")
+                        else:
+                            backend.upsert_latest(sweep)
+                except Exception as e:
+                    print(f"[collect][latest] upsert failed ({type(e).__name__}: {e})")
+                if notify and (sink is None or sink.healthy):
+                    tids = [x["snapshot"].token_id for x in sweep]
+                    try:
+                        with stage("collect.notify"):
+                            if sink is not None:
+                                sink.call(backend.notify_sweep, it, ts, tids, what="sweep notify")
+                            else:
+                                backend.notify_sweep(it, ts, tids)
+                    except Exception as e:
+                        print(f"[collect][feed] notify failed ({type(e).__name__}: {e})")
+
+            sweep_s = clock() - t_sweep
+            if m:
+                m.sweep.observe(sweep_s)
+                m.sweeps.inc()
+            if on_sweep is not None:
+                on_sweep(SweepStats(it, ts, sweep_s, len(token_ids), fetched, inserted, skipped, errored))
+
+            print(
+                f"[collect] iter={it} ts={ts.isoformat()} inserted={inserted}/{len(token_ids)} fetched={fetched}"
+                + (f" skipped_expired={skipped}" if skipped else "")
+                + (f" errors={errored}" if errored else "")
+            )
 
-        if iterations > 0 and it >= iterations:
-            break
-        if loop_seconds > 0:
-            time.sleep(loop_seconds)
\ No newline at end of file
+            if iterations > 0 and it >= iterations:
+                break
+            if loop_seconds > 0:
+                time.sleep(loop_seconds)
+    finally:
+        flagger.close()
+        if sink is not None:
+            sink.close()
+        if ring is not None:
+            ring.close()
+        if metrics_srv is not None:
+            metrics_srv.shutdown()
@@ -1,9 +1,12 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Sequence
 
 from pm.export.clean_export import CorruptionConfig, ExportParams, export_dataset
+from pm.export.grid import export_grid
+from pm.export.partitioned import export_dataset_partitioned
+from pm.export.tensor import export_tensor
 
 
 def export(
@@ -18,7 +21,17 @@ def export(
     top_n_flatten: int,
     out_clean: str,
     out_corrupted: str,
+    workers: int = 1,
+    partition_by: str = "token",
+    disabled_checks: Sequence[str] = (),
+    frozen_polls: int = 0,
+    grid: Optional[str] = None,
+    grid_max_age: Optional[str] = None,
+    grid_chunk: str = "1h",
+    fmt: str = "csv",
+    out_dir: str = "orderbook_tensor",
 ) -> tuple[int, int]:
+    disabled = set(disabled_checks)
     params = ExportParams(
         dsn=dsn,
         market_id=market_id,
@@ -26,8 +39,28 @@ def export(
         start_ts=start_ts,
         end_ts=end_ts,
         top_n_flatten=top_n_flatten,
-        corruption=CorruptionConfig(expected_seconds=expected_seconds, tolerance_seconds=tolerance_seconds),
+        corruption=CorruptionConfig(
+            expected_seconds=expected_seconds,
+            tolerance_seconds=tolerance_seconds,
+            check_cadence="cadence" not in disabled,
+            check_crossed="crossed" not in disabled,
+            check_monotonic="monotonic" not in disabled,
+            check_price_range="price-range" not in disabled,
+            frozen_polls=max(0, frozen_polls),
+        ),
         out_clean=out_clean,
         out_corrupted=out_corrupted,
     )
+    if fmt == "npy-tensor":
+        if workers > 1:
+            raise ValueError("--format npy-tensor fills one memmap in time order and does not support --workers > 1")
+        return export_tensor(params, out_dir=out_dir, grid=grid, grid_max_age=grid_max_age, chunk=grid_chunk)
+    if fmt != "csv":
+        raise ValueError(f"Unknown export format: {fmt!r}")
+    if grid:
+        if workers > 1:
+            raise ValueError("--grid streams in time order and does not support --workers > 1")
+        return export_grid(params, freq=grid, max_age=grid_max_age, chunk=grid_chunk)
+    if workers > 1:
+        return export_dataset_partitioned(params, workers=workers, partition_by=partition_by)
     return export_dataset(params)
\ No newline at end of file
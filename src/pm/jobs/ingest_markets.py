@@ -1,10 +1,26 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from pm.db import DB
 from pm.gamma.client import GammaClient
-from pm.gamma.ingest import upsert_markets
+from pm.gamma.ingest import (
+    ROW_HASH,
+    _should_store,
+    merge_market_rows,
+    normalize_market,
+    prepare_market_rows,
+    upsert_markets,
+    upsert_markets_bulk,
+)
+from pm.profiling import stage
+from pm.storage.base import StorageBackend
 
 
 def _normalize_markets_payload(payload: Any) -> List[Dict]:
@@ -15,14 +31,47 @@ def _normalize_markets_payload(payload: Any) -> List[Dict]:
     return []
 
 
+@dataclass
+class IngestStats:
+    pages: int = 0
+    fetched: int = 0
+    upserted: int = 0
+    seconds: float = 0.0
+    # filled by the bulk path only
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+    @property
+    def markets_per_sec(self) -> float:
+        return self.fetched / self.seconds if self.seconds > 0 else 0.0
+
+
+def _upsert_page(db: DB, markets: List[Dict], bulk: bool, stats: IngestStats) -> int:
+    if not bulk:
+        return upsert_markets(db, markets)
+    u = upsert_markets_bulk(db, markets)
+    stats.inserted += u.inserted
+    stats.updated += u.updated
+    stats.unchanged += u.unchanged
+    return u.inserted + u.updated + u.unchanged
+
+
 def ingest_markets(
     *,
-    db: DB,
+    db: Optional[DB] = None,
     gamma: GammaClient,
     event_id: Optional[int] = None,
     limit: int = 1000,
     pages: int = 1,
+    bulk: bool = False,
+    stats: Optional[IngestStats] = None,
+    backend: Optional[StorageBackend] = None,
 ) -> int:
+    """Page through the listing. With `backend`, pages go to backend.upsert_markets (no bulk path)."""
+    if backend is not None and bulk:
+        raise ValueError("bulk ingest needs the Postgres DB")
+    stats = stats if stats is not None else IngestStats()
     total = 0
     offset = 0
     for _ in range(max(1, pages)):
@@ -30,6 +79,304 @@ def ingest_markets(
         markets = _normalize_markets_payload(payload)
         if not markets:
             break
-        total += upsert_markets(db, markets)
+        stats.pages += 1
+        stats.fetched += len(markets)
+        with stage("ingest.upsert"):
+            total += backend.upsert_markets(markets) if backend is not None else _upsert_page(db, markets, bulk, stats)
         offset += limit
-    return total
\ No newline at end of file
+    stats.upserted = total
+    return total
+
+
+_DONE = object()
+
+
+def _fetch_pages_concurrent(
+    *,
+    gamma: GammaClient,
+    event_id: Optional[int],
+    limit: int,
+    workers: int,
+    max_pages: int,
+    sink: Callable[[List[Dict]], int],
+    stats: IngestStats,
+) -> bool:
+    """
+    Fetch Gamma pages with up to `workers` requests in flight and keep requesting
+    new offsets until a page comes back short or empty. Fetched pages go through
+    a queue to a single writer thread running `sink`, so writes overlap with
+    fetching. Returns True if the listing was read to its end.
+    """
+    limit = max(1, limit)
+    workers = max(1, workers)
+    q: "queue.Queue[Any]" = queue.Queue(maxsize=workers * 2)
+    writer_error: List[BaseException] = []
+
+    def _writer() -> None:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                return
+            if writer_error:
+                continue  # drain so the producer never blocks
+            try:
+                with stage("ingest.upsert"):
+                    stats.upserted += sink(item)
+            except BaseException as e:
+                writer_error.append(e)
+
+    # requests.Session isn't guaranteed thread-safe; give each fetch thread its own client.
+    local = threading.local()
+
+    def _fetch(offset: int) -> Tuple[int, List[Dict]]:
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = replace(gamma)
+        payload = client.list_markets(event_id=event_id, limit=limit, offset=offset)
+        return offset, _normalize_markets_payload(payload)
+
+    writer = threading.Thread(target=_writer, name="pm-ingest-writer", daemon=True)
+    writer.start()
+
+    stop_at: Optional[int] = None  # first offset known to be past the end
+    next_page = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pm-ingest-fetch") as pool:
+            in_flight = set()
+
+            def _submit_more() -> None:
+                nonlocal next_page
+                while len(in_flight) < workers and (max_pages <= 0 or next_page < max_pages):
+                    off = next_page * limit
+                    if stop_at is not None and off >= stop_at:
+                        return
+                    in_flight.add(pool.submit(_fetch, off))
+                    next_page += 1
+
+            _submit_more()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    in_flight.discard(fut)
+                    offset, markets = fut.result()
+                    if len(markets) < limit:
+                        end = offset + len(markets)
+                        stop_at = end if stop_at is None else min(stop_at, end)
+                    if markets and (stop_at is None or offset < stop_at):
+                        stats.pages += 1
+                        stats.fetched += len(markets)
+                        q.put(markets)
+                if writer_error:
+                    break
+                _submit_more()
+    finally:
+        q.put(_DONE)
+        writer.join()
+
+    if writer_error:
+        raise writer_error[0]
+    return stop_at is not None
+
+
+def ingest_markets_concurrent(
+    *,
+    db: DB,
+    gamma: GammaClient,
+    event_id: Optional[int] = None,
+    limit: int = 1000,
+    workers: int = 4,
+    max_pages: int = 0,  # 0 = until a short/empty page
+    bulk: bool = False,
+) -> IngestStats:
+    """
+    Concurrent, self-terminating ingest; see _fetch_pages_concurrent.
+    """
+    stats = IngestStats()
+    t0 = time.perf_counter()
+    _fetch_pages_concurrent(
+        gamma=gamma,
+        event_id=event_id,
+        limit=limit,
+        workers=workers,
+        max_pages=max_pages,
+        sink=lambda markets: _upsert_page(db, markets, bulk, stats),
+        stats=stats,
+    )
+    stats.seconds = time.perf_counter() - t0
+    return stats
+
+
+# -----------------------
+# Incremental sync
+# -----------------------
+_STORED_FINGERPRINTS_SQL = """
+SELECT market_id,
+       content_hash,
+       (delisted_at IS NULL
+        AND COALESCE(is_closed, FALSE) = FALSE
+        AND COALESCE(is_resolved, FALSE) = FALSE) AS listed,
+       (delisted_at IS NOT NULL) AS delisted
+FROM markets
+"""
+
+_RELIST_SQL = """
+UPDATE markets
+SET delisted_at = NULL,
+    is_active = TRUE
+WHERE market_id = ANY(%(ids)s)
+  AND delisted_at IS NOT NULL
+"""
+
+# Markets that dropped out of the active listing: mark them and end their
+# tracking by id, instead of refresh_ended_flags' UPDATE ... FROM markets join.
+_DELIST_SQL = """
+WITH gone AS (
+  UPDATE markets
+  SET is_active = FALSE,
+      delisted_at = %(ts)s
+  WHERE market_id = ANY(%(ids)s)
+    AND delisted_at IS NULL
+  RETURNING market_id
+)
+UPDATE tracked_markets tm
+SET ended = TRUE,
+    ended_at = COALESCE(tm.ended_at, %(ts)s)
+FROM gone
+WHERE tm.market_id = gone.market_id
+  AND tm.ended = FALSE
+"""
+
+
+@dataclass
+class SyncStats(IngestStats):
+    delisted: int = 0
+    tracked_ended: int = 0
+    recovered: int = 0      # missing from the listing walk but still active upstream
+    complete: bool = False
+
+
+def _still_listed(m: Dict[str, Any], now: datetime) -> bool:
+    nm = normalize_market(m)
+    return nm["is_active"] is not False and _should_store(nm, now)
+
+
+def _confirm_missing(
+    gamma: GammaClient, market_ids: List[int], now: datetime, workers: int
+) -> Tuple[List[int], List[Dict[str, Any]]]:
+    """
+    Look up every market the listing walk didn't return. Offsets shift when
+    markets close mid-walk, so one pass can skip live markets; absence alone
+    isn't proof. Returns (gone ids, raw markets that are still listed). A lookup
+    that fails for any reason other than a 404 keeps the market listed, and the
+    next sync checks it again.
+    """
+    # Own client per thread (requests.Session isn't thread-safe), and no
+    # response cache: a cached copy could keep a closed market live for its TTL.
+    local = threading.local()
+
+    def _one(mid: int) -> Tuple[int, Optional[bool], Optional[Dict[str, Any]]]:
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = replace(gamma, cache=None)
+        try:
+            m = client.market_by_id(mid)
+        except Exception as e:
+            if getattr(getattr(e, "response", None), "status_code", None) == 404:
+                return mid, False, None
+            return mid, None, None
+        if not isinstance(m, dict):
+            return mid, None, None
+        return mid, _still_listed(m, now), m
+
+    gone: List[int] = []
+    listed: List[Dict[str, Any]] = []
+    if not market_ids:
+        return gone, listed
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(market_ids)))) as pool:
+        for mid, ok, m in pool.map(_one, market_ids):
+            if ok is False:
+                gone.append(mid)
+            elif ok and m is not None:
+                listed.append(m)
+    return gone, listed
+
+
+def sync_markets(
+    *,
+    db: DB,
+    gamma: GammaClient,
+    limit: int = 1000,
+    workers: int = 4,
+) -> SyncStats:
+    """
+    Incremental sync of the active market listing.
+
+    Stored content hashes are loaded once; only new or changed markets are sent
+    to the bulk merge. Markets still listed in the DB but absent from a complete
+    listing are looked up by id; those that are closed, resolved or gone upstream
+    are marked delisted (is_active = FALSE, delisted_at) and their
+    tracked_markets rows ended directly. The rest were only skipped by offset
+    drift and are merged like any listed market. Delisting is skipped if the
+    listing wasn't read to its end or came back empty.
+    """
+    stats = SyncStats()
+    t0 = time.perf_counter()
+    ts = datetime.now(timezone.utc)
+
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(_STORED_FINGERPRINTS_SQL)
+            rows = cur.fetchall()
+    stored = {int(r["market_id"]): (r["content_hash"], bool(r["listed"])) for r in rows}
+    delisted = {int(r["market_id"]) for r in rows if r["delisted"]}
+
+    seen: set = set()
+
+    # Runs on the single writer thread only.
+    def _sink(markets: List[Dict]) -> int:
+        for m in markets:
+            mid = m.get("id") or m.get("market_id") or m.get("marketId")
+            if mid is not None:
+                seen.add(int(mid))
+        rows, _ = prepare_market_rows(markets, ts)
+        changed = {mid: r for mid, r in rows.items() if stored.get(mid, (None,))[0] != r[ROW_HASH]}
+        stats.unchanged += len(rows) - len(changed)
+        u = merge_market_rows(db, changed, ts)
+        stats.inserted += u.inserted
+        stats.updated += u.updated
+        stats.unchanged += u.unchanged
+        return u.inserted + u.updated
+
+    stats.complete = _fetch_pages_concurrent(
+        gamma=gamma,
+        event_id=None,
+        limit=limit,
+        workers=workers,
+        max_pages=0,
+        sink=_sink,
+        stats=stats,
+    )
+
+    gone: List[int] = []
+    if stats.complete and seen:
+        missing = [mid for mid, (_, listed) in stored.items() if listed and mid not in seen]
+        gone, recovered = _confirm_missing(gamma, missing, ts, workers)
+        if recovered:
+            stats.recovered = len(recovered)
+            stats.upserted += _sink(recovered)
+
+    relisted = sorted(delisted & seen)
+
+    if relisted or gone:
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                if relisted:
+                    cur.execute(_RELIST_SQL, {"ids": relisted})
+                if gone:
+                    cur.execute(_DELIST_SQL, {"ids": gone, "ts": ts})
+                    stats.tracked_ended = cur.rowcount
+            conn.commit()
+    stats.delisted = len(gone)
+
+    stats.seconds = time.perf_counter() - t0
+    return stats
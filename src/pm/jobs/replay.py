@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import csv
+import json
+from datetime import datetime
+from typing import List, Optional
+
+from pm.db import DB
+from pm.replay.engine import ReplayEngine, ReplayEvent, ReplayStats, csv_streams, db_streams
+
+
+_FEATURE_OUT_COLUMNS = [
+    "token_id", "market_id", "ts_utc",
+    "spread", "mid", "microprice", "imbalance_l1",
+    "bid_depth_top_n", "ask_depth_top_n",
+    "depth_bid_top5", "depth_ask_top5", "imbalance_top5",
+    "seconds_to_expiry", "hours_to_expiry",
+    "extra_features_json",
+]
+
+
+class FeatureCsvWriter:
+    """Subscriber that writes every replayed feature row to a CSV file."""
+
+    def __init__(self, path: str):
+        self._f = open(path, "w", newline="", encoding="utf-8")
+        self._w = csv.writer(self._f)
+        self._w.writerow(_FEATURE_OUT_COLUMNS)
+
+    def __call__(self, ev: ReplayEvent) -> None:
+        f = ev.features
+        self._w.writerow(
+            [ev.token_id, ev.market_id, ev.ts.isoformat()]
+            + [f.get(c) for c in _FEATURE_OUT_COLUMNS[3:-1]]
+            + [json.dumps(f.get("extra_features_json"))]
+        )
+
+    def close(self) -> None:
+        self._f.close()
+
+
+def replay(
+    *,
+    db: DB,
+    source: str,
+    path: Optional[str],
+    token_ids: Optional[List[str]],
+    market_id: Optional[int],
+    start_ts: Optional[datetime],
+    end_ts: Optional[datetime],
+    speed: float,
+    from_raw: bool,
+    top_n: int,
+    out: Optional[str],
+    progress_every: int = 0,
+) -> ReplayStats:
+    engine = ReplayEngine(speed=max(0.0, speed), progress_every=progress_every)
+    writer = FeatureCsvWriter(out) if out else None
+    if writer is not None:
+        engine.subscribe(writer)
+
+    try:
+        if source == "db":
+            with db_streams(
+                db,
+                token_ids=token_ids,
+                market_id=market_id,
+                start_ts=start_ts,
+                end_ts=end_ts,
+                from_raw=from_raw,
+                top_n=top_n,
+            ) as streams:
+                return engine.run(streams)
+
+        if source == "csv":
+            if not path:
+                raise ValueError("--path is required with --source csv")
+            with csv_streams(
+                path, token_ids=token_ids, market_id=market_id, start_ts=start_ts, end_ts=end_ts
+            ) as streams:
+                return engine.run(streams)
+
+        raise ValueError(f"Unknown replay source: {source!r}")
+    finally:
+        if writer is not None:
+            writer.close()
@@ -0,0 +1,416 @@
+from __future__ import annotations
+
+import json
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from pm.clob.collect_books import Snapshot
+from pm.db import DB
+from pm.features.jobs import feature_row, upsert_latest
+
+
+# Far above real Gamma ids, so synthetic rows never collide with ingested markets.
+SYNTH_MARKET_ID_BASE = 9_000_000_000
+
+CORRUPTION_KINDS = ("crossed", "monotonic", "price_range", "orphan", "frozen")
+
+_SNAPSHOT_COPY = (
+    "COPY orderbook_snapshots (token_id, market_id, ts_utc, "
+    "best_bid_price, best_bid_size, best_ask_price, best_ask_size, "
+    "bids_top_n_json, asks_top_n_json, raw_book_json, inserted_at) FROM STDIN"
+)
+_FEATURE_COPY = (
+    "COPY features_orderbook (token_id, market_id, ts_utc, "
+    "spread, mid, microprice, imbalance_l1, bid_depth_top_n, ask_depth_top_n, "
+    "depth_bid_top5, depth_ask_top5, imbalance_top5, seconds_to_expiry, hours_to_expiry, "
+    "extra_features_json, inserted_at) FROM STDIN"
+)
+_MARKET_COPY = (
+    "COPY markets (market_id, slug, question, condition_id, end_time, is_closed, is_resolved, is_active, "
+    "category, volume_num, liquidity_num, updated_at, raw_json) FROM STDIN"
+)
+_TRACKED_COPY = "COPY tracked_markets (market_id, sessions, ended, first_seen_at, last_seen_at, ended_at) FROM STDIN"
+
+_EXISTING_SQL = "SELECT count(*) AS n FROM markets WHERE market_id BETWEEN %s AND %s"
+
+# Markets only SET NULL the time-series rows, so those go first; features_orderbook
+# cascades from its snapshots and tracked_markets from markets.
+_REPLACE_SQL = (
+    "DELETE FROM orderbook_latest WHERE market_id BETWEEN %(lo)s AND %(hi)s",
+    "DELETE FROM orderbook_snapshots WHERE market_id BETWEEN %(lo)s AND %(hi)s",
+    "DELETE FROM markets WHERE market_id BETWEEN %(lo)s AND %(hi)s",
+)
+
+
+@dataclass(frozen=True)
+class SynthParams:
+    markets: int = 100
+    tokens_per_market: int = 2
+    start: Optional[datetime] = None          # default: now - hours
+    hours: float = 24.0
+    cadence_seconds: float = 2.0
+    jitter: float = 0.1                       # per-poll timestamp jitter, fraction of cadence
+    levels: int = 10
+    tick: float = 0.01
+    volatility: float = 0.25                  # logit-space std per hour of the mid random walk
+    gap_rate: float = 0.0                     # P(a token's gap starts) per poll
+    gap_seconds: float = 60.0                 # mean gap length
+    corrupt_rate: float = 0.0                 # P(a snapshot is corrupted), split over CORRUPTION_KINDS
+    frozen_polls: int = 5                     # length of an injected frozen run
+    raw_book: bool = True
+    seed: int = 7
+    session: str = "synth"
+    market_id_base: int = SYNTH_MARKET_ID_BASE
+    chunk_rows: int = 50_000                  # snapshots per COPY transaction
+    replace: bool = False
+
+
+@dataclass
+class SynthStats:
+    markets: int = 0
+    tokens: int = 0
+    polls: int = 0
+    snapshots: int = 0
+    feature_rows: int = 0
+    gap_polls: int = 0
+    corrupted: Dict[str, int] = field(default_factory=lambda: {k: 0 for k in CORRUPTION_KINDS})
+    seconds: float = 0.0
+
+    @property
+    def rows_per_min(self) -> float:
+        return 60.0 * (self.snapshots + self.feature_rows) / self.seconds if self.seconds > 0 else 0.0
+
+    def add(self, other: "SynthStats") -> None:
+        self.tokens += other.tokens
+        self.polls = max(self.polls, other.polls)
+        self.snapshots += other.snapshots
+        self.feature_rows += other.feature_rows
+        self.gap_polls += other.gap_polls
+        for k, v in other.corrupted.items():
+            self.corrupted[k] += v
+
+
+# -----------------------
+# Generation
+# -----------------------
+class _Book:
+    """Book generator for a slice of markets: a logit random walk per market, ladders in whole ticks."""
+
+    def __init__(self, p: SynthParams, rng: np.random.Generator, n_markets: int):
+        self.p = p
+        self.rng = rng
+        self.n_ticks = int(round(1.0 / p.tick))
+        self.px = [round(k * p.tick, 6) for k in range(self.n_ticks + 1)]
+        # One walk per market; outcome k > 0 mirrors it (binary markets sum to ~1).
+        self.logit = rng.normal(0.0, 1.0, n_markets)
+        self.step_sd = p.volatility * math.sqrt(p.cadence_seconds / 3600.0)
+        self.depth_scale = 1.0 + 0.15 * np.tile(np.arange(p.levels), 2)
+
+    def step(self) -> List[float]:
+        self.logit += self.rng.normal(0.0, self.step_sd, self.logit.shape)
+        np.clip(self.logit, -4.5, 4.5, out=self.logit)
+        return (1.0 / (1.0 + np.exp(-self.logit))).tolist()
+
+    def draws(self, n_tokens: int) -> Tuple[List[int], List[List[float]]]:
+        """Spreads in ticks (mostly 1) and level sizes for one poll, drawn in bulk."""
+        spreads = self.rng.geometric(0.6, n_tokens)
+        sizes = np.round(self.rng.lognormal(4.0, 0.8, (n_tokens, 2 * self.p.levels)) * self.depth_scale, 2)
+        return spreads.tolist(), sizes.tolist()
+
+    def ladders(self, mid: float, spread: int, sizes: List[float]) -> Tuple[List[List[float]], List[List[float]]]:
+        n, px, levels = self.n_ticks, self.px, self.p.levels
+        spread = min(spread, n // 4)
+        bid = min(max(1, int(mid * n) - spread // 2), n - 1 - spread)
+        ask = bid + spread
+        bids = [[px[bid - k], sizes[k]] for k in range(min(levels, bid))]
+        asks = [[px[ask + k], sizes[levels + k]] for k in range(min(levels, n - ask))]
+        return bids, asks
+
+
+def _corrupt(kind: str, bids: List[List[float]], asks: List[List[float]], tick: float) -> Tuple[list, list]:
+    """Damage a book the way the exporter's checks look for."""
+    bids = [list(x) for x in bids]
+    asks = [list(x) for x in asks]
+    if kind == "crossed" and bids and asks:
+        bids[0][0] = round(asks[0][0] + tick, 6)
+    elif kind == "monotonic" and len(bids) >= 3:
+        bids[1], bids[2] = bids[2], bids[1]
+    elif kind == "price_range" and asks:
+        asks[-1][0] = round(1.0 + 5 * tick, 6)
+    return bids, asks
+
+
+# COPY text format. Every value below is a number, an ISO timestamp, a digit
+# token id or JSON built from those, so nothing needs tab/newline/backslash escaping.
+def _n(x: Any) -> str:
+    return "\\N" if x is None else repr(x)
+
+
+def _levels_json(levels: List[List[float]]) -> str:
+    return "[" + ", ".join([f"[{px!r}, {sz!r}]" for px, sz in levels]) + "]"
+
+
+def _raw_json(token_id: str, condition_id: str, ts_ms: str, bids, asks, tick: str) -> str:
+    # The CLOB /book shape: prices and sizes as strings.
+    b = ", ".join([f'{{"price": "{px!r}", "size": "{sz!r}"}}' for px, sz in bids])
+    a = ", ".join([f'{{"price": "{px!r}", "size": "{sz!r}"}}' for px, sz in asks])
+    return (
+        f'{{"market": "{condition_id}", "asset_id": "{token_id}", "timestamp": "{ts_ms}", '
+        f'"bids": [{b}], "asks": [{a}], "tick_size": "{tick}"}}'
+    )
+
+
+def _write(cur, sql: str, lines: List[str], block: int = 2000) -> None:
+    with cur.copy(sql) as cp:
+        for i in range(0, len(lines), block):
+            cp.write("".join(lines[i : i + block]))
+
+
+def _flush(db: DB, snaps: List[str], feats: List[str]) -> None:
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            _write(cur, _SNAPSHOT_COPY, snaps)
+            _write(cur, _FEATURE_COPY, feats)
+        conn.commit()
+
+
+def _generate(
+    db: DB,
+    p: SynthParams,
+    *,
+    part: int,
+    market_lo: int,
+    market_hi: int,
+    start: datetime,
+    end_time: datetime,
+    polls: int,
+    progress: bool,
+) -> SynthStats:
+    """Generate and load the time series for markets [market_lo, market_hi) of the run."""
+    stats = SynthStats()
+    t0 = time.perf_counter()
+    rng = np.random.default_rng([p.seed, part])
+    n_mkt = market_hi - market_lo
+    tpm = p.tokens_per_market
+    books = _Book(p, rng, n_mkt)
+
+    mids_of = [p.market_id_base + market_lo + j // tpm for j in range(n_mkt * tpm)]
+    tokens = [f"{m}{j % tpm + 1}" for j, m in enumerate(mids_of)]
+    cond = {m: f"0x{m:064x}" for m in set(mids_of)}
+    n_tok = stats.tokens = len(tokens)
+
+    gap_left = np.zeros(n_tok, dtype=np.int64)
+    gap_p = min(1.0, max(0.0, p.gap_rate))
+    gap_mean = max(1.0, p.gap_seconds / p.cadence_seconds)
+    corrupt_p = min(1.0, max(0.0, p.corrupt_rate))
+    frozen_left = [0] * n_tok
+    last_book: List[Optional[Tuple[list, list]]] = [None] * n_tok
+    jitter_s = p.jitter * p.cadence_seconds
+    tick_s = f"{p.tick:g}"
+
+    latest: Dict[str, Dict[str, Any]] = {}
+    snaps: List[str] = []
+    feats: List[str] = []
+    tag = f"[synth:{part}]" if part else "[synth]"
+
+    for step in range(polls):
+        mids = books.step()
+        ts = start + timedelta(
+            seconds=step * p.cadence_seconds + (float(rng.uniform(-jitter_s, jitter_s)) if jitter_s > 0 else 0.0)
+        )
+        ts_s = ts.isoformat()
+        ts_ms = str(int(ts.timestamp() * 1000))
+
+        # Gaps: a token misses polls while its counter runs down.
+        if gap_p > 0:
+            starts = (gap_left == 0) & (rng.random(n_tok) < gap_p)
+            gap_left[starts] = rng.geometric(1.0 / gap_mean, int(starts.sum()))
+        active = gap_left == 0
+        gap_left[~active] -= 1
+        stats.gap_polls += int(n_tok - active.sum())
+
+        spreads, sizes = books.draws(n_tok)
+        kinds = (
+            np.where(rng.random(n_tok) < corrupt_p, rng.integers(0, len(CORRUPTION_KINDS), n_tok), -1).tolist()
+            if corrupt_p > 0 else None
+        )
+
+        for j in np.flatnonzero(active).tolist():
+            tid, mid_id = tokens[j], mids_of[j]
+            m = mids[j // tpm]
+            kind = CORRUPTION_KINDS[kinds[j]] if kinds is not None and kinds[j] >= 0 else None
+
+            if frozen_left[j] > 0 and last_book[j] is not None:
+                frozen_left[j] -= 1
+                bids, asks = last_book[j]
+            else:
+                bids, asks = books.ladders(m if j % tpm == 0 else 1.0 - m, spreads[j], sizes[j])
+                if kind == "frozen":
+                    frozen_left[j] = max(1, p.frozen_polls) - 1
+                    stats.corrupted["frozen"] += 1
+                elif kind in ("crossed", "monotonic", "price_range"):
+                    bids, asks = _corrupt(kind, bids, asks, p.tick)
+                    stats.corrupted[kind] += 1
+            last_book[j] = (bids, asks)
+
+            snap = Snapshot(
+                token_id=tid,
+                bids_top=bids,
+                asks_top=asks,
+                best_bid_price=bids[0][0] if bids else None,
+                best_bid_size=bids[0][1] if bids else None,
+                best_ask_price=asks[0][0] if asks else None,
+                best_ask_size=asks[0][1] if asks else None,
+                raw_book={},
+            )
+            raw = _raw_json(tid, cond[mid_id], ts_ms, bids, asks, tick_s) if p.raw_book else "\\N"
+            snaps.append(
+                f"{tid}\t{mid_id}\t{ts_s}\t{_n(snap.best_bid_price)}\t{_n(snap.best_bid_size)}\t"
+                f"{_n(snap.best_ask_price)}\t{_n(snap.best_ask_size)}\t"
+                f"{_levels_json(bids)}\t{_levels_json(asks)}\t{raw}\t{ts_s}\n"
+            )
+
+            # The collector's own feature path, so synthetic features match live ones.
+            f = feature_row(ts=ts, snapshot=snap, end_time=end_time)
+            if kind == "orphan":
+                stats.corrupted["orphan"] += 1
+            else:
+                feats.append(
+                    f"{tid}\t{mid_id}\t{ts_s}\t{_n(f['spread'])}\t{_n(f['mid'])}\t{_n(f['microprice'])}\t"
+                    f"{_n(f['imbalance_l1'])}\t{_n(f['bid_depth_top_n'])}\t{_n(f['ask_depth_top_n'])}\t"
+                    f"{_n(f['depth_bid_top5'])}\t{_n(f['depth_ask_top5'])}\t{_n(f['imbalance_top5'])}\t"
+                    f"{_n(f['seconds_to_expiry'])}\t{_n(f['hours_to_expiry'])}\t"
+                    f"{json.dumps(f['extra_features_json'])}\t{ts_s}\n"
+                )
+            latest[tid] = {"market_id": mid_id, "ts": ts, "snapshot": snap, "end_time": end_time, "features": f}
+
+        stats.polls += 1
+        if len(snaps) >= p.chunk_rows or step == polls - 1:
+            _flush(db, snaps, feats)
+            stats.snapshots += len(snaps)
+            stats.feature_rows += len(feats)
+            snaps, feats = [], []
+            stats.seconds = time.perf_counter() - t0
+            if progress:
+                print(
+                    f"{tag} polls={stats.polls}/{polls} snapshots={stats.snapshots} "
+                    f"seconds={stats.seconds:.1f} rows_per_min={stats.rows_per_min:,.0f}"
+                )
+
+    upsert_latest(db, list(latest.values()))
+    return stats
+
+
+def _generate_worker(dsn: str, p: SynthParams, kw: Dict[str, Any]) -> SynthStats:
+    db = DB(dsn, statement_timeout_ms=0, min_size=1, max_size=1).open()
+    try:
+        return _generate(db, p, **kw)
+    finally:
+        db.close()
+
+
+# -----------------------
+# Entry point
+# -----------------------
+def _market_rows(p: SynthParams, end_time: datetime, now: datetime) -> Tuple[List[tuple], List[tuple]]:
+    """Rows for markets and tracked_markets. Markets resolve when the history ends."""
+    ended = end_time <= now
+    markets, tracked = [], []
+    for i in range(p.markets):
+        mid = p.market_id_base + i
+        tids = [f"{mid}{k + 1}" for k in range(p.tokens_per_market)]
+        raw = {
+            "id": str(mid),
+            "slug": f"synth-market-{i}",
+            "question": f"Synthetic market {i}?",
+            "conditionId": f"0x{mid:064x}",
+            "endDate": end_time.isoformat(),
+            "active": not ended,
+            "closed": ended,
+            "category": "synth",
+            "clobTokenIds": json.dumps(tids),
+            "outcomes": json.dumps(["Yes", "No"] if len(tids) == 2 else [f"Outcome {k + 1}" for k in range(len(tids))]),
+        }
+        markets.append(
+            (mid, raw["slug"], raw["question"], raw["conditionId"], end_time, ended, False, not ended, "synth",
+             5000.0 + (i % 89) * 100, 1000.0 + (i % 97) * 50, now, json.dumps(raw))
+        )
+        tracked.append((mid, [p.session], ended, now, now, end_time if ended else None))
+    return markets, tracked
+
+
+def synth_history(
+    db: DB,
+    p: SynthParams,
+    *,
+    dsn: Optional[str] = None,
+    workers: int = 1,
+    progress: bool = True,
+) -> SynthStats:
+    """
+    Bulk-load synthetic history: markets and tracked_markets, then
+    orderbook_snapshots + features_orderbook through COPY, one transaction per
+    `chunk_rows` snapshots, then orderbook_latest.
+
+    Each poll shares one timestamp across its tokens and rows arrive in time
+    order, as from the collector. Features go through feature_row, so they are
+    what the collector would have written for the same books. With `workers`
+    > 1 (needs `dsn`), markets are split into contiguous slices generated by
+    separate processes; a given seed reproduces the same data for a given
+    worker count.
+    """
+    if p.markets <= 0 or p.tokens_per_market <= 0:
+        raise ValueError("markets and tokens_per_market must be positive")
+    if p.cadence_seconds <= 0 or p.hours <= 0:
+        raise ValueError("cadence_seconds and hours must be positive")
+    if not 0 <= p.jitter < 0.5:
+        raise ValueError("jitter must be in [0, 0.5) so polls stay in order")
+    if workers > 1 and not dsn:
+        raise ValueError("workers > 1 needs a dsn for the worker connections")
+
+    t0 = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    start = p.start or (now - timedelta(hours=p.hours))
+    polls = max(1, int(p.hours * 3600.0 / p.cadence_seconds))
+    end_time = start + timedelta(seconds=polls * p.cadence_seconds)
+    lo, hi = p.market_id_base, p.market_id_base + p.markets - 1
+
+    markets, tracked = _market_rows(p, end_time, now)
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(_EXISTING_SQL, (lo, hi))
+            existing = int(cur.fetchone()["n"])
+            if existing and not p.replace:
+                raise ValueError(f"{existing} markets already exist in ids {lo}..{hi}; use --replace to overwrite them")
+            if existing:
+                for sql in _REPLACE_SQL:
+                    cur.execute(sql, {"lo": lo, "hi": hi})
+            for sql, rows in ((_MARKET_COPY, markets), (_TRACKED_COPY, tracked)):
+                with cur.copy(sql) as cp:
+                    for r in rows:
+                        cp.write_row(r)
+        conn.commit()
+
+    workers = max(1, min(workers, p.markets))
+    bounds = [p.markets * k // workers for k in range(workers + 1)]
+    parts = [
+        dict(part=k, market_lo=bounds[k], market_hi=bounds[k + 1], start=start, end_time=end_time,
+             polls=polls, progress=progress)
+        for k in range(workers)
+    ]
+
+    stats = SynthStats(markets=p.markets)
+    if workers == 1:
+        stats.add(_generate(db, p, **parts[0]))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for st in pool.map(_generate_worker, [dsn] * workers, [p] * workers, parts):
+                stats.add(st)
+    stats.seconds = time.perf_counter() - t0
+    return stats
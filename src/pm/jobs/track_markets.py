@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import time
+from dataclasses import dataclass, field
 from datetime import datetime, timezone, timedelta
-from typing import List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from pm.db import DB
 
@@ -14,34 +15,64 @@ def _now_utc() -> datetime:
 # -----------------------
 # Manual tracking (existing behavior)
 # -----------------------
+# One statement for the whole id list. Ids are de-duplicated first because
+# ON CONFLICT cannot touch the same row twice in a single command.
+TRACK_UPSERT_SQL = """
+INSERT INTO tracked_markets (market_id, sessions, ended, first_seen_at, last_seen_at)
+SELECT ids.market_id, ARRAY[%(session)s]::text[], FALSE, %(ts)s, %(ts)s
+FROM (SELECT DISTINCT unnest(%(market_ids)s::bigint[]) AS market_id) ids
+ON CONFLICT (market_id) DO UPDATE SET
+  sessions = (
+    SELECT ARRAY(SELECT DISTINCT unnest(tracked_markets.sessions || EXCLUDED.sessions))
+  ),
+  ended = FALSE,
+  demoted_at = NULL,
+  last_seen_at = EXCLUDED.last_seen_at
+"""
+
+
+def _upsert_tracked(db: DB, market_ids: List[int], session: str, ts: datetime) -> int:
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                TRACK_UPSERT_SQL,
+                {"market_ids": [int(m) for m in market_ids], "session": session, "ts": ts},
+            )
+            n = cur.rowcount
+        conn.commit()
+    return int(n)
+
+
 def track_markets(*, db: DB, market_ids: List[int], session: str) -> int:
     """
     Insert markets into tracked_markets and attach a session tag.
     Idempotent: adds session to sessions[] if not already present.
+    Returns the number of distinct markets touched.
     """
     if not market_ids:
         return 0
 
-    ts = _now_utc()
-
-    sql = """
-    INSERT INTO tracked_markets (market_id, sessions, ended, first_seen_at, last_seen_at)
-    VALUES (%s, ARRAY[%s], FALSE, %s, %s)
-    ON CONFLICT (market_id) DO UPDATE SET
-      sessions = (
-        SELECT ARRAY(SELECT DISTINCT unnest(tracked_markets.sessions || EXCLUDED.sessions))
-      ),
-      ended = FALSE,
-      last_seen_at = EXCLUDED.last_seen_at
-    """
+    return _upsert_tracked(db, market_ids, session, _now_utc())
 
-    with db.connection() as conn:
-        with conn.cursor() as cur:
-            for mid in market_ids:
-                cur.execute(sql, (mid, session, ts, ts))
-        conn.commit()
 
-    return len(market_ids)
+# Driven from the open tracked rows (idx_tracked_ended) with one PK probe into
+# markets each, rather than an UPDATE ... FROM join over the markets table.
+REFRESH_ENDED_SQL = """
+UPDATE tracked_markets tm
+SET ended = TRUE,
+    ended_at = COALESCE(tm.ended_at, %(ts)s)
+WHERE tm.ended = FALSE
+  AND EXISTS (
+    SELECT 1 FROM markets m
+    WHERE m.market_id = tm.market_id
+      AND (
+        COALESCE(m.is_closed, FALSE) = TRUE
+        OR COALESCE(m.is_resolved, FALSE) = TRUE
+        OR m.delisted_at IS NOT NULL
+        OR m.end_time <= %(ts)s
+      )
+  )
+"""
 
 
 def refresh_ended_flags(db: DB) -> int:
@@ -49,26 +80,12 @@ def refresh_ended_flags(db: DB) -> int:
     Mark tracked markets ended when:
       - markets.is_closed = true OR
       - markets.is_resolved = true OR
+      - markets.delisted_at is set (dropped out of the listing) OR
       - markets.end_time <= now()
     """
-    ts = _now_utc()
-    sql = """
-    UPDATE tracked_markets tm
-    SET ended = TRUE,
-        ended_at = COALESCE(tm.ended_at, %s)
-    FROM markets m
-    WHERE tm.market_id = m.market_id
-      AND tm.ended = FALSE
-      AND (
-        COALESCE(m.is_closed, FALSE) = TRUE
-        OR COALESCE(m.is_resolved, FALSE) = TRUE
-        OR (m.end_time IS NOT NULL AND m.end_time <= %s)
-      )
-    """
-
     with db.connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(sql, (ts, ts))
+            cur.execute(REFRESH_ENDED_SQL, {"ts": _now_utc()})
             n = cur.rowcount
         conn.commit()
 
@@ -95,33 +112,23 @@ class AutoTrackPolicy:
     require_token_keys: bool = True               # require raw_json has clobTokenIds or clobTokenId
 
 
-def auto_track_markets(
-    *,
-    db: DB,
+def _candidate_where(
     policy: AutoTrackPolicy,
-    dry_run: bool = False,
-) -> Tuple[int, List[int]]:
+    now: datetime,
+    *,
+    liquidity_floor: bool = True,
+    skip_tracked: bool = True,
+) -> Tuple[str, Dict[str, Any]]:
     """
-    Auto-select markets from markets and insert them into tracked_markets.
-
-    Returns:
-      (tracked_count, selected_market_ids)
-
-    Notes:
-    - token availability: we can only cheaply check for presence of token keys in raw_json
-      via JSONB operator '?'. This does NOT guarantee the token IDs are valid, but it prevents
-      the obvious "no tokens at all" situation.
+    WHERE clause (over `markets m LEFT JOIN tracked_markets tm`) for the policy's
+    selection filters.
     """
-    if policy.top_n <= 0:
-        return (0, [])
-
-    now = _now_utc()
     end_cutoff = None
     if policy.ends_within_hours is not None:
         end_cutoff = now + timedelta(hours=float(policy.ends_within_hours))
 
     where = []
-    params = {"now": now, "end_cutoff": end_cutoff, "category": policy.category}
+    params: Dict[str, Any] = {"now": now, "end_cutoff": end_cutoff, "category": policy.category}
 
     # Exclude ended markets by default
     if not policy.include_closed:
@@ -135,7 +142,7 @@ def auto_track_markets(
         where.append("(m.end_time IS NOT NULL AND m.end_time <= %(end_cutoff)s)")
 
     # numeric filters
-    if policy.min_liquidity is not None:
+    if liquidity_floor and policy.min_liquidity is not None:
         where.append("(m.liquidity_num IS NOT NULL AND m.liquidity_num >= %(min_liquidity)s)")
         params["min_liquidity"] = float(policy.min_liquidity)
 
@@ -150,26 +157,51 @@ def auto_track_markets(
     if policy.require_token_keys:
         where.append("((m.raw_json ? 'clobTokenIds') OR (m.raw_json ? 'clobTokenId'))")
 
-    # Join against tracked_markets so we can skip already tracked (default)
-    join_tm = "LEFT JOIN tracked_markets tm ON tm.market_id = m.market_id"
-    if not policy.include_already_tracked:
+    # Skip already tracked (default)
+    if skip_tracked and not policy.include_already_tracked:
         where.append("tm.market_id IS NULL")
 
-    where_sql = " AND ".join(where) if where else "TRUE"
+    return (" AND ".join(where) if where else "TRUE"), params
+
+
+# Rank by liquidity then volume then recency.
+# (This is a sane default “hot markets” heuristic.)
+_RANKED_CANDIDATES_SQL = """
+SELECT m.market_id, COALESCE(m.liquidity_num, 0) AS liquidity
+FROM markets m
+LEFT JOIN tracked_markets tm ON tm.market_id = m.market_id
+WHERE {where}
+ORDER BY
+  COALESCE(m.liquidity_num, 0) DESC,
+  COALESCE(m.volume_num, 0) DESC,
+  m.updated_at DESC
+LIMIT {limit}
+"""
+
+
+def auto_track_markets(
+    *,
+    db: DB,
+    policy: AutoTrackPolicy,
+    dry_run: bool = False,
+) -> Tuple[int, List[int]]:
+    """
+    Auto-select markets from markets and insert them into tracked_markets.
+
+    Returns:
+      (tracked_count, selected_market_ids)
 
-    # Rank by liquidity then volume then recency.
-    # (This is a sane default “hot markets” heuristic.)
-    select_sql = f"""
-    SELECT m.market_id
-    FROM markets m
-    {join_tm}
-    WHERE {where_sql}
-    ORDER BY
-      COALESCE(m.liquidity_num, 0) DESC,
-      COALESCE(m.volume_num, 0) DESC,
-      m.updated_at DESC
-    LIMIT {int(policy.top_n)}
+    Notes:
+    - token availability: we can only cheaply check for presence of token keys in raw_json
+      via JSONB operator '?'. This does NOT guarantee the token IDs are valid, but it prevents
+      the obvious "no tokens at all" situation.
     """
+    if policy.top_n <= 0:
+        return (0, [])
+
+    now = _now_utc()
+    where_sql, params = _candidate_where(policy, now)
+    select_sql = _RANKED_CANDIDATES_SQL.format(where=where_sql, limit=int(policy.top_n))
 
     with db.connection() as conn:
         with conn.cursor() as cur:
@@ -181,22 +213,199 @@ def auto_track_markets(
         return (0, market_ids)
 
     # Upsert selected markets into tracked_markets (attach policy.session)
-    ts = now
-    upsert_sql = """
-    INSERT INTO tracked_markets (market_id, sessions, ended, first_seen_at, last_seen_at)
-    VALUES (%s, ARRAY[%s], FALSE, %s, %s)
-    ON CONFLICT (market_id) DO UPDATE SET
-      sessions = (
-        SELECT ARRAY(SELECT DISTINCT unnest(tracked_markets.sessions || EXCLUDED.sessions))
-      ),
-      ended = FALSE,
-      last_seen_at = EXCLUDED.last_seen_at
+    n = _upsert_tracked(db, market_ids, policy.session, now)
+
+    return (n, market_ids)
+
+
+# -----------------------
+# Continuous re-ranking (auto-track --daemon)
+# -----------------------
+@dataclass(frozen=True)
+class Hysteresis:
     """
+    Entry and exit bands for re-ranking, so markets near the cut-off don't flap.
+
+    A market enters when it ranks within policy.top_n and clears policy.min_liquidity.
+    A tracked market stays until it ranks worse than `exit_rank` or its liquidity
+    drops below `exit_liquidity`. When the budget (top_n) is full, a newcomer only
+    replaces the weakest incumbent if its liquidity is `swap_margin` higher.
+    """
+    exit_rank: Optional[int] = None           # default: 2 * top_n
+    exit_liquidity: Optional[float] = None    # default: half of policy.min_liquidity
+    swap_margin: float = 0.2
+
+    def exit_rank_for(self, top_n: int) -> int:
+        return max(self.exit_rank if self.exit_rank is not None else 2 * top_n, top_n)
+
+
+@dataclass
+class RerankResult:
+    added: List[int] = field(default_factory=list)
+    demoted: List[int] = field(default_factory=list)
+    kept: List[int] = field(default_factory=list)
+
+    @property
+    def tracked(self) -> int:
+        return len(self.kept) + len(self.added)
+
+
+_SESSION_TRACKED_SQL = """
+SELECT market_id
+FROM tracked_markets
+WHERE ended = FALSE
+  AND %(session)s = ANY(sessions)
+"""
+
+# Drop the session tag; stop polling only when no other session still wants the
+# market. demoted_at (not ended_at) records that stop, so it can't be mistaken
+# for the market ending.
+_DEMOTE_SQL = """
+UPDATE tracked_markets
+SET sessions = array_remove(sessions, %(session)s),
+    ended = (cardinality(array_remove(sessions, %(session)s)) = 0),
+    demoted_at = CASE WHEN cardinality(array_remove(sessions, %(session)s)) = 0 THEN %(ts)s END,
+    last_seen_at = %(ts)s
+WHERE market_id = ANY(%(market_ids)s::bigint[])
+  AND %(session)s = ANY(sessions)
+"""
+
+
+def plan_rerank(
+    ranked: List[Tuple[int, float]],
+    incumbents: Set[int],
+    *,
+    top_n: int,
+    min_liquidity: Optional[float],
+    hysteresis: Hysteresis,
+) -> RerankResult:
+    """
+    Pure decision step. `ranked` is (market_id, liquidity) best-first, covering at
+    least the exit band; incumbents missing from it are demoted.
+    """
+    exit_rank = hysteresis.exit_rank_for(top_n)
+    exit_liq = hysteresis.exit_liquidity
+    if exit_liq is None and min_liquidity is not None:
+        exit_liq = 0.5 * float(min_liquidity)
+
+    liq = dict(ranked)
+    rank = {mid: i for i, (mid, _) in enumerate(ranked)}
+
+    kept = [
+        mid for mid, _ in ranked[:exit_rank]
+        if mid in incumbents and (exit_liq is None or liq[mid] >= exit_liq)
+    ]
+    # Budget: never hold more than top_n, even if the exit band is wider.
+    kept_set = set(kept)
+    demoted = [mid for mid in incumbents if mid not in kept_set] + kept[top_n:]
+    kept = kept[:top_n]
+
+    added: List[int] = []
+    for mid, l in ranked[:top_n]:
+        if mid in incumbents or (min_liquidity is not None and l < float(min_liquidity)):
+            continue
+        if len(kept) + len(added) < top_n:
+            added.append(mid)
+            continue
+        if not kept:
+            break
+        weakest = kept[-1]   # kept stays in rank order
+        if l > liq[weakest] * (1.0 + hysteresis.swap_margin):
+            kept.pop()
+            demoted.append(weakest)
+            added.append(mid)
+        else:
+            break   # ranked is best-first; nobody further down can win a swap either
+
+    return RerankResult(
+        added=added,
+        demoted=sorted(set(demoted), key=lambda m: rank.get(m, len(ranked))),
+        kept=kept,
+    )
+
+
+def rerank_tracked(
+    *,
+    db: DB,
+    policy: AutoTrackPolicy,
+    hysteresis: Hysteresis,
+    dry_run: bool = False,
+) -> RerankResult:
+    """
+    One re-ranking pass over the markets this policy's session owns: add new hot
+    markets, demote the ones that fell out of the exit band.
+    """
+    if policy.top_n <= 0:
+        return RerankResult()
+
+    now = _now_utc()
+    exit_rank = hysteresis.exit_rank_for(policy.top_n)
+    # Incumbents are judged against exit_liquidity, so don't pre-filter on the entry floor.
+    where_sql, params = _candidate_where(policy, now, liquidity_floor=False, skip_tracked=False)
 
     with db.connection() as conn:
         with conn.cursor() as cur:
-            for mid in market_ids:
-                cur.execute(upsert_sql, (mid, policy.session, ts, ts))
-        conn.commit()
-
-    return (len(market_ids), market_ids)
\ No newline at end of file
+            cur.execute(_RANKED_CANDIDATES_SQL.format(where=where_sql, limit=int(exit_rank)), params)
+            ranked = [(int(r["market_id"]), float(r["liquidity"])) for r in cur.fetchall()]
+            cur.execute(_SESSION_TRACKED_SQL, {"session": policy.session})
+            incumbents = {int(r["market_id"]) for r in cur.fetchall()}
+
+    res = plan_rerank(
+        ranked,
+        incumbents,
+        top_n=policy.top_n,
+        min_liquidity=policy.min_liquidity,
+        hysteresis=hysteresis,
+    )
+    if dry_run:
+        return res
+
+    if res.demoted:
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(_DEMOTE_SQL, {"session": policy.session, "ts": now, "market_ids": res.demoted})
+            conn.commit()
+    if res.added:
+        _upsert_tracked(db, res.added, policy.session, now)
+
+    return res
+
+
+def auto_track_loop(
+    *,
+    db: DB,
+    policy: AutoTrackPolicy,
+    hysteresis: Hysteresis,
+    interval_seconds: float,
+    iterations: int = 0,  # 0=forever
+    dry_run: bool = False,
+    max_backoff_seconds: float = 300.0,
+) -> None:
+    """
+    Re-rank every `interval_seconds`. A failed iteration (DB outage, lock
+    timeout) is logged and retried after an exponential backoff, capped at
+    `max_backoff_seconds`, instead of ending the daemon.
+    """
+    tag = "auto-track:daemon:dry-run" if dry_run else "auto-track:daemon"
+    interval = max(1.0, interval_seconds)
+    failures = 0
+    it = 0
+    while True:
+        it += 1
+        try:
+            res = rerank_tracked(db=db, policy=policy, hysteresis=hysteresis, dry_run=dry_run)
+        except Exception as e:
+            failures += 1
+            wait = min(max(interval, max_backoff_seconds), interval * (2 ** (failures - 1)))
+            print(f"[{tag}] iter={it} failed ({type(e).__name__}: {e}); retrying in {wait:.0f}s")
+        else:
+            failures = 0
+            wait = interval
+            print(
+                f"[{tag}] iter={it} session={policy.session} tracked={res.tracked} "
+                f"added={len(res.added)} demoted={len(res.demoted)} kept={len(res.kept)}"
+            )
+
+        if iterations > 0 and it >= iterations:
+            break
+        time.sleep(wait)
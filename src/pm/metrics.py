@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# Seconds; covers sub-ms parsing up to multi-second sweeps and DB stalls.
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v))
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+# -----------------------
+# Metric types (Prometheus text exposition format 0.0.4)
+# -----------------------
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, *labelvalues: str) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in sorted(self._values.items())]
+
+
+class FuncMetric:
+    """Counter or gauge whose value is read from a callable at scrape time (no cost per event)."""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float], kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.kind = kind
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {_fmt(self.fn())}"]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.bounds = sorted(buckets)
+        self._counts = [0] * (len(self.bounds) + 1)   # last = above the largest bound
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, v: float) -> None:
+        i = bisect.bisect_left(self.bounds, v)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += v
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        out = []
+        acc = 0
+        for b, c in zip(self.bounds + [float("inf")], counts):
+            acc += c
+            out.append(f'{self.name}_bucket{{le="{_fmt(b)}"}} {acc}')
+        out.append(f"{self.name}_sum {_fmt(total)}")
+        out.append(f"{self.name}_count {acc}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.samples())
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(registry: Registry, port: int, addr: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve GET /metrics from a daemon thread. Call .shutdown() on the result to stop."""
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    srv = ThreadingHTTPServer((addr, port), _Handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, name="pm-metrics", daemon=True).start()
+    return srv
+
+
+# -----------------------
+# Collector metrics
+# -----------------------
+class CollectorMetrics:
+    """
+    Everything collect-orderbooks exposes. Only built when --metrics-port is
+    set; with it off the collector skips every timing call.
+    """
+
+    def __init__(self, *, retries: Optional[Callable[[], float]] = None, universe: Optional[Callable[[], float]] = None):
+        self.registry = Registry()
+        r = self.registry.register
+        self.fetch = r(Histogram("pm_collect_fetch_seconds", "CLOB /book request latency, including retries"))
+        self.parse = r(Histogram("pm_collect_parse_seconds", "Book -> Snapshot parse time per token"))
+        self.features = r(Histogram("pm_collect_feature_seconds", "Feature computation time per snapshot"))
+        self.write = r(Histogram("pm_collect_write_seconds", "Snapshot + feature write time per batch"))
+        self.sweep = r(Histogram("pm_collect_sweep_seconds", "Wall time of one sweep over the universe"))
+        self.sample_age = r(
+            Histogram("pm_collect_sample_age_seconds", "now - ts_utc when a batch's write returns")
+        )
+        self.tokens = r(
+            Counter("pm_collect_tokens_total", "Tokens by outcome (fetched, inserted, empty, errored)", ("outcome",))
+        )
+        self.sweeps = r(Counter("pm_collect_sweeps_total", "Completed sweeps"))
+        if retries is not None:
+            r(FuncMetric("pm_clob_retries_total", "CLOB request retries", retries, kind="counter"))
+        if universe is not None:
+            r(FuncMetric("pm_collect_universe_tokens", "Tokens currently being collected", universe))
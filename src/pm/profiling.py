@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import contextlib
+import os
+import sys
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+
+# -----------------------
+# Stage timers
+# -----------------------
+class _Stage:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        times = _active
+        if times is not None:
+            times.add(self.name, time.perf_counter() - self.t0)
+
+
+class StageTimes:
+    """Calls, total and max wall time per stage name. Safe to feed from several threads."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._stats: Dict[str, List[float]] = {}   # name -> [calls, total, max]
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            s = self._stats.get(name)
+            if s is None:
+                self._stats[name] = [1, seconds, seconds]
+            else:
+                s[0] += 1
+                s[1] += seconds
+                if seconds > s[2]:
+                    s[2] = seconds
+
+    def table(self) -> str:
+        wall = time.perf_counter() - self.started
+        with self._lock:
+            rows = sorted(self._stats.items(), key=lambda kv: -kv[1][1])
+        width = max([len("stage")] + [len(k) for k, _ in rows])
+        lines = [
+            f"{'stage':<{width}} {'calls':>9} {'total_s':>10} {'mean_ms':>9} {'max_ms':>9} {'%wall':>6}",
+        ]
+        for name, (calls, total, mx) in rows:
+            lines.append(
+                f"{name:<{width}} {int(calls):>9} {total:>10.3f} {1000 * total / calls:>9.3f} "
+                f"{1000 * mx:>9.3f} {100 * total / wall if wall > 0 else 0:>6.1f}"
+            )
+        lines.append(f"{'wall':<{width}} {'':>9} {wall:>10.3f}")
+        return "\n".join(lines)
+
+
+_active: Optional[StageTimes] = None
+_OFF = contextlib.nullcontext()
+
+
+def stage(name: str):
+    """
+    `with stage("clob.http"): ...` adds the block's wall time to `name` while
+    `pm --profile` is on; otherwise it's a shared no-op context.
+    """
+    if _active is None:
+        return _OFF
+    return _Stage(name)
+
+
+def enabled() -> bool:
+    return _active is not None
+
+
+# -----------------------
+# Sampling profiler (folded stacks)
+# -----------------------
+class StackSampler:
+    """
+    Samples every thread's Python stack each `interval_s` and counts identical
+    stacks. write() emits the folded format ("frame;frame;frame count") read by
+    flamegraph.pl, speedscope and inferno. Pure Python; no extra dependencies.
+    """
+
+    def __init__(self, interval_s: float = 0.005):
+        self.interval_s = interval_s
+        self.samples = 0
+        self._counts: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._t = threading.Thread(target=self._run, name="pm-profile-sampler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._t.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._t.join()
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval_s):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                f = frame
+                while f is not None:
+                    co = f.f_code
+                    stack.append(f"{co.co_name} ({os.path.basename(co.co_filename)}:{co.co_firstlineno})")
+                    f = f.f_back
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(ident, str(ident)))
+                key = ";".join(reversed(stack))
+                self._counts[key] = self._counts.get(key, 0) + 1
+            self.samples += 1
+
+    def write(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as fh:
+            for key, n in sorted(self._counts.items()):
+                fh.write(f"{key} {n}\n")
+
+
+# -----------------------
+# Session
+# -----------------------
+@contextlib.contextmanager
+def session(
+    *,
+    cprofile_out: Optional[str] = None,
+    flame_out: Optional[str] = None,
+    interval_ms: float = 5.0,
+) -> Iterator[StageTimes]:
+    """
+    Turn stage timers on for the duration of the block and print the breakdown
+    to stderr on the way out (including Ctrl-C). Optionally run cProfile and/or
+    the stack sampler alongside and write their output.
+    """
+    global _active
+    times = StageTimes()
+    _active = times
+
+    prof = None
+    if cprofile_out:
+        import cProfile
+
+        prof = cProfile.Profile()
+    sampler = StackSampler(interval_ms / 1000.0).start() if flame_out else None
+    if prof is not None:
+        prof.enable()
+    try:
+        yield times
+    finally:
+        if prof is not None:
+            prof.disable()
+        if sampler is not None:
+            sampler.stop()
+        _active = None
+
+        print("[profile]\n" + times.table(), file=sys.stderr)
+        if prof is not None:
+            prof.dump_stats(cprofile_out)
+            print(f"[profile] cProfile -> {cprofile_out} (python -m pstats {cprofile_out})", file=sys.stderr)
+        if sampler is not None:
+            sampler.write(flame_out)
+            print(f"[profile] {sampler.samples} samples, folded stacks -> {flame_out}", file=sys.stderr)
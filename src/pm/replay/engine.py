@@ -0,0 +1,342 @@
+from __future__ import annotations
+
+import csv
+import heapq
+import io
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from pm.clob.collect_books import Snapshot, snapshot_from_book
+from pm.db import DB
+from pm.export.levels import _ensure_levels
+from pm.features.jobs import feature_row
+
+
+@dataclass(frozen=True)
+class ReplayRecord:
+    """One stored snapshot, before features are computed."""
+    ts: datetime
+    token_id: str
+    market_id: Optional[int]
+    end_time: Optional[datetime]
+    snapshot: Snapshot
+
+
+@dataclass(frozen=True)
+class ReplayEvent:
+    ts: datetime
+    token_id: str
+    market_id: Optional[int]
+    snapshot: Snapshot
+    features: Dict[str, Any]
+
+
+@dataclass
+class ReplayStats:
+    events: int = 0
+    tokens: int = 0
+    seconds: float = 0.0
+    first_ts: Optional[datetime] = None
+    last_ts: Optional[datetime] = None
+
+    @property
+    def events_per_sec(self) -> float:
+        return self.events / self.seconds if self.seconds > 0 else 0.0
+
+
+Subscriber = Callable[[ReplayEvent], None]
+
+
+# -----------------------
+# Sources: one time-ordered iterator per token
+# -----------------------
+_DB_TOKENS_SQL = """
+SELECT DISTINCT token_id
+FROM orderbook_snapshots
+WHERE {where}
+ORDER BY token_id
+"""
+
+_DB_STREAM_SQL = """
+SELECT s.token_id, s.market_id, s.ts_utc,
+       s.best_bid_price, s.best_bid_size, s.best_ask_price, s.best_ask_size,
+       s.bids_top_n_json, s.asks_top_n_json,
+       {raw_col}
+       m.end_time
+FROM orderbook_snapshots s
+LEFT JOIN markets m ON m.market_id = s.market_id
+WHERE s.token_id = %(token_id)s
+  {time_where}
+ORDER BY s.ts_utc
+"""
+
+
+def _time_where(start_ts: Optional[datetime], end_ts: Optional[datetime], col: str) -> str:
+    out = []
+    if start_ts is not None:
+        out.append(f"{col} >= %(start_ts)s")
+    if end_ts is not None:
+        out.append(f"{col} <= %(end_ts)s")
+    return "".join(f" AND {x}" for x in out)
+
+
+def _stored_snapshot(token_id: str, r: Dict[str, Any]) -> Snapshot:
+    return Snapshot(
+        token_id=token_id,
+        bids_top=_ensure_levels(r.get("bids_top_n_json")),
+        asks_top=_ensure_levels(r.get("asks_top_n_json")),
+        best_bid_price=r.get("best_bid_price"),
+        best_bid_size=r.get("best_bid_size"),
+        best_ask_price=r.get("best_ask_price"),
+        best_ask_size=r.get("best_ask_size"),
+        raw_book={},
+    )
+
+
+@contextmanager
+def db_streams(
+    db: DB,
+    *,
+    token_ids: Optional[List[str]] = None,
+    market_id: Optional[int] = None,
+    start_ts: Optional[datetime] = None,
+    end_ts: Optional[datetime] = None,
+    from_raw: bool = False,
+    top_n: int = 10,
+    itersize: int = 2000,
+) -> Iterator[List[Iterator[ReplayRecord]]]:
+    """
+    Open one server-side cursor stream per token, all on a single pooled
+    connection, for the duration of the `with` block:
+
+        with db_streams(db, market_id=...) as streams:
+            engine.run(streams)
+
+    With `from_raw`, snapshots are rebuilt from raw_book_json through
+    snapshot_from_book (exactly what the collector did); otherwise the stored
+    top-N levels are used.
+    """
+    params: Dict[str, Any] = {"start_ts": start_ts, "end_ts": end_ts, "market_id": market_id}
+
+    with db.connection() as conn:
+        if token_ids is None:
+            where = "TRUE" + _time_where(start_ts, end_ts, "ts_utc")
+            if market_id is not None:
+                where += " AND market_id = %(market_id)s"
+            with conn.cursor() as cur:
+                cur.execute(_DB_TOKENS_SQL.format(where=where), params)
+                token_ids = [str(r["token_id"]) for r in cur.fetchall()]
+
+        sql = _DB_STREAM_SQL.format(
+            raw_col="s.raw_book_json," if from_raw else "",
+            time_where=_time_where(start_ts, end_ts, "s.ts_utc"),
+        )
+
+        def _stream(k: int, tid: str) -> Iterator[ReplayRecord]:
+            with conn.cursor(name=f"pm_replay_{k}") as cur:
+                cur.itersize = itersize
+                cur.execute(sql, dict(params, token_id=tid))
+                for r in cur:
+                    if from_raw and isinstance(r.get("raw_book_json"), dict):
+                        snap = snapshot_from_book(tid, r["raw_book_json"], top_n=top_n)
+                    else:
+                        snap = _stored_snapshot(tid, r)
+                    mid = r.get("market_id")
+                    yield ReplayRecord(
+                        ts=r["ts_utc"],
+                        token_id=tid,
+                        market_id=int(mid) if mid is not None else None,
+                        end_time=r.get("end_time"),
+                        snapshot=snap,
+                    )
+
+        yield [_stream(k, tid) for k, tid in enumerate(token_ids)]
+        conn.commit()
+
+
+_CSV_COLUMNS = [
+    "token_id", "market_id", "ts_utc",
+    "best_bid_price", "best_bid_size", "best_ask_price", "best_ask_size",
+    "bids_top_n_json", "asks_top_n_json", "seconds_to_expiry",
+]
+
+
+def _csv_field(line: bytes, idx: int) -> str:
+    if idx == 0 and not line.startswith(b'"'):
+        return line.split(b",", 1)[0].decode("utf-8")
+    return next(csv.reader([line.decode("utf-8")]))[idx]
+
+
+def _csv_token_runs(
+    fh: BinaryIO, token_ids: Optional[List[str]]
+) -> Tuple[List[str], Dict[str, List[Tuple[int, int]]]]:
+    """
+    One pass over the raw lines: the header, and for every token its runs of
+    consecutive lines as (byte offset, line count). A `pm export` CSV is grouped
+    by token, so that is one run per token (one per partition with
+    --partition-by time).
+    """
+    header = next(csv.reader([fh.readline().decode("utf-8")]))
+    idx = header.index("token_id")
+    wanted = set(token_ids) if token_ids is not None else None
+
+    runs: Dict[str, List[Tuple[int, int]]] = {}
+    cur: Optional[str] = None
+    start = n = 0
+    off = fh.tell()
+    for line in iter(fh.readline, b""):
+        if line.strip():
+            tid = _csv_field(line, idx)
+            if tid != cur:
+                if cur is not None and (wanted is None or cur in wanted):
+                    runs.setdefault(cur, []).append((start, n))
+                cur, start, n = tid, off, 0
+            n += 1
+        off += len(line)
+    if cur is not None and (wanted is None or cur in wanted):
+        runs.setdefault(cur, []).append((start, n))
+    return header, runs
+
+
+@contextmanager
+def csv_streams(
+    path: str,
+    *,
+    token_ids: Optional[List[str]] = None,
+    market_id: Optional[int] = None,
+    start_ts: Optional[datetime] = None,
+    end_ts: Optional[datetime] = None,
+    chunk_rows: int = 2000,
+) -> Iterator[List[Iterator[ReplayRecord]]]:
+    """
+    Streams from a `pm export` CSV for the duration of the `with` block (same
+    shape as db_streams). A first pass indexes where each token's rows are; each
+    stream then reads its own rows `chunk_rows` at a time through one shared
+    file handle, so memory stays bounded by chunk size x tokens rather than the
+    file. end_time is recovered from seconds_to_expiry.
+    """
+    start = pd.Timestamp(start_ts) if start_ts is not None else None
+    end = pd.Timestamp(end_ts) if end_ts is not None else None
+
+    def _none(v: Any) -> Any:
+        return None if pd.isna(v) else v
+
+    with open(path, "rb") as fh:
+        header, runs = _csv_token_runs(fh, token_ids)
+
+        def _chunks(tid: str) -> Iterator[pd.DataFrame]:
+            for off, n in runs[tid]:
+                while n > 0:
+                    k = min(n, max(1, chunk_rows))
+                    fh.seek(off)
+                    lines = [fh.readline() for _ in range(k)]
+                    off = fh.tell()
+                    n -= k
+                    df = pd.read_csv(
+                        io.BytesIO(b"".join(lines)),
+                        header=None,
+                        names=header,
+                        usecols=lambda c: c in _CSV_COLUMNS,
+                        dtype={"token_id": str},
+                    )
+                    df["ts_utc"] = pd.to_datetime(df["ts_utc"], utc=True, format="ISO8601")
+                    if market_id is not None:
+                        df = df[df["market_id"] == market_id]
+                    if start is not None:
+                        df = df[df["ts_utc"] >= start]
+                    if end is not None:
+                        df = df[df["ts_utc"] <= end]
+                    yield df
+
+        def _stream(tid: str) -> Iterator[ReplayRecord]:
+            last: Optional[datetime] = None
+            for df in _chunks(tid):
+                for r in df.to_dict("records"):
+                    ts = r["ts_utc"].to_pydatetime()
+                    if last is not None and ts < last:
+                        raise ValueError(
+                            f"{path}: rows for token {tid} are not in ts_utc order; sort by token_id, ts_utc"
+                        )
+                    last = ts
+                    ste = _none(r.get("seconds_to_expiry"))
+                    mid = _none(r.get("market_id"))
+                    snap = Snapshot(
+                        token_id=tid,
+                        bids_top=_ensure_levels(_none(r.get("bids_top_n_json"))),
+                        asks_top=_ensure_levels(_none(r.get("asks_top_n_json"))),
+                        best_bid_price=_none(r.get("best_bid_price")),
+                        best_bid_size=_none(r.get("best_bid_size")),
+                        best_ask_price=_none(r.get("best_ask_price")),
+                        best_ask_size=_none(r.get("best_ask_size")),
+                        raw_book={},
+                    )
+                    yield ReplayRecord(
+                        ts=ts,
+                        token_id=tid,
+                        market_id=int(mid) if mid is not None else None,
+                        end_time=ts + timedelta(seconds=float(ste)) if ste is not None else None,
+                        snapshot=snap,
+                    )
+
+        yield [_stream(tid) for tid in sorted(runs)]
+
+
+# -----------------------
+# Engine
+# -----------------------
+@dataclass
+class ReplayEngine:
+    """
+    k-way merges per-token streams by (ts, token_id) on a heap and feeds each
+    snapshot through feature_row, the same function the collector uses.
+
+    speed: 0 replays as fast as possible; otherwise the simulated clock runs at
+    `speed` x real time (1.0 = original pacing).
+    """
+    speed: float = 0.0
+    progress_every: int = 0
+    subscribers: List[Subscriber] = field(default_factory=list)
+
+    def subscribe(self, fn: Subscriber) -> Subscriber:
+        self.subscribers.append(fn)
+        return fn
+
+    def run(self, streams: Iterable[Iterator[ReplayRecord]]) -> ReplayStats:
+        streams = list(streams)
+        stats = ReplayStats(tokens=len(streams))
+        merged = heapq.merge(*streams, key=lambda r: (r.ts, r.token_id))
+
+        wall0 = time.perf_counter()
+        for rec in merged:
+            if stats.first_ts is None:
+                stats.first_ts = rec.ts
+
+            if self.speed > 0:
+                due = (rec.ts - stats.first_ts).total_seconds() / self.speed
+                delay = due - (time.perf_counter() - wall0)
+                if delay > 0:
+                    time.sleep(delay)
+
+            ev = ReplayEvent(
+                ts=rec.ts,
+                token_id=rec.token_id,
+                market_id=rec.market_id,
+                snapshot=rec.snapshot,
+                features=feature_row(ts=rec.ts, snapshot=rec.snapshot, end_time=rec.end_time),
+            )
+            for fn in self.subscribers:
+                fn(ev)
+
+            stats.events += 1
+            stats.last_ts = rec.ts
+            if self.progress_every > 0 and stats.events % self.progress_every == 0:
+                el = time.perf_counter() - wall0
+                print(f"[replay] events={stats.events} sim_ts={rec.ts.isoformat()} events_per_sec={stats.events / el:.0f}")
+
+        stats.seconds = time.perf_counter() - wall0
+        return stats
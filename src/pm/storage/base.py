@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class StorageBackend(ABC):
+    """
+    Persistence used by ingest, tracking and collection.
+
+    Snapshot items are dicts of snapshot_statements kwargs:
+    {"market_id", "ts", "snapshot", "end_time"}, plus an optional precomputed
+    "features" (feature_row) so it is computed once per snapshot. Universe rows are
+    {"market_id", "ended", "end_time", "token_ids"}.
+    """
+
+    name: str = "abstract"
+
+    @property
+    @abstractmethod
+    def export_dsn(self) -> str:
+        """SQLAlchemy URL the export path reads from."""
+
+    @abstractmethod
+    def migrate(self) -> None:
+        ...
+
+    @abstractmethod
+    def upsert_markets(self, markets: List[Dict[str, Any]]) -> int:
+        ...
+
+    @abstractmethod
+    def track_markets(self, market_ids: List[int], session: str) -> int:
+        ...
+
+    @abstractmethod
+    def load_universe(self, since: Optional[datetime]) -> Tuple[datetime, List[Dict[str, Any]]]:
+        """
+        Tracked markets with their token ids. since=None returns every non-ended
+        market; otherwise every market (ended or not) whose tracking row or market
+        row changed after `since`. Returns (read_at, rows); read_at is the store's
+        clock at read time, the next `since`.
+        """
+
+    @abstractmethod
+    def flag_ended(self, market_ids: List[int], ts: datetime) -> int:
+        ...
+
+    @abstractmethod
+    def write_snapshots(self, items: List[Dict[str, Any]]) -> int:
+        """Write snapshots and their feature rows in one transaction."""
+
+    @abstractmethod
+    def upsert_latest(self, items: List[Dict[str, Any]]) -> int:
+        """Bring orderbook_latest up to date with a sweep's items; older rows never win."""
+
+    @abstractmethod
+    def notify_sweep(self, sweep: int, ts: datetime, token_ids: List[str]) -> int:
+        """Tell live subscribers a sweep's rows are committed. Returns notifications sent."""
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from pm.db import DB, run_migrations
+from pm.features.feed import notify_sweep
+from pm.features.jobs import insert_snapshots_and_features, upsert_latest
+from pm.gamma.ingest import upsert_markets
+from pm.jobs.track_markets import track_markets
+from pm.storage.base import StorageBackend
+
+
+_UNIVERSE_SQL = """
+SELECT
+  t.market_id,
+  t.ended,
+  m.end_time,
+  ARRAY(
+    SELECT jsonb_array_elements_text(
+             CASE
+               WHEN jsonb_typeof(m.raw_json->'clobTokenIds') = 'array'
+                 THEN m.raw_json->'clobTokenIds'
+               WHEN jsonb_typeof(m.raw_json->'clobTokenIds') = 'string'
+                 THEN (m.raw_json->>'clobTokenIds')::jsonb
+               ELSE '[]'::jsonb
+             END
+           )
+  ) AS token_ids
+FROM tracked_markets t
+JOIN markets m ON m.market_id = t.market_id
+WHERE {where}
+"""
+
+_FLAG_ENDED_SQL = """
+UPDATE tracked_markets
+SET ended = TRUE,
+    ended_at = COALESCE(ended_at, %(ts)s)
+WHERE market_id = ANY(%(market_ids)s::bigint[])
+  AND ended = FALSE
+"""
+
+
+class PostgresBackend(StorageBackend):
+    """The pooled Postgres database (pm.db.DB) and the existing SQL paths."""
+
+    name = "postgres"
+
+    def __init__(self, db: DB):
+        self.db = db
+
+    @property
+    def export_dsn(self) -> str:
+        return self.db.dsn
+
+    def migrate(self) -> None:
+        run_migrations(self.db, Path(__file__).resolve().parents[1] / "db" / "migrations")
+
+    def upsert_markets(self, markets: List[Dict[str, Any]]) -> int:
+        return upsert_markets(self.db, markets)
+
+    def track_markets(self, market_ids: List[int], session: str) -> int:
+        return track_markets(db=self.db, market_ids=market_ids, session=session)
+
+    def load_universe(self, since: Optional[datetime]) -> Tuple[datetime, List[Dict[str, Any]]]:
+        if since is None:
+            where, params = "t.ended = FALSE", {}
+        else:
+            # tracked_markets.changed_at is kept by a trigger (migration 007).
+            where, params = "(t.changed_at > %(since)s OR m.updated_at > %(since)s)", {"since": since}
+
+        with self.db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT now() AS ts")
+                read_at = cur.fetchone()["ts"]
+                cur.execute(_UNIVERSE_SQL.format(where=where), params)
+                rows = cur.fetchall()
+        return read_at, rows
+
+    def flag_ended(self, market_ids: List[int], ts: datetime) -> int:
+        with self.db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(_FLAG_ENDED_SQL, {"ts": ts, "market_ids": market_ids})
+                n = cur.rowcount
+            conn.commit()
+        return int(n)
+
+    def write_snapshots(self, items: List[Dict[str, Any]]) -> int:
+        return insert_snapshots_and_features(self.db, items)
+
+    def upsert_latest(self, items: List[Dict[str, Any]]) -> int:
+        return upsert_latest(self.db, items)
+
+    def notify_sweep(self, sweep: int, ts: datetime, token_ids: List[str]) -> int:
+        return notify_sweep(self.db, sweep=sweep, ts=ts, token_ids=token_ids)
+
+    def close(self) -> None:
+        self.db.close()
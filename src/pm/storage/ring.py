@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import mmap
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from pm.clob.collect_books import Snapshot
+
+
+# -----------------------
+# File layout
+# -----------------------
+# [header 64B][token directory: max_tokens x 96B][heads: max_tokens x u64][slots: max_tokens x depth records]
+#
+# Each token owns `depth` fixed-size slots used as a ring. heads[i] is the
+# sequence number of the token's newest record (0 = nothing written); record
+# `seq` lives in slot (seq - 1) % depth and carries its own seq field. The
+# writer zeroes a slot's seq, fills it, then stores seq and finally heads[i],
+# so a reader that sees the same seq before and after copying a slot got a
+# whole record (a seqlock, one writer per file).
+MAGIC = b"PMRING01"
+VERSION = 1
+TOKEN_BYTES = 96
+
+_HEADER = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u4"),
+        ("max_tokens", "<u4"),
+        ("depth", "<u4"),
+        ("levels", "<u4"),
+        ("n_tokens", "<u4"),
+        ("_pad", "V36"),
+    ]
+)
+
+
+def record_dtype(levels: int) -> np.dtype:
+    """One snapshot; bids/asks are [price, size] rows, NaN past n_bids/n_asks."""
+    return np.dtype(
+        [
+            ("seq", "<u8"),
+            ("ts_ns", "<i8"),
+            ("best_bid_price", "<f8"),
+            ("best_bid_size", "<f8"),
+            ("best_ask_price", "<f8"),
+            ("best_ask_size", "<f8"),
+            ("n_bids", "<u4"),
+            ("n_asks", "<u4"),
+            ("bids", "<f8", (levels, 2)),
+            ("asks", "<f8", (levels, 2)),
+        ]
+    )
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ONE_US = timedelta(microseconds=1)
+
+
+def _nan(x: Optional[float]) -> float:
+    return float("nan") if x is None else float(x)
+
+
+class _Layout:
+    def __init__(self, buf, max_tokens: int, depth: int, levels: int):
+        self.max_tokens = max_tokens
+        self.depth = depth
+        self.levels = levels
+        self.rec = record_dtype(levels)
+        off = _HEADER.itemsize
+        self.header = np.frombuffer(buf, dtype=_HEADER, count=1)
+        self.directory = np.frombuffer(buf, dtype=f"S{TOKEN_BYTES}", count=max_tokens, offset=off)
+        off += TOKEN_BYTES * max_tokens
+        self.heads = np.frombuffer(buf, dtype="<u8", count=max_tokens, offset=off)
+        off += 8 * max_tokens
+        self.slots = np.frombuffer(buf, dtype=self.rec, count=max_tokens * depth, offset=off).reshape(max_tokens, depth)
+
+    @staticmethod
+    def size(max_tokens: int, depth: int, levels: int) -> int:
+        return _HEADER.itemsize + (TOKEN_BYTES + 8) * max_tokens + record_dtype(levels).itemsize * max_tokens * depth
+
+
+def _read_geometry(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        with open(path, "rb") as f:
+            raw = f.read(_HEADER.itemsize)
+    except FileNotFoundError:
+        return None
+    if len(raw) < _HEADER.itemsize:
+        return None
+    h = np.frombuffer(raw, dtype=_HEADER, count=1)[0]
+    if h["magic"] != MAGIC or int(h["version"]) != VERSION:
+        return None
+    return int(h["max_tokens"]), int(h["depth"]), int(h["levels"])
+
+
+# -----------------------
+# Writer (collector side)
+# -----------------------
+class RingWriter:
+    """
+    Publishes every parsed Snapshot into a memory-mapped ring file, e.g. under
+    /dev/shm, for consumers on the same host. An existing file with the same
+    geometry is reattached (sequences continue); otherwise it is replaced.
+    """
+
+    def __init__(self, path: str, *, max_tokens: int = 4096, depth: int = 64, levels: int = 10):
+        self.path = path
+        if _read_geometry(path) != (max_tokens, depth, levels):
+            size = _Layout.size(max_tokens, depth, levels)
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                f.truncate(size)
+            hdr = np.zeros(1, dtype=_HEADER)
+            hdr["magic"], hdr["version"] = MAGIC, VERSION
+            hdr["max_tokens"], hdr["depth"], hdr["levels"] = max_tokens, depth, levels
+            with open(tmp, "r+b") as f:
+                f.write(hdr.tobytes())
+            os.replace(tmp, path)
+
+        self._f = open(path, "r+b")
+        self._mm = mmap.mmap(self._f.fileno(), 0)
+        self._l = _Layout(self._mm, max_tokens, depth, levels)
+        n = int(self._l.header["n_tokens"][0])
+        self._index: Dict[str, int] = {self._l.directory[i].decode("ascii"): i for i in range(n)}
+        self._warned_full = False
+        self.published = 0
+
+    def _slot_for(self, token_id: str) -> Optional[int]:
+        i = self._index.get(token_id)
+        if i is not None:
+            return i
+        n = len(self._index)
+        raw = token_id.encode("ascii")
+        if n >= self._l.max_tokens or len(raw) > TOKEN_BYTES:
+            if not self._warned_full:
+                print(f"[collect][ring] cannot add token {token_id} (max_tokens={self._l.max_tokens}); not publishing it")
+                self._warned_full = True
+            return None
+        self._l.directory[n] = raw
+        self._l.header["n_tokens"] = n + 1   # published after the name is in place
+        self._index[token_id] = n
+        return n
+
+    def publish(self, snapshot: Snapshot, ts: datetime) -> bool:
+        i = self._slot_for(snapshot.token_id)
+        if i is None:
+            return False
+        L = self._l.levels
+        seq = int(self._l.heads[i]) + 1
+        rec = self._l.slots[i, (seq - 1) % self._l.depth]   # structured scalar: writes go to the map
+        rec["seq"] = 0
+        rec["ts_ns"] = (ts - _EPOCH) // _ONE_US * 1000
+        rec["best_bid_price"] = _nan(snapshot.best_bid_price)
+        rec["best_bid_size"] = _nan(snapshot.best_bid_size)
+        rec["best_ask_price"] = _nan(snapshot.best_ask_price)
+        rec["best_ask_size"] = _nan(snapshot.best_ask_size)
+        for side, levels in (("bids", snapshot.bids_top), ("asks", snapshot.asks_top)):
+            arr = np.full((L, 2), np.nan)
+            k = min(L, len(levels))
+            if k:
+                arr[:k] = levels[:k]
+            rec[side] = arr
+            rec["n_" + side] = k
+        rec["seq"] = seq
+        self._l.heads[i] = seq
+        self.published += 1
+        return True
+
+    def close(self) -> None:
+        self._l = None   # drop views before unmapping
+        self._mm.close()
+        self._f.close()
+
+
+# -----------------------
+# Reader (consumer side)
+# -----------------------
+class RingReader:
+    """
+    Read-only view of a ring file written by RingWriter.
+
+    latest() returns a small ordered copy with torn slots removed; slots()
+    exposes a token's whole ring as a zero-copy NumPy view (order by `seq`, and
+    re-check `seq` after reading if the writer may be running).
+    """
+
+    def __init__(self, path: str):
+        geom = _read_geometry(path)
+        if geom is None:
+            raise ValueError(f"{path} is not a pm ring file")
+        self.path = path
+        self._f = open(path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._l = _Layout(self._mm, *geom)
+        self._index: Dict[str, int] = {}
+        self._tokens: List[str] = []
+
+    @property
+    def depth(self) -> int:
+        return self._l.depth
+
+    @property
+    def levels(self) -> int:
+        return self._l.levels
+
+    def token_ids(self) -> List[str]:
+        n = int(self._l.header["n_tokens"][0])
+        for i in range(len(self._tokens), n):
+            tid = self._l.directory[i].decode("ascii")
+            self._tokens.append(tid)
+            self._index[tid] = i
+        return list(self._tokens)
+
+    def _idx(self, token_id: str) -> Optional[int]:
+        i = self._index.get(token_id)
+        if i is None:
+            self.token_ids()
+            i = self._index.get(token_id)
+        return i
+
+    def head(self, token_id: str) -> int:
+        """Sequence number of the token's newest record (0 = none yet)."""
+        i = self._idx(token_id)
+        return 0 if i is None else int(self._l.heads[i])
+
+    def heads(self) -> np.ndarray:
+        """Copy of every token's head, aligned with token_ids()."""
+        n = len(self.token_ids())
+        return self._l.heads[:n].copy()
+
+    def changed(self, since: Optional[np.ndarray]) -> Tuple[np.ndarray, List[str]]:
+        """
+        Tokens whose head moved since a previous heads() result (None = all with
+        data). Returns (new heads, changed token ids); one vector compare.
+        """
+        now = self.heads()
+        if since is None:
+            mask = now > 0
+        else:
+            prev = np.zeros_like(now)
+            prev[: len(since)] = since[: len(now)]
+            mask = now != prev
+        toks = self._tokens
+        return now, [toks[i] for i in np.flatnonzero(mask)]
+
+    def slots(self, token_id: str) -> np.ndarray:
+        i = self._idx(token_id)
+        if i is None:
+            raise KeyError(token_id)
+        return self._l.slots[i]
+
+    def latest(self, token_id: str, n: int = 1) -> np.ndarray:
+        """Newest `n` complete records for a token, oldest first (copy)."""
+        i = self._idx(token_id)
+        if i is None:
+            return np.empty(0, dtype=self._l.rec)
+        head = int(self._l.heads[i])
+        n = min(max(0, n), head, self._l.depth)
+        seqs = np.arange(head - n + 1, head + 1, dtype=np.uint64)
+        pos = ((seqs - 1) % self._l.depth).astype(np.intp)
+        ring = self._l.slots[i]
+        out = ring[pos]
+        ok = (out["seq"] == seqs) & (ring["seq"][pos] == seqs)
+        return out if ok.all() else out[ok]
+
+    def close(self) -> None:
+        self._l = None
+        self._mm.close()
+        self._f.close()
@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from pm.clob.collect_books import Snapshot
+from pm.storage.base import StorageBackend
+
+
+# -----------------------
+# Record format: one compact JSON object per line
+# -----------------------
+def encode_record(item: Dict[str, Any]) -> bytes:
+    snap: Snapshot = item["snapshot"]
+    end_time: Optional[datetime] = item.get("end_time")
+    rec = {
+        "m": item.get("market_id"),
+        "ts": item["ts"].isoformat(),
+        "e": end_time.isoformat() if end_time is not None else None,
+        "t": snap.token_id,
+        "b": snap.bids_top,
+        "a": snap.asks_top,
+        "bp": snap.best_bid_price,
+        "bs": snap.best_bid_size,
+        "ap": snap.best_ask_price,
+        "as": snap.best_ask_size,
+        "r": snap.raw_book,
+    }
+    return json.dumps(rec, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def decode_record(line: bytes) -> Dict[str, Any]:
+    r = json.loads(line)
+    return {
+        "market_id": r["m"],
+        "ts": datetime.fromisoformat(r["ts"]),
+        "end_time": datetime.fromisoformat(r["e"]) if r["e"] else None,
+        "snapshot": Snapshot(
+            token_id=r["t"],
+            bids_top=r["b"],
+            asks_top=r["a"],
+            best_bid_price=r["bp"],
+            best_bid_size=r["bs"],
+            best_ask_price=r["ap"],
+            best_ask_size=r["as"],
+            raw_book=r["r"],
+        ),
+    }
+
+
+# -----------------------
+# Segment files + watermark
+# -----------------------
+class Spool:
+    """
+    Append-only directory of segment files (seg-000000000001.jsonl, ...).
+
+    append() writes a whole batch and fsyncs once (group commit). The active
+    segment is sealed when it grows past `segment_bytes` or when the loader asks
+    for it; only sealed segments are read. watermark.json records how far into
+    the oldest sealed segment has been loaded, and fully loaded segments are
+    deleted, so a restart never loads a record twice past the last watermark.
+    """
+
+    def __init__(self, path: str, *, segment_bytes: int = 64 * 1024 * 1024):
+        self.dir = Path(path)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self._f = None
+        self._active: Optional[Path] = None
+        # Anything left from a previous run is sealed; always start a fresh segment.
+        segs = self.sealed_segments()
+        self._seq = int(segs[-1].stem.split("-")[1]) if segs else 0
+
+    @property
+    def _watermark_path(self) -> Path:
+        return self.dir / "watermark.json"
+
+    def sealed_segments(self) -> List[Path]:
+        return sorted(p for p in self.dir.glob("seg-*.jsonl") if p != self._active)
+
+    def has_data(self) -> bool:
+        with self._lock:
+            active = self._f is not None and self._f.tell() > 0
+            return active or bool(self.sealed_segments())
+
+    def append(self, items: List[Dict[str, Any]]) -> int:
+        if not items:
+            return 0
+        buf = b"".join(encode_record(it) for it in items)
+        with self._lock:
+            if self._f is None:
+                self._seq += 1
+                self._active = self.dir / f"seg-{self._seq:012d}.jsonl"
+                self._f = open(self._active, "ab")
+            self._f.write(buf)
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            if self._f.tell() >= self.segment_bytes:
+                self._seal_locked()
+        return len(items)
+
+    def seal(self) -> None:
+        with self._lock:
+            self._seal_locked()
+
+    def _seal_locked(self) -> None:
+        if self._f is None:
+            return
+        self._f.close()
+        if self._active is not None and self._active.stat().st_size == 0:
+            self._active.unlink()
+        self._f = None
+        self._active = None
+
+    def close(self) -> None:
+        self.seal()
+
+    def read_watermark(self) -> Tuple[Optional[str], int]:
+        try:
+            wm = json.loads(self._watermark_path.read_text(encoding="utf-8"))
+            return wm.get("segment"), int(wm.get("offset") or 0)
+        except FileNotFoundError:
+            return None, 0
+
+    def write_watermark(self, segment: Optional[str], offset: int) -> None:
+        tmp = self._watermark_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"segment": segment, "offset": offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._watermark_path)
+
+    def blocks(self, seg: Path, start: int, block: int) -> Iterator[Tuple[int, List[bytes]]]:
+        """Yield (end_offset, lines) in blocks of up to `block` complete lines."""
+        with open(seg, "rb") as f:
+            f.seek(start)
+            lines: List[bytes] = []
+            pos = start
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Torn write from a crash: never acknowledged, drop it.
+                    print(f"[spool] dropping partial record at {seg.name}:{pos}")
+                    break
+                pos += len(line)
+                lines.append(line)
+                if len(lines) >= block:
+                    yield pos, lines
+                    lines = []
+            if lines:
+                yield pos, lines
+
+
+def drain_spool(backend: StorageBackend, spool: Spool, *, block: int = 500, seal: bool = True) -> int:
+    """
+    Load every sealed segment into the DB, oldest first, advancing the watermark
+    after each committed block. Inserts are idempotent (snapshots DO NOTHING,
+    features upsert), so a crash between commit and watermark is harmless.
+    Raises on DB errors; progress up to the failure is kept.
+    """
+    if seal:
+        spool.seal()
+
+    loaded = 0
+    for seg in spool.sealed_segments():
+        wm_seg, wm_off = spool.read_watermark()
+        start = wm_off if wm_seg == seg.name else 0
+        for end, lines in spool.blocks(seg, start, block):
+            loaded += backend.write_snapshots([decode_record(x) for x in lines])
+            spool.write_watermark(seg.name, end)
+        seg.unlink()
+        spool.write_watermark(None, 0)
+    return loaded
+
+
+# -----------------------
+# Collector sink
+# -----------------------
+T = TypeVar("T")
+
+
+class SpoolingSink:
+    """
+    Collector write path that never blocks sampling on the DB for longer than
+    `slow_seconds`.
+
+    Every DB call from the sampling thread (batch writes via write(), anything
+    else via call()) runs on a single DB worker thread, and the caller waits at
+    most `slow_seconds` for it. A call that fails or runs past that puts the
+    sink in degraded mode for `cooldown_seconds`; the sink also stays degraded
+    while an abandoned call is still running, so nothing queues behind it.
+    While degraded, batches are appended to the spool instead and a background
+    thread drains it once the sink is healthy again. A batch whose write timed
+    out is spooled as well and may still commit later: rows are keyed by
+    (token_id, ts_utc), so loading it twice is harmless.
+    """
+
+    def __init__(
+        self,
+        backend: StorageBackend,
+        spool: Spool,
+        *,
+        slow_seconds: float = 2.0,
+        cooldown_seconds: float = 30.0,
+        replay_interval: float = 5.0,
+        block: int = 500,
+    ):
+        self.backend = backend
+        self.spool = spool
+        self.slow_seconds = slow_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.replay_interval = replay_interval
+        self.block = block
+        self.spooled = 0
+        self.replayed = 0
+        self._degraded_until = 0.0
+        self._db = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pm-spool-db")
+        self._inflight: Optional[Future] = None
+        self._stop = threading.Event()
+        self._t = threading.Thread(target=self._run, name="pm-spool-replayer", daemon=True)
+        self._t.start()
+
+    @property
+    def healthy(self) -> bool:
+        if self._inflight is not None and not self._inflight.done():
+            return False
+        return time.monotonic() >= self._degraded_until
+
+    def _degrade(self, why: str) -> None:
+        if time.monotonic() >= self._degraded_until:
+            print(f"[collect][spool] {why}; spooling locally for {self.cooldown_seconds:.0f}s")
+        self._degraded_until = time.monotonic() + self.cooldown_seconds
+
+    def call(self, fn: Callable[..., T], *args: Any, what: str = "DB call") -> T:
+        """
+        Run fn(*args) on the DB worker and wait up to `slow_seconds` for it.
+        Raises the call's own error, or TimeoutError if it is still running;
+        either way the sink is degraded first.
+        """
+        fut = self._db.submit(fn, *args)
+        self._inflight = fut
+        try:
+            return fut.result(timeout=self.slow_seconds)
+        except FutureTimeout:
+            self._degrade(f"{what} still running after {self.slow_seconds:.1f}s")
+            raise TimeoutError(f"{what} exceeded {self.slow_seconds:.1f}s") from None
+        except Exception as e:
+            self._degrade(f"{what} failed ({type(e).__name__}: {e})")
+            raise
+
+    def write(self, items: List[Dict[str, Any]]) -> int:
+        if not items:
+            return 0
+        if self.healthy:
+            try:
+                return self.call(self.backend.write_snapshots, items, what="DB write")
+            except Exception:
+                pass  # degraded by call(); spool the batch below
+
+        self.spooled += self.spool.append(items)
+        return len(items)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.replay_interval):
+            if not self.healthy or not self.spool.has_data():
+                continue
+            try:
+                n = drain_spool(self.backend, self.spool, block=self.block)
+            except Exception as e:
+                self._degrade(f"spool replay failed ({type(e).__name__}: {e})")
+                continue
+            if n:
+                self.replayed += n
+                print(f"[collect][spool] replayed={n} total_replayed={self.replayed}")
+
+    def close(self) -> None:
+        self._stop.set()
+        self._t.join()
+        self._db.shutdown(wait=True)
+        if self.spool.has_data():
+            try:
+                self.replayed += drain_spool(self.backend, self.spool, block=self.block)
+            except Exception as e:
+                print(f"[collect][spool] data left in {self.spool.dir} ({e}); load it with `pm spool-load`")
+        self.spool.close()
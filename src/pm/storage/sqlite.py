@@ -0,0 +1,439 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pm.features.jobs import LATEST_FEATURE_COLUMNS, feature_row, latest_items
+from pm.gamma.ingest import _should_store, normalize_market
+from pm.storage.base import StorageBackend
+
+
+# Timestamps are stored as fixed-width UTC text, so string order is time order
+# and the export SQL's range filters work unchanged.
+_TS_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def _ts(dt: Optional[datetime]) -> Optional[str]:
+    if dt is None:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.strftime(_TS_FORMAT)
+
+
+def _parse_ts(s: Optional[str]) -> Optional[datetime]:
+    if not s:
+        return None
+    return datetime.strptime(s, _TS_FORMAT).replace(tzinfo=timezone.utc)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS markets (
+  market_id        INTEGER PRIMARY KEY,
+  event_id         INTEGER,
+  slug             TEXT,
+  question         TEXT,
+  condition_id     TEXT,
+  end_time         TEXT,
+  is_closed        INTEGER,
+  is_resolved      INTEGER,
+  is_active        INTEGER,
+  category         TEXT,
+  volume_num       REAL,
+  liquidity_num    REAL,
+  updated_at       TEXT NOT NULL,
+  raw_json         TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS tracked_markets (
+  market_id      INTEGER PRIMARY KEY REFERENCES markets(market_id) ON DELETE CASCADE,
+  sessions       TEXT NOT NULL DEFAULT '[]',
+  ended          INTEGER NOT NULL DEFAULT 0,
+  first_seen_at  TEXT NOT NULL,
+  last_seen_at   TEXT NOT NULL,
+  ended_at       TEXT,
+  changed_at     TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS orderbook_snapshots (
+  token_id          TEXT NOT NULL,
+  market_id         INTEGER,
+  ts_utc            TEXT NOT NULL,
+  best_bid_price    REAL,
+  best_bid_size     REAL,
+  best_ask_price    REAL,
+  best_ask_size     REAL,
+  bids_top_n_json   TEXT,
+  asks_top_n_json   TEXT,
+  raw_book_json     TEXT,
+  inserted_at       TEXT NOT NULL,
+  PRIMARY KEY (token_id, ts_utc)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS features_orderbook (
+  token_id             TEXT NOT NULL,
+  market_id            INTEGER,
+  ts_utc               TEXT NOT NULL,
+  spread               REAL,
+  mid                  REAL,
+  microprice           REAL,
+  imbalance_l1         REAL,
+  bid_depth_top_n      REAL,
+  ask_depth_top_n      REAL,
+  depth_bid_top5       REAL,
+  depth_ask_top5       REAL,
+  imbalance_top5       REAL,
+  seconds_to_expiry    REAL,
+  hours_to_expiry      REAL,
+  extra_features_json  TEXT,
+  inserted_at          TEXT NOT NULL,
+  PRIMARY KEY (token_id, ts_utc)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS orderbook_latest (
+  token_id             TEXT PRIMARY KEY,
+  market_id            INTEGER,
+  ts_utc               TEXT NOT NULL,
+  best_bid_price       REAL,
+  best_bid_size        REAL,
+  best_ask_price       REAL,
+  best_ask_size        REAL,
+  bids_top_n_json      TEXT,
+  asks_top_n_json      TEXT,
+  spread               REAL,
+  mid                  REAL,
+  microprice           REAL,
+  imbalance_l1         REAL,
+  bid_depth_top_n      REAL,
+  ask_depth_top_n      REAL,
+  depth_bid_top5       REAL,
+  depth_ask_top5       REAL,
+  imbalance_top5       REAL,
+  seconds_to_expiry    REAL,
+  hours_to_expiry      REAL,
+  extra_features_json  TEXT,
+  updated_at           TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_obs_market_ts ON orderbook_snapshots (market_id, ts_utc);
+CREATE INDEX IF NOT EXISTS idx_tracked_markets_changed_at ON tracked_markets (changed_at);
+"""
+
+_UPSERT_MARKET_SQL = """
+INSERT INTO markets (
+  market_id, event_id, slug, question, condition_id, end_time,
+  is_closed, is_resolved, is_active, category, volume_num, liquidity_num,
+  updated_at, raw_json
+)
+VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+ON CONFLICT (market_id) DO UPDATE SET
+  event_id      = excluded.event_id,
+  slug          = excluded.slug,
+  question      = excluded.question,
+  condition_id  = excluded.condition_id,
+  end_time      = excluded.end_time,
+  is_closed     = excluded.is_closed,
+  is_resolved   = excluded.is_resolved,
+  is_active     = excluded.is_active,
+  category      = excluded.category,
+  volume_num    = excluded.volume_num,
+  liquidity_num = excluded.liquidity_num,
+  updated_at    = excluded.updated_at,
+  raw_json      = excluded.raw_json
+"""
+
+_TRACK_SQL = """
+INSERT INTO tracked_markets (market_id, sessions, ended, first_seen_at, last_seen_at, changed_at)
+VALUES (?, ?, 0, ?, ?, ?)
+ON CONFLICT (market_id) DO UPDATE SET
+  sessions = excluded.sessions,
+  ended = 0,
+  last_seen_at = excluded.last_seen_at,
+  changed_at = excluded.changed_at
+"""
+
+_SNAPSHOT_SQL = """
+INSERT OR IGNORE INTO orderbook_snapshots (
+  token_id, market_id, ts_utc,
+  best_bid_price, best_bid_size, best_ask_price, best_ask_size,
+  bids_top_n_json, asks_top_n_json, raw_book_json, inserted_at
+)
+VALUES (?,?,?,?,?,?,?,?,?,?,?)
+"""
+
+_FEATURE_SQL = """
+INSERT INTO features_orderbook (
+  token_id, market_id, ts_utc,
+  spread, mid, microprice, imbalance_l1,
+  bid_depth_top_n, ask_depth_top_n,
+  depth_bid_top5, depth_ask_top5, imbalance_top5,
+  seconds_to_expiry, hours_to_expiry,
+  extra_features_json, inserted_at
+)
+VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+ON CONFLICT (token_id, ts_utc) DO UPDATE SET
+  market_id           = excluded.market_id,
+  spread              = excluded.spread,
+  mid                 = excluded.mid,
+  microprice          = excluded.microprice,
+  imbalance_l1        = excluded.imbalance_l1,
+  bid_depth_top_n     = excluded.bid_depth_top_n,
+  ask_depth_top_n     = excluded.ask_depth_top_n,
+  depth_bid_top5      = excluded.depth_bid_top5,
+  depth_ask_top5      = excluded.depth_ask_top5,
+  imbalance_top5      = excluded.imbalance_top5,
+  seconds_to_expiry   = excluded.seconds_to_expiry,
+  hours_to_expiry     = excluded.hours_to_expiry,
+  extra_features_json = excluded.extra_features_json,
+  inserted_at         = excluded.inserted_at
+"""
+
+_LATEST_SQL = """
+INSERT INTO orderbook_latest (
+  token_id, market_id, ts_utc,
+  best_bid_price, best_bid_size, best_ask_price, best_ask_size,
+  bids_top_n_json, asks_top_n_json,
+  spread, mid, microprice, imbalance_l1,
+  bid_depth_top_n, ask_depth_top_n,
+  depth_bid_top5, depth_ask_top5, imbalance_top5,
+  seconds_to_expiry, hours_to_expiry, extra_features_json, updated_at
+)
+VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+ON CONFLICT (token_id) DO UPDATE SET
+  market_id           = excluded.market_id,
+  ts_utc              = excluded.ts_utc,
+  best_bid_price      = excluded.best_bid_price,
+  best_bid_size       = excluded.best_bid_size,
+  best_ask_price      = excluded.best_ask_price,
+  best_ask_size       = excluded.best_ask_size,
+  bids_top_n_json     = excluded.bids_top_n_json,
+  asks_top_n_json     = excluded.asks_top_n_json,
+  spread              = excluded.spread,
+  mid                 = excluded.mid,
+  microprice          = excluded.microprice,
+  imbalance_l1        = excluded.imbalance_l1,
+  bid_depth_top_n     = excluded.bid_depth_top_n,
+  ask_depth_top_n     = excluded.ask_depth_top_n,
+  depth_bid_top5      = excluded.depth_bid_top5,
+  depth_ask_top5      = excluded.depth_ask_top5,
+  imbalance_top5      = excluded.imbalance_top5,
+  seconds_to_expiry   = excluded.seconds_to_expiry,
+  hours_to_expiry     = excluded.hours_to_expiry,
+  extra_features_json = excluded.extra_features_json,
+  updated_at          = excluded.updated_at
+WHERE orderbook_latest.ts_utc <= excluded.ts_utc
+"""
+
+
+def _token_ids(raw_json: str) -> List[str]:
+    try:
+        v = json.loads(raw_json).get("clobTokenIds")
+        if isinstance(v, str):
+            v = json.loads(v)
+    except Exception:
+        return []
+    return [str(t) for t in v] if isinstance(v, list) else []
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Embedded single-file store with the same tables as Postgres (JSON as TEXT,
+    timestamps as fixed-width UTC text). Tuned for appends: WAL journal,
+    synchronous=NORMAL, and one transaction per write_snapshots batch.
+    One connection is shared behind a lock (collector, flagger and spool threads).
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+
+        # 0 is a file no migrate() has touched yet; anything else was written by
+        # this backend. Older files are upgraded now, newer ones refused.
+        version = self._schema_version()
+        if version > SCHEMA_VERSION:
+            self._conn.close()
+            raise RuntimeError(
+                f"{path} has SQLite schema version {version}; this pm supports up to {SCHEMA_VERSION}. "
+                "Upgrade pm to open it."
+            )
+        if 0 < version < SCHEMA_VERSION:
+            self.migrate()
+
+    @property
+    def export_dsn(self) -> str:
+        return f"sqlite:///{self.path}"
+
+    def _tx(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return out
+
+    def _schema_version(self) -> int:
+        return int(self._conn.execute("PRAGMA user_version").fetchone()[0])
+
+    def migrate(self) -> None:
+        with self._lock:
+            if self._schema_version() == SCHEMA_VERSION:
+                return
+            # Every version so far only added tables (v2: orderbook_latest), which
+            # the IF NOT EXISTS schema script creates. A change to an existing
+            # table needs its own step here, keyed on the stored version.
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def upsert_markets(self, markets: List[Dict[str, Any]]) -> int:
+        ts = _now()
+        rows = []
+        for m in markets:
+            nm = normalize_market(m)
+            if not _should_store(nm, ts):
+                continue
+            rows.append(
+                (
+                    nm["market_id"], nm["event_id"], nm["slug"], nm["question"], nm["condition_id"],
+                    _ts(nm["end_time"]), nm["is_closed"], nm["is_resolved"], nm["is_active"],
+                    nm["category"], nm["volume_num"], nm["liquidity_num"],
+                    _ts(ts), json.dumps(m),
+                )
+            )
+        self._tx(lambda c: c.executemany(_UPSERT_MARKET_SQL, rows))
+        return len(rows)
+
+    def track_markets(self, market_ids: List[int], session: str) -> int:
+        if not market_ids:
+            return 0
+        ts = _ts(_now())
+        ids = sorted({int(m) for m in market_ids})
+
+        def _do(c: sqlite3.Connection) -> int:
+            marks = ",".join("?" * len(ids))
+            have = {
+                mid: json.loads(s)
+                for mid, s in c.execute(f"SELECT market_id, sessions FROM tracked_markets WHERE market_id IN ({marks})", ids)
+            }
+            rows = []
+            for mid in ids:
+                sessions = have.get(mid, [])
+                if session not in sessions:
+                    sessions = sessions + [session]
+                rows.append((mid, json.dumps(sessions), ts, ts, ts))
+            c.executemany(_TRACK_SQL, rows)
+            return len(rows)
+
+        return self._tx(_do)
+
+    def load_universe(self, since: Optional[datetime]) -> Tuple[datetime, List[Dict[str, Any]]]:
+        read_at = _now()
+        sql = """
+        SELECT t.market_id, t.ended, m.end_time, m.raw_json
+        FROM tracked_markets t
+        JOIN markets m ON m.market_id = t.market_id
+        """
+        if since is None:
+            args: tuple = ()
+            sql += " WHERE t.ended = 0"
+        else:
+            args = (_ts(since), _ts(since))
+            sql += " WHERE t.changed_at > ? OR m.updated_at > ?"
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return read_at, [
+            {"market_id": mid, "ended": bool(ended), "end_time": _parse_ts(end), "token_ids": _token_ids(raw)}
+            for mid, ended, end, raw in rows
+        ]
+
+    def flag_ended(self, market_ids: List[int], ts: datetime) -> int:
+        if not market_ids:
+            return 0
+        ids = [int(m) for m in market_ids]
+        marks = ",".join("?" * len(ids))
+        sql = f"""
+        UPDATE tracked_markets
+        SET ended = 1, ended_at = COALESCE(ended_at, ?), changed_at = ?
+        WHERE market_id IN ({marks}) AND ended = 0
+        """
+        return self._tx(lambda c: c.execute(sql, [_ts(ts), _ts(ts)] + ids).rowcount)
+
+    def write_snapshots(self, items: List[Dict[str, Any]]) -> int:
+        if not items:
+            return 0
+        now = _ts(_now())
+        snaps = []
+        feats = []
+        for it in items:
+            s = it["snapshot"]
+            ts = _ts(it["ts"])
+            f = it.get("features") or feature_row(ts=it["ts"], snapshot=s, end_time=it.get("end_time"))
+            snaps.append(
+                (
+                    s.token_id, it.get("market_id"), ts,
+                    s.best_bid_price, s.best_bid_size, s.best_ask_price, s.best_ask_size,
+                    json.dumps(s.bids_top), json.dumps(s.asks_top), json.dumps(s.raw_book), now,
+                )
+            )
+            feats.append(
+                (
+                    s.token_id, it.get("market_id"), ts,
+                    f["spread"], f["mid"], f["microprice"], f["imbalance_l1"],
+                    f["bid_depth_top_n"], f["ask_depth_top_n"],
+                    f["depth_bid_top5"], f["depth_ask_top5"], f["imbalance_top5"],
+                    f["seconds_to_expiry"], f["hours_to_expiry"],
+                    json.dumps(f["extra_features_json"]), now,
+                )
+            )
+
+        def _do(c: sqlite3.Connection) -> int:
+            c.executemany(_SNAPSHOT_SQL, snaps)
+            c.executemany(_FEATURE_SQL, feats)
+            return len(items)
+
+        return self._tx(_do)
+
+    def upsert_latest(self, items: List[Dict[str, Any]]) -> int:
+        now = _ts(_now())
+        rows = []
+        for it in latest_items(items):
+            s = it["snapshot"]
+            f = it["features"]
+            rows.append(
+                (
+                    s.token_id, it.get("market_id"), _ts(it["ts"]),
+                    s.best_bid_price, s.best_bid_size, s.best_ask_price, s.best_ask_size,
+                    json.dumps(s.bids_top), json.dumps(s.asks_top),
+                    *(f[c] for c in LATEST_FEATURE_COLUMNS),
+                    json.dumps(f["extra_features_json"]), now,
+                )
+            )
+        if not rows:
+            return 0
+        self._tx(lambda c: c.executemany(_LATEST_SQL, rows))
+        return len(rows)
+
+    def notify_sweep(self, sweep: int, ts: datetime, token_ids: List[str]) -> int:
+        return 0   # no server to fan out from; readers poll the file
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()